@@ -0,0 +1,39 @@
+# Generated by Django 6.0 on 2026-10-18 11:59
+
+from django.db import migrations, models
+
+from core.normalize import refill_search_keys
+
+
+def backfill_keys(apps, schema_editor):
+    refill_search_keys(apps.get_model('accounts', 'CustomUser'), {
+        'username_key': ('username',),
+        'name_key': ('first_name', 'last_name'),
+        'bio_key': ('bio',),
+    })
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0003_customuser_profile_image_variants'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customuser',
+            name='bio_key',
+            field=models.TextField(blank=True, default='', editable=False),
+        ),
+        migrations.AddField(
+            model_name='customuser',
+            name='name_key',
+            field=models.TextField(blank=True, default='', editable=False),
+        ),
+        migrations.AddField(
+            model_name='customuser',
+            name='username_key',
+            field=models.TextField(blank=True, default='', editable=False),
+        ),
+        migrations.RunPython(backfill_keys, migrations.RunPython.noop),
+    ]
@@ -1,10 +1,12 @@
 
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth.models import AbstractUser
 from django.utils import timezone
 from django.db.models.signals import post_save
 from django.dispatch import receiver
 
+from core.normalize import fill_search_keys
+
 class CustomUser(AbstractUser):
     bio = models.TextField(max_length=500, blank=True, default='')
     location = models.CharField(max_length=100, blank=True, default='')
@@ -12,10 +14,22 @@ class CustomUser(AbstractUser):
     birth_date = models.DateField(null=True, blank=True)
     profile_image = models.ImageField(upload_to='profile_pics/', default='profile_pics/default.png')
     cover_image = models.ImageField(upload_to='cover_pics/', default='cover_pics/default.png')
+    # النسخ المصغرة المولّدة من profile_image (انظر core.images)
+    profile_image_variants = models.JSONField(default=dict, blank=True, editable=False)
     followers_count = models.IntegerField(default=0)
     following_count = models.IntegerField(default=0)
     is_private = models.BooleanField(default=False)
     created_at = models.DateTimeField(default=timezone.now)
+    # مفاتيح البحث الموحّدة (انظر core.normalize) يفهرسها core.fulltext
+    username_key = models.TextField(blank=True, default='', editable=False)
+    name_key = models.TextField(blank=True, default='', editable=False)
+    bio_key = models.TextField(blank=True, default='', editable=False)
+    
+    SEARCH_KEYS = {
+        'username_key': ('username',),
+        'name_key': ('first_name', 'last_name'),
+        'bio_key': ('bio',),
+    }
     
     def __str__(self):
         return self.username
@@ -30,8 +44,11 @@ class CustomUser(AbstractUser):
             return settings
     
     def save(self, *args, **kwargs):
+        kwargs['update_fields'] = fill_search_keys(self, kwargs.get('update_fields'))
         # تأكد من وجود الإعدادات عند حفظ المستخدم
-        super().save(*args, **kwargs)
+        # (في معاملة: قفل ملفات الوسائط يبقى حتى زيادة عدّاداتها، انظر core.storage)
+        with transaction.atomic(savepoint=False):
+            super().save(*args, **kwargs)
         if not hasattr(self, 'user_settings'):
             UserSettings.objects.create(user=self)
     @property
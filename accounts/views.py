@@ -5,8 +5,10 @@ from django.contrib.auth import update_session_auth_hash, logout as auth_logout
 from django.contrib.auth.forms import PasswordChangeForm, UserCreationForm
 from django.db.models import Count  # أضف هذا السطر
 from .models import CustomUser
+from posts import counters
 from posts.models import Post, Like
 from friends.models import Follow
+from core.replica import use_replica
 from .forms import CustomUserCreationForm
 from django.contrib.auth import authenticate, login
 
@@ -43,6 +45,7 @@ def logout_view(request):
         auth_logout(request)
     return redirect('home')
 
+@use_replica
 @login_required
 def profile_view(request, username=None):
     """عرض الملف الشخصي"""
@@ -68,7 +71,10 @@ def profile_view(request, username=None):
     }
     
     # الحصول على المنشورات المعجبة بها
-    liked_posts = Post.objects.filter(post_likes__user=user).distinct().order_by('-post_likes__created_at')[:10]
+    liked_posts = list(Post.objects.filter(post_likes__user=user).distinct().order_by('-post_likes__created_at')[:10])
+    posts = list(posts)
+    # إضافة تغييرات العدّادات التي لم تُدمج بعد
+    counters.merge_pending(posts + liked_posts)
     
     return render(request, 'accounts/profile.html', {
         'profile_user': user,
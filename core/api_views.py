@@ -1,18 +1,31 @@
-from rest_framework import viewsets, permissions, status, generics, filters
+import hashlib
+
+from rest_framework import viewsets, mixins, permissions, status, generics, filters
 from rest_framework.decorators import action, api_view, permission_classes
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from rest_framework.authtoken.models import Token
 from rest_framework.authtoken.views import ObtainAuthToken
 from rest_framework.authentication import TokenAuthentication
+from rest_framework.exceptions import NotFound
+from rest_framework.utils.urls import replace_query_param
 from django.contrib.auth import authenticate, login, logout
 from django.db.models import Q, Count
 from django.shortcuts import get_object_or_404
 from django_filters.rest_framework import DjangoFilterBackend
 
 from accounts.models import CustomUser
-from posts.models import Post, Comment, Like
+from posts import counters, uploads
+from posts.models import Post, Comment, Like, UploadSession
+from friends.counters import update_follow_counts
 from friends.models import Friendship, Follow
+from posts.threads import COMMENT_REPLY_DEPTH, fetch_thread
+from posts.timeline import HomeTimeline, timeline_version
+from posts.trending import DEFAULT_WINDOW, WINDOWS, trending
+from . import fulltext
+from .pagination import KeysetPagination
+from .querybudget import query_budget
+from .replica import replica_generation, use_replica
 from .serializers import *
 
 # Authentication Views
@@ -75,7 +88,7 @@ def current_user_api(request):
 
 # User ViewSet
 class UserViewSet(viewsets.ModelViewSet):
-    queryset = CustomUser.objects.all()
+    queryset = CustomUser.objects.select_related('user_settings')
     serializer_class = UserSerializer
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
     filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
@@ -104,16 +117,8 @@ class UserViewSet(viewsets.ModelViewSet):
         
         if not created:
             follow.delete()
-            request.user.following_count -= 1
-            user_to_follow.followers_count -= 1
-            followed = False
-        else:
-            request.user.following_count += 1
-            user_to_follow.followers_count += 1
-            followed = True
-        
-        request.user.save()
-        user_to_follow.save()
+        followed = created
+        update_follow_counts(request.user, user_to_follow, 1 if followed else -1)
         
         return Response({
             'followed': followed,
@@ -124,34 +129,37 @@ class UserViewSet(viewsets.ModelViewSet):
     @action(detail=True, methods=['get'])
     def followers(self, request, pk=None):
         user = self.get_object()
-        followers = Follow.objects.filter(following=user).select_related('follower')
+        followers = Follow.objects.filter(following=user).select_related(
+            'follower__user_settings', 'following__user_settings'
+        )
         serializer = FollowSerializer(followers, many=True, context={'request': request})
         return Response(serializer.data)
     
     @action(detail=True, methods=['get'])
     def following(self, request, pk=None):
         user = self.get_object()
-        following = Follow.objects.filter(follower=user).select_related('following')
+        following = Follow.objects.filter(follower=user).select_related(
+            'follower__user_settings', 'following__user_settings'
+        )
         serializer = FollowSerializer(following, many=True, context={'request': request})
         return Response(serializer.data)
     
     @action(detail=True, methods=['get'])
     def posts(self, request, pk=None):
         user = self.get_object()
-        posts = Post.objects.filter(user=user, is_deleted=False).order_by('-created_at')
-        page = self.paginate_queryset(posts)
-        
-        if page is not None:
-            serializer = PostListSerializer(page, many=True, context={'request': request})
-            return self.get_paginated_response(serializer.data)
+        posts = Post.objects.filter(user=user, is_deleted=False).select_related('user__user_settings')
         
-        serializer = PostListSerializer(posts, many=True, context={'request': request})
-        return Response(serializer.data)
+        # تصفيح بالمؤشر بدلاً من تصفيح قائمة المستخدمين بالأرقام
+        paginator = KeysetPagination()
+        page = paginator.paginate_queryset(posts, request, view=self)
+        serializer = PostListSerializer(page, many=True, context={'request': request})
+        return paginator.get_paginated_response(serializer.data)
 
 # Post ViewSet
 class PostViewSet(viewsets.ModelViewSet):
-    queryset = Post.objects.filter(is_deleted=False).order_by('-created_at')
+    queryset = Post.objects.filter(is_deleted=False).select_related('user__user_settings').order_by('-created_at')
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
+    pagination_class = KeysetPagination
     filter_backends = [DjangoFilterBackend, filters.SearchFilter]
     search_fields = ['content', 'user__username']
     
@@ -170,14 +178,20 @@ class PostViewSet(viewsets.ModelViewSet):
         if user_id:
             queryset = queryset.filter(user_id=user_id)
         
-        # تصفية حسب المستخدمين المتابَعين
-        following_only = self.request.query_params.get('following_only')
-        if following_only and self.request.user.is_authenticated:
-            following_ids = Follow.objects.filter(follower=self.request.user).values_list('following_id', flat=True)
-            queryset = queryset.filter(user_id__in=following_ids)
-        
         return queryset
     
+    def list(self, request, *args, **kwargs):
+        # تصفية حسب المستخدمين المتابَعين (من الخط الزمني الهجين)
+        following_only = request.query_params.get('following_only')
+        if not (following_only and request.user.is_authenticated):
+            return super().list(request, *args, **kwargs)
+        
+        queryset = self.filter_queryset(self.get_queryset())
+        timeline = HomeTimeline(request.user, include_own=False, queryset=queryset)
+        page = self.paginate_queryset(timeline)
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
+    
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
     
@@ -188,23 +202,18 @@ class PostViewSet(viewsets.ModelViewSet):
         
         if not created:
             like.delete()
-            post.likes_count -= 1
-            liked = False
-        else:
-            post.likes_count += 1
-            liked = True
-        
-        post.save()
+        liked = created
+        counters.record(post, 'likes_count', 1 if liked else -1)
         
         return Response({
             'liked': liked,
-            'likes_count': post.likes_count
+            'likes_count': counters.current(post, 'likes_count')
         })
     
     @action(detail=True, methods=['get'])
     def likes(self, request, pk=None):
         post = self.get_object()
-        likes = Like.objects.filter(post=post).select_related('user')
+        likes = Like.objects.filter(post=post).select_related('user__user_settings')
         serializer = LikeSerializer(likes, many=True, context={'request': request})
         return Response(serializer.data)
     
@@ -215,8 +224,7 @@ class PostViewSet(viewsets.ModelViewSet):
         
         if serializer.is_valid():
             serializer.save(post=post, user=request.user)
-            post.comments_count += 1
-            post.save()
+            counters.record(post, 'comments_count', 1)
             
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         
@@ -225,15 +233,72 @@ class PostViewSet(viewsets.ModelViewSet):
     @action(detail=True, methods=['get'])
     def comments(self, request, pk=None):
         post = self.get_object()
-        comments = Comment.objects.filter(post=post, parent=None).order_by('-created_at')
-        serializer = CommentSerializer(comments, many=True, context={'request': request})
+        
+        # السلسلة كاملة باستعلام واحد مرتب حسب المسار، والأحدث أولاً للجذور
+        roots, _ = fetch_thread(post, max_depth=COMMENT_REPLY_DEPTH)
+        serializer = CommentSerializer(roots[::-1], many=True, context={'request': request})
         return Response(serializer.data)
 
+# Upload ViewSet
+class UploadSessionViewSet(mixins.CreateModelMixin, mixins.RetrieveModelMixin,
+                           mixins.DestroyModelMixin, viewsets.GenericViewSet):
+    """
+    رفع فيديو على أجزاء: POST لإنشاء الجلسة، ثم PUT لكل جزء مع
+    Content-Range، و GET لمعرفة الموضع بعد انقطاع، ثم POST .../complete/
+    """
+    serializer_class = UploadSessionSerializer
+    permission_classes = [permissions.IsAuthenticated]
+    
+    def get_queryset(self):
+        return UploadSession.objects.filter(user=self.request.user).select_related('post')
+    
+    def perform_create(self, serializer):
+        serializer.save(user=self.request.user)
+    
+    def perform_destroy(self, session):
+        uploads.discard(session)
+    
+    def offset_response(self, session, status_code=status.HTTP_200_OK, error=None):
+        data = {'received': session.received, 'size': session.size}
+        if error:
+            data['error'] = error
+        response = Response(data, status=status_code)
+        response['Upload-Offset'] = session.received
+        return response
+    
+    def update(self, request, pk=None):
+        session = self.get_object()
+        try:
+            start, length = uploads.parse_content_range(request.headers.get('Content-Range'), session.size)
+            # جسم الطلب يُقرأ كتدفق؛ request.data لا يُلمس حتى لا يُحمّل في الذاكرة
+            uploads.write_chunk(session, request._request, start, length)
+        except uploads.OffsetMismatch as e:
+            return self.offset_response(session, status.HTTP_409_CONFLICT, str(e))
+        except uploads.UploadError as e:
+            return self.offset_response(session, status.HTTP_400_BAD_REQUEST, str(e))
+        return self.offset_response(session)
+    
+    @action(detail=True, methods=['post'])
+    def complete(self, request, pk=None):
+        session = self.get_object()
+        content = request.data.get('content', '')
+        if session.post_id is None and not content:
+            return Response({'error': 'محتوى المنشور مطلوب'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        try:
+            post = uploads.finalize(session, content=content)
+        except uploads.UploadError as e:
+            return self.offset_response(session, status.HTTP_400_BAD_REQUEST, str(e))
+        
+        serializer = PostDetailSerializer(post, context={'request': request})
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+
 # Comment ViewSet
 class CommentViewSet(viewsets.ModelViewSet):
-    queryset = Comment.objects.all()
+    queryset = Comment.objects.select_related('user__user_settings')
     serializer_class = CommentSerializer
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
+    pagination_class = KeysetPagination
     
     def get_queryset(self):
         queryset = super().get_queryset()
@@ -255,19 +320,38 @@ class CommentViewSet(viewsets.ModelViewSet):
         
         if not created:
             like.delete()
-            comment.likes_count -= 1
-            liked = False
-        else:
-            comment.likes_count += 1
-            liked = True
-        
-        comment.save()
+        liked = created
+        counters.record(comment, 'likes_count', 1 if liked else -1)
         
         return Response({
             'liked': liked,
-            'likes_count': comment.likes_count
+            'likes_count': counters.current(comment, 'likes_count')
         })
     
+    @action(detail=True, methods=['get'])
+    def thread(self, request, pk=None):
+        """صفحة من فرع التعليق بترتيب الشجرة مع مؤشر للصفحة التالية"""
+        root = self.get_object()
+        
+        try:
+            limit = min(int(request.query_params.get('limit', 50)), 200)
+            max_depth = request.query_params.get('max_depth')
+            max_depth = int(max_depth) if max_depth else None
+        except ValueError:
+            return Response({'error': 'قيمة غير صالحة'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        roots, cursor = fetch_thread(
+            root.post, root=root, max_depth=max_depth,
+            after=request.query_params.get('after'), limit=max(limit, 1)
+        )
+        serializer = CommentSerializer(roots, many=True, context={'request': request})
+        
+        next_url = None
+        if cursor:
+            next_url = replace_query_param(request.build_absolute_uri(), 'after', cursor)
+        
+        return Response({'next': next_url, 'results': serializer.data})
+    
     @action(detail=True, methods=['post'])
     def reply(self, request, pk=None):
         parent_comment = self.get_object()
@@ -275,8 +359,7 @@ class CommentViewSet(viewsets.ModelViewSet):
         
         if serializer.is_valid():
             serializer.save(post=parent_comment.post, user=request.user, parent=parent_comment)
-            parent_comment.post.comments_count += 1
-            parent_comment.post.save()
+            counters.record(parent_comment.post, 'comments_count', 1)
             
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         
@@ -290,7 +373,7 @@ class FriendshipViewSet(viewsets.ModelViewSet):
     def get_queryset(self):
         return Friendship.objects.filter(
             Q(from_user=self.request.user) | Q(to_user=self.request.user)
-        ).order_by('-created_at')
+        ).select_related('from_user__user_settings', 'to_user__user_settings').order_by('-created_at')
     
     def perform_create(self, serializer):
         serializer.save(from_user=self.request.user)
@@ -329,33 +412,84 @@ class FriendshipViewSet(viewsets.ModelViewSet):
 class FollowViewSet(viewsets.ReadOnlyModelViewSet):
     serializer_class = FollowSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = KeysetPagination
     
     def get_queryset(self):
         user_id = self.request.query_params.get('user_id')
         
+        queryset = Follow.objects.select_related('follower__user_settings', 'following__user_settings')
+        
         if user_id:
-            return Follow.objects.filter(follower_id=user_id).order_by('-created_at')
+            return queryset.filter(follower_id=user_id).order_by('-created_at')
         
-        return Follow.objects.filter(follower=self.request.user).order_by('-created_at')
+        return queryset.filter(follower=self.request.user).order_by('-created_at')
 
 # Feed View
+class FeedPagination(KeysetPagination):
+    """يدعم since_id: المنشورات الأحدث من منشور يعرفه العميل"""
+    since_id_query_param = 'since_id'
+    since_replaces_params = ('cursor', 'until', 'since_id')
+    
+    def get_since(self, request):
+        since_id = request.query_params.get(self.since_id_query_param)
+        if not since_id:
+            return super().get_since(request)
+        
+        try:
+            return Post.objects.values_list('created_at', 'id').get(pk=int(since_id))
+        except (ValueError, Post.DoesNotExist):
+            raise NotFound('since_id غير صالح')
+
+@use_replica
+@query_budget(9, max_similar=1)
 class FeedView(generics.ListAPIView):
     serializer_class = PostListSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = FeedPagination
     
     def get_queryset(self):
-        # الحصول على المنشورات من المستخدمين المتابَعين
-        following_ids = Follow.objects.filter(follower=self.request.user).values_list('following_id', flat=True)
+        # منشورات المتابَعين والمستخدم نفسه: المدفوعة مدموجة مع المسحوبة
+        return HomeTimeline(self.request.user, queryset=Post.objects.select_related('user__user_settings'))
+    
+    def list(self, request, *args, **kwargs):
+        # ETag من إصدار الخط الزمني (الذاكرة المؤقتة وقائمة المتابَعين فقط)
+        # وشكل الطلب، فالـ 304 لا يلمس المنشورات ولا الإعجابات ولا العدّادات
+        raw = f'{timeline_version(request.user)}|{replica_generation()}|{request.get_full_path()}'
+        etag = f'W/"{hashlib.md5(raw.encode()).hexdigest()}"'
+        if etag in request.headers.get('If-None-Match', ''):
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            response = super().list(request, *args, **kwargs)
         
-        # إضافة منشورات المستخدم نفسه
-        following_ids = list(following_ids) + [self.request.user.id]
+        response['ETag'] = etag
+        response['Cache-Control'] = 'private, no-cache'
+        return response
+
+# Trends View
+class TrendsView(APIView):
+    """الهاشتاجات الأكثر استخداماً في نافذة زمنية (1h أو 24h أو 7d)"""
+    permission_classes = [permissions.AllowAny]
+    
+    def get(self, request):
+        window = request.query_params.get('window', DEFAULT_WINDOW)
+        if window not in WINDOWS:
+            return Response(
+                {'error': f"النوافذ المتاحة: {', '.join(WINDOWS)}"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
         
-        return Post.objects.filter(
-            user_id__in=following_ids,
-            is_deleted=False
-        ).order_by('-created_at')
+        try:
+            limit = max(1, min(int(request.query_params.get('limit', 10)), 50))
+        except ValueError:
+            return Response({'error': 'قيمة غير صالحة'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        return Response({'window': window, 'results': trending(window, limit)})
 
 # Search View
+# حد نتائج البحث المرتبة القابلة للتصفيح
+SEARCH_RESULTS_LIMIT = 200
+
+@use_replica
 class SearchView(generics.ListAPIView):
     permission_classes = [permissions.IsAuthenticated]
     
@@ -376,22 +510,20 @@ class SearchView(generics.ListAPIView):
         if not query:
             return []
         
+        # بالصلة من فهرس البحث؛ كل صفحة تجلب صفوفها فقط
         if search_type == 'posts':
-            return Post.objects.filter(
-                Q(content__icontains=query) |
-                Q(user__username__icontains=query)
-            ).filter(is_deleted=False).order_by('-created_at')
+            return fulltext.SearchResults(
+                'post', query, Post.objects.select_related('user__user_settings'),
+                SEARCH_RESULTS_LIMIT, snippets=True,
+            )
         
         elif search_type == 'comments':
-            return Comment.objects.filter(
-                Q(content__icontains=query) |
-                Q(user__username__icontains=query)
-            ).order_by('-created_at')
+            return fulltext.SearchResults(
+                'comment', query, Comment.objects.select_related('user__user_settings'),
+                SEARCH_RESULTS_LIMIT, snippets=True,
+            )
         
         else:  # users
-            return CustomUser.objects.filter(
-                Q(username__icontains=query) |
-                Q(first_name__icontains=query) |
-                Q(last_name__icontains=query) |
-                Q(email__icontains=query)
-            ).order_by('-date_joined')
+            return fulltext.SearchResults(
+                'user', query, CustomUser.objects.select_related('user_settings'), SEARCH_RESULTS_LIMIT,
+            )
@@ -0,0 +1,295 @@
+"""
+فهرس بادئات في الذاكرة للاقتراح التلقائي (المستخدمون والهاشتاجات)
+
+كل فهرس مصفوفة مرتبة من (كلمة، معرّف) يُبحث فيها بالتنصيف (bisect)،
+وأفضل TOP_K نتيجة لكل بادئة (بالوزن: followers_count أو usage_count)
+تُحسب مرة وتُحفظ حتى تتغير كلمة تبدأ بها. الاقتراح لا يلمس قاعدة البيانات.
+
+الفهرس محلي لكل عملية: يُبنى عند أول استخدام، وبعد
+AUTOCOMPLETE_REFRESH_SECONDS يُعاد بناؤه في خيط خلفي بينما تستمر الطلبات
+على الفهرس القديم حتى يُستبدل. البناء يجمع الأزواج ويرتبها مرة واحدة.
+بين ذلك تحدّثه الإشارات (core.signals) وفهرسة الهاشتاجات بعد تأكيد
+المعاملة، وما يصل منها أثناء البناء يُعاد تطبيقه على الفهرس الجديد قبل
+استبداله (تغيّر وزن سبق قراءة البناء قد يُحسب مرتين حتى البناء التالي).
+ما لا تمر به الإشارات (الإدخال المجمّع، update()، وكتابات العمليات
+الأخرى) يظهر عند إعادة البناء التالية.
+"""
+import bisect
+import heapq
+import logging
+import threading
+import time
+from collections import namedtuple
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import connections
+
+from .normalize import search_key
+
+AUTOCOMPLETE_REFRESH_SECONDS = getattr(settings, 'AUTOCOMPLETE_REFRESH_SECONDS', 300)
+AUTOCOMPLETE_TOP_K = getattr(settings, 'AUTOCOMPLETE_TOP_K', 10)
+# حد البادئات المحفوظة نتائجها قبل تفريغها
+AUTOCOMPLETE_CACHED_PREFIXES = 50000
+
+# حقول المستخدم التي يؤثر تغييرها في الفهرس
+USER_FIELDS = frozenset({
+    'username', 'first_name', 'last_name', 'bio', 'profile_image', 'is_active', 'followers_count',
+})
+
+Suggestion = namedtuple('Suggestion', 'id weight payload')
+_Built = namedtuple('_Built', 'index built_at')
+
+logger = logging.getLogger(__name__)
+
+# أكبر من أي محرف في الكلمات: نهاية نطاق البادئة
+_PREFIX_END = '\U0010ffff'
+
+
+def normalize(text):
+    # التوحيد نفسه المستخدم في البحث النصي (التشكيل، صور الألف، الحالة...)
+    return search_key(text).strip()
+
+
+class PrefixIndex:
+
+    def __init__(self, top_k=AUTOCOMPLETE_TOP_K):
+        self.top_k = top_k
+        self._keys = []     # [(كلمة، معرّف)] مرتبة
+        self._entries = {}  # معرّف -> (الوزن، الكلمات، البيانات)
+        self._top = {}      # بادئة -> معرّفات أفضل النتائج
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, pk):
+        return pk in self._entries
+
+    @classmethod
+    def from_items(cls, items, top_k=AUTOCOMPLETE_TOP_K):
+        """بناء فهرس من (المعرّف، الكلمات، الوزن، البيانات) بترتيب واحد"""
+        index = cls(top_k)
+        for pk, terms, weight, payload in items:
+            terms = sorted({normalize(term) for term in terms} - {''})
+            index._entries[pk] = (weight, terms, payload)
+        index._keys = sorted((term, pk) for pk, entry in index._entries.items() for term in entry[1])
+        return index
+
+    def add(self, pk, terms, weight, payload):
+        """إضافة عنصر أو استبداله"""
+        terms = sorted({normalize(term) for term in terms} - {''})
+        with self._lock:
+            self._discard(pk)
+            self._entries[pk] = (weight, terms, payload)
+            for term in terms:
+                bisect.insort(self._keys, (term, pk))
+            self._invalidate(terms)
+
+    def remove(self, pk):
+        with self._lock:
+            self._discard(pk)
+
+    def add_weight(self, pk, delta):
+        with self._lock:
+            entry = self._entries.get(pk)
+            if entry is not None:
+                weight, terms, payload = entry
+                self._entries[pk] = (weight + delta, terms, payload)
+                self._invalidate(terms)
+
+    def search(self, prefix, limit):
+        """[Suggestion] الأعلى وزناً لكلمات تبدأ بـ prefix"""
+        prefix = normalize(prefix)
+        if not prefix:
+            return []
+        with self._lock:
+            ids = self._top.get(prefix)
+            if ids is None:
+                ids = self._top_ids(prefix)
+                if len(self._top) >= AUTOCOMPLETE_CACHED_PREFIXES:
+                    self._top.clear()
+                self._top[prefix] = ids
+            return [Suggestion(pk, self._entries[pk][0], self._entries[pk][2]) for pk in ids[:limit]]
+
+    def _top_ids(self, prefix):
+        start = bisect.bisect_left(self._keys, (prefix,))
+        end = bisect.bisect_left(self._keys, (prefix + _PREFIX_END,), start)
+        # العنصر الواحد قد يطابق بأكثر من كلمة (الاسم الأول واسم المستخدم)
+        ids = {pk for _, pk in self._keys[start:end]}
+        return tuple(heapq.nlargest(self.top_k, ids, key=lambda pk: (self._entries[pk][0], pk)))
+
+    def _discard(self, pk):
+        entry = self._entries.pop(pk, None)
+        if entry is None:
+            return
+        for term in entry[1]:
+            del self._keys[bisect.bisect_left(self._keys, (term, pk))]
+        self._invalidate(entry[1])
+
+    def _invalidate(self, terms):
+        if not self._top:
+            return
+        for term in terms:
+            for n in range(1, len(term) + 1):
+                self._top.pop(term[:n], None)
+
+
+def _user_item(pk, username, first_name, last_name, bio, profile_image, followers_count):
+    payload = {
+        'id': pk,
+        'username': username,
+        'name': f'{first_name} {last_name}'.strip() or username,
+        'profile_image': default_storage.url(profile_image) if profile_image else '',
+        'bio': (bio or '')[:50],
+    }
+    return pk, (username, first_name, last_name), followers_count, payload
+
+
+def _hashtag_item(pk, name, usage_count):
+    return pk, (name,), usage_count, {'id': pk, 'name': name}
+
+
+def _load_users():
+    from accounts.models import CustomUser
+    rows = CustomUser.objects.filter(is_active=True).values_list(
+        'pk', 'username', 'first_name', 'last_name', 'bio', 'profile_image', 'followers_count',
+    )
+    return (_user_item(*row) for row in rows.iterator(chunk_size=2000))
+
+
+def _load_hashtags():
+    from posts.models import Hashtag
+    rows = Hashtag.objects.filter(usage_count__gt=0).values_list('pk', 'name', 'usage_count')
+    return (_hashtag_item(*row) for row in rows.iterator(chunk_size=2000))
+
+
+LOADERS = {'user': _load_users, 'hashtag': _load_hashtags}
+
+_indexes = {}
+# نوع -> تحديثات الإشارات أثناء بنائه، تُعاد على الفهرس الجديد
+_pending = {}
+_build_lock = threading.Lock()
+_state_lock = threading.Lock()
+
+
+def build(kind):
+    """بناء فهرس النوع من قاعدة البيانات واستبدال الحالي به"""
+    with _state_lock:
+        _pending.setdefault(kind, [])
+    try:
+        index = PrefixIndex.from_items(LOADERS[kind]())
+    except BaseException:
+        with _state_lock:
+            _pending.pop(kind, None)
+        raise
+    with _state_lock:
+        for update in _pending.pop(kind):
+            update(index)
+        _indexes[kind] = _Built(index, time.monotonic())
+    return index
+
+
+def _build_in_background(kind):
+    try:
+        build(kind)
+    except Exception:
+        logger.exception('autocomplete %s index rebuild failed', kind)
+    finally:
+        connections.close_all()
+
+
+def _refresh(kind):
+    """بدء إعادة البناء في خيط خلفي إن لم تكن جارية"""
+    with _state_lock:
+        if kind in _pending:
+            return
+        _pending[kind] = []
+    threading.Thread(
+        target=_build_in_background, args=(kind,), name=f'autocomplete-{kind}', daemon=True,
+    ).start()
+
+
+def get_index(kind):
+    """
+    الفهرس الحالي. أول استخدام يبنيه وينتظره، والمتقادم يُعاد بناؤه في
+    الخلفية ويُعاد القديم حتى يُستبدل.
+    """
+    current = _indexes.get(kind)
+    if current is None:
+        with _build_lock:
+            current = _indexes.get(kind)
+            if current is None:
+                return build(kind)
+    if time.monotonic() - current.built_at >= AUTOCOMPLETE_REFRESH_SECONDS:
+        _refresh(kind)
+    return current.index
+
+
+def reset():
+    with _state_lock:
+        _indexes.clear()
+        _pending.clear()
+
+
+def suggest_users(prefix, limit):
+    return get_index('user').search(prefix, limit)
+
+
+def suggest_hashtags(prefix, limit):
+    return get_index('hashtag').search(prefix.lstrip('#'), limit)
+
+
+def _apply(kind, update):
+    """
+    تطبيق update(index) على الفهرس المبني وتسجيله لفهرس قيد البناء؛ غير
+    المبني سيقرأ القيم الحالية عند بنائه.
+    """
+    with _state_lock:
+        current = _indexes.get(kind)
+        if current is not None:
+            update(current.index)
+        if kind in _pending:
+            _pending[kind].append(update)
+
+
+def user_saved(user):
+    if not user.is_active:
+        user_deleted(user.pk)
+        return
+    item = _user_item(
+        user.pk, user.username, user.first_name, user.last_name, user.bio,
+        user.profile_image.name, user.followers_count,
+    )
+    _apply('user', lambda index: index.add(*item))
+
+
+def user_deleted(pk):
+    _apply('user', lambda index: index.remove(pk))
+
+
+def followers_changed(pk, delta):
+    _apply('user', lambda index: index.add_weight(pk, delta))
+
+
+def hashtags_used(usage):
+    """{(المعرّف، الاسم): تغيّر usage_count} من فهرسة هاشتاجات المنشورات"""
+    def update(index):
+        for (pk, name), delta in usage.items():
+            if pk in index:
+                index.add_weight(pk, delta)
+            elif delta > 0:
+                index.add(*_hashtag_item(pk, name, delta))
+    _apply('hashtag', update)
+
+
+def hashtag_saved(hashtag):
+    if hashtag.usage_count <= 0:
+        hashtag_deleted(hashtag.pk)
+        return
+    item = _hashtag_item(hashtag.pk, hashtag.name, hashtag.usage_count)
+    _apply('hashtag', lambda index: index.add(*item))
+
+
+def hashtag_deleted(pk):
+    _apply('hashtag', lambda index: index.remove(pk))
@@ -0,0 +1,96 @@
+"""
+عدّ مراجع ملفات الوسائط المعنونة بمحتواها
+
+الملف الواحد قد يشير إليه أكثر من منشور أو مستخدم بعد إزالة التكرار،
+فلا يجوز حذفه عند إزالته من أحدها. أسماء الملفات في حقول BLOB_FIELDS
+تُقرأ عند تحميل الكائن، وعند حفظه يُزاد عدّاد الأسماء الجديدة ويُنقص
+عدّاد المستبدلة، وعند حذفه تُنقص كلها. الملف الذي يصل عدّاده إلى صفر
+يُحذف مع نسخه المصغرة بعد تأكيد المعاملة.
+
+الأسماء غير المعنونة (الملفات القديمة والصور الافتراضية) لا تُعدّ ولا
+تُحذف؛ dedupe_media يحوّل القديم منها.
+"""
+from collections import Counter
+
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import F
+
+from accounts.models import CustomUser
+from posts.models import Post
+from . import images
+from .media import is_content_addressed
+from .models import MediaBlob
+
+BLOB_FIELDS = {
+    Post: ('image', 'video'),
+    CustomUser: ('profile_image', 'cover_image'),
+}
+
+
+def field_names(instance):
+    """{الحقل: اسم الملف} من قيم الكائن دون تحميل الحقول المؤجلة"""
+    return {
+        field: str(instance.__dict__[field] or '')
+        for field in BLOB_FIELDS[type(instance)] if field in instance.__dict__
+    }
+
+
+def acquire(names):
+    """زيادة عدّادات الأسماء المعنونة (اسم مكرر يُعدّ مرتين)"""
+    counts = Counter(name for name in names if name and is_content_addressed(name))
+    if not counts:
+        return
+    MediaBlob.objects.bulk_create([MediaBlob(name=name) for name in counts], ignore_conflicts=True)
+    for name, n in counts.items():
+        MediaBlob.objects.filter(name=name).update(refcount=F('refcount') + n)
+
+
+def release(names):
+    """إنقاص العدّادات، وحذف الملفات التي لم يعد يشير إليها شيء بعد التأكيد"""
+    counts = Counter(name for name in names if name and is_content_addressed(name))
+    for name, n in counts.items():
+        MediaBlob.objects.filter(name=name).update(refcount=F('refcount') - n)
+    if counts:
+        transaction.on_commit(lambda: delete_unreferenced(list(counts)))
+
+
+def lock(name):
+    """قفل صف الملف (يُنشأ إن لم يوجد) حتى نهاية المعاملة المحيطة"""
+    MediaBlob.objects.bulk_create([MediaBlob(name=name)], ignore_conflicts=True)
+    return MediaBlob.objects.select_for_update().get(name=name)
+
+
+def delete_unreferenced(names):
+    for name in names:
+        with transaction.atomic():
+            blob = MediaBlob.objects.select_for_update().filter(name=name).first()
+            # إعادة التحقق تحت القفل: قد يكون رفعٌ آخر للمحتوى نفسه أعاد استخدامه
+            if blob is None or blob.refcount > 0:
+                continue
+            blob.delete()
+            default_storage.delete(name)
+            images.delete_variants(name)
+
+
+def snapshot(instance):
+    instance._blob_names = field_names(instance)
+
+
+def saved(instance, created, update_fields=None):
+    old = {} if created else getattr(instance, '_blob_names', {})
+    new = field_names(instance)
+    # حقل لم يُحمّل عند القراءة لا يُعرف اسمه السابق فيُترك (قد يبقى ملف زائد، ولا يُحذف ملف مستخدم)
+    fields = [
+        field for field in new
+        if (created or field in old) and (update_fields is None or field in update_fields)
+    ]
+    changed = [field for field in fields if new[field] != old.get(field, '')]
+    if changed:
+        acquire(new[field] for field in changed)
+        release(old.get(field) for field in changed)
+    instance._blob_names = {**old, **{field: new[field] for field in fields}}
+
+
+def deleted(instance):
+    release(getattr(instance, '_blob_names', {}).values())
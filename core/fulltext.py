@@ -0,0 +1,419 @@
+"""
+فهرس البحث النصي (SQLite FTS5)
+
+لكل من المنشورات والتعليقات والمستخدمين جدول FTS5 بمحتوى خارجي يشير
+إلى الجدول الأصلي (لا يُكرر النص)، تحدّثه قوادح (triggers) عند الإدراج
+والحذف وتعديل الأعمدة المفهرسة فقط، فيبقى متزامناً حتى مع update()
+والإدخال المجمّع. الترتيب بـ bm25، وفهارس بادئات FTS5 لأول حرفين وثلاثة.
+
+الأعمدة المفهرسة هي مفاتيح البحث الموحّدة (*_key، انظر core.normalize)
+ونص البحث يوحَّد بالدالة نفسها. المقتطفات تُبنى من النص الأصلي: مواضع
+المطابقات في المفتاح تُعاد إلى مواضعها في الأصل ثم يُهرَّب HTML.
+
+الجداول والقوادح تُنشأ وتُصلح بعد كل migrate (install): ترحيلات SQLite
+التي تعيد بناء جدول تحذف قوادحه، فيُقارن تعريف كل منها بالمتوقع ويُعاد
+إنشاء المختلف وإعادة بناء فهرسه.
+
+على قواعد بيانات أخرى (أو SQLite دون FTS5) يُستخدم icontains كما كان.
+
+صفحات النتائج وأعدادها للواجهات (search_objects و SearchResults و
+merged_page) تمر بذاكرة البحث المؤقتة (core.searchcache).
+
+الاستعلامات الخام تُنفذ على قاعدة القراءة التي يختارها الموجّه للنموذج
+(نسخة القراءة داخل use_replica)، والواجهات تستخدم قاعدة queryset التحميل
+نفسها، فالمطابقة والتحميل من القاعدة ذاتها.
+"""
+import re
+from collections import namedtuple
+from functools import reduce
+from operator import or_
+
+from django.db import connection as default_connection, connections, router
+from django.db.models import Q
+from django.utils.html import escape
+from django.utils.safestring import mark_safe
+
+from . import searchcache
+from .normalize import normalize_with_offsets, original_span, search_key
+
+SNIPPET_LENGTH = 200
+TOKENIZER = 'unicode61 remove_diacritics 2'
+PREFIX_INDEXES = '2 3'
+TERM_RE = re.compile(r'\w+', re.UNICODE)
+MAX_TERMS = 8
+ARABIC_ARTICLE = 'ال'
+ARABIC_LETTER_RE = re.compile('[\u0620-\u064a]')
+
+# الجدول، الأعمدة المفهرسة، أوزان bm25، شرط الظهور (على الجدول الأصلي p)،
+# والعمود الأصلي للمقتطفات
+FullTextIndex = namedtuple('FullTextIndex', 'table columns weights visible source')
+
+INDEXES = {
+    'post': FullTextIndex('posts_post', ('content_key',), (1.0,), 'p.is_deleted = 0', 'content'),
+    'comment': FullTextIndex('posts_comment', ('content_key',), (1.0,), None, 'content'),
+    'user': FullTextIndex(
+        'accounts_customuser', ('username_key', 'name_key', 'bio_key'),
+        (10.0, 5.0, 1.0), 'p.is_active = 1', None,
+    ),
+}
+
+Hit = namedtuple('Hit', 'id snippet')
+
+
+def fts_table(index):
+    return f'{index.table}_fts'
+
+
+def _ddl(index):
+    """{الاسم: تعريفه كما يخزنه sqlite_master}"""
+    fts, table = fts_table(index), index.table
+    columns = ', '.join(index.columns)
+    new_values = ', '.join(f'new.{c}' for c in index.columns)
+    old_values = ', '.join(f'old.{c}' for c in index.columns)
+    insert = f'INSERT INTO {fts}(rowid, {columns}) VALUES (new.id, {new_values});'
+    delete = f"INSERT INTO {fts}({fts}, rowid, {columns}) VALUES ('delete', old.id, {old_values});"
+    return {
+        fts: (
+            f"CREATE VIRTUAL TABLE {fts} USING fts5({columns}, content='{table}', "
+            f"content_rowid='id', tokenize='{TOKENIZER}', prefix='{PREFIX_INDEXES}')"
+        ),
+        f'{fts}_ai': f'CREATE TRIGGER {fts}_ai AFTER INSERT ON {table} BEGIN {insert} END',
+        f'{fts}_ad': f'CREATE TRIGGER {fts}_ad AFTER DELETE ON {table} BEGIN {delete} END',
+        # تعديل العدّادات وغيرها لا يمس الفهرس
+        f'{fts}_au': (
+            f'CREATE TRIGGER {fts}_au AFTER UPDATE OF {columns} ON {table} '
+            f'BEGIN {delete} {insert} END'
+        ),
+    }
+
+
+def supported(connection=default_connection):
+    return connection.vendor == 'sqlite' and _has_fts5(connection)
+
+
+def _has_fts5(connection):
+    if not hasattr(connection, '_fts5'):
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT sqlite_compileoption_used('ENABLE_FTS5')")
+            compiled = cursor.fetchone()[0]
+            # قد يكون FTS5 مدمجاً دون خيار التجميع في بعض الإصدارات
+            cursor.execute("SELECT 1 FROM pragma_module_list WHERE name = 'fts5'")
+            connection._fts5 = bool(compiled or cursor.fetchone())
+    return connection._fts5
+
+
+def install(connection=default_connection):
+    """إنشاء الجداول والقوادح الناقصة أو المختلفة، وإعادة بناء الفهارس المتأثرة"""
+    if not supported(connection):
+        return []
+    rebuilt = []
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT name, sql FROM sqlite_master WHERE type IN ('table', 'trigger')")
+        existing = dict(cursor.fetchall())
+        for kind, index in INDEXES.items():
+            if index.table not in existing:
+                continue
+            expected = _ddl(index)
+            if all(existing.get(name) == sql for name, sql in expected.items()):
+                continue
+
+            fts = fts_table(index)
+            for name in expected:
+                if name == fts:
+                    cursor.execute(f'DROP TABLE IF EXISTS {fts}')
+                else:
+                    cursor.execute(f'DROP TRIGGER IF EXISTS {name}')
+            for sql in expected.values():
+                cursor.execute(sql)
+            cursor.execute(f"INSERT INTO {fts}({fts}) VALUES ('rebuild')")
+            rebuilt.append(kind)
+    return rebuilt
+
+
+def rebuild(connection=default_connection):
+    """إعادة بناء كل الفهارس من الجداول الأصلية"""
+    with connection.cursor() as cursor:
+        for index in INDEXES.values():
+            fts = fts_table(index)
+            cursor.execute(f"INSERT INTO {fts}({fts}) VALUES ('rebuild')")
+
+
+def query_terms(text):
+    """كلمات البحث بعد التوحيد"""
+    return TERM_RE.findall(search_key(text))[:MAX_TERMS]
+
+
+def term_variants(term):
+    """
+    صيغ الكلمة المقبولة كبادئة: الكلمة العربية دون "ال" تطابق أيضاً مع "ال"
+    (مكتبة ← المكتبة)، فالمطابقة بالبادئة وحدها لا تصل إليها.
+    """
+    if ARABIC_LETTER_RE.match(term) and not term.startswith(ARABIC_ARTICLE):
+        return (term, ARABIC_ARTICLE + term)
+    return (term,)
+
+
+def match_expression(text):
+    """
+    تعبير MATCH آمن من نص المستخدم: كل كلمة بين علامتي تنصيص (فلا تُفسَّر
+    عوامل FTS5) ومع * للمطابقة بالبادئة. '' إن لم توجد كلمات.
+    """
+    groups = []
+    for term in query_terms(text):
+        options = ['"{}"*'.format(variant.replace('"', '""')) for variant in term_variants(term)]
+        groups.append(options[0] if len(options) == 1 else '({})'.format(' OR '.join(options)))
+    return ' '.join(groups)
+
+
+def highlight(text, query, max_length=SNIPPET_LENGTH):
+    """
+    مقتطف HTML آمن من النص الأصلي مع <mark> حول الكلمات التي تبدأ بإحدى
+    كلمات البحث بعد التوحيد، متمركز حول أول مطابقة إن طال النص.
+    """
+    text = text or ''
+    terms = [variant for term in query_terms(query) for variant in term_variants(term)]
+    key, positions = normalize_with_offsets(text)
+    spans = []
+    for word in TERM_RE.finditer(key):
+        matched = max((len(term) for term in terms if word.group().startswith(term)), default=0)
+        if matched:
+            spans.append(original_span(text, positions, word.start(), word.start() + matched))
+
+    start, end = 0, len(text)
+    if end > max_length:
+        first = spans[0][0] if spans else 0
+        start = max(0, min(first - max_length // 4, end - max_length))
+        end = start + max_length
+    parts = ['…'] if start else []
+    cursor = start
+    for span_start, span_end in spans:
+        if span_start < cursor or span_end > end:
+            continue
+        parts += [escape(text[cursor:span_start]), '<mark>', escape(text[span_start:span_end]), '</mark>']
+        cursor = span_end
+    parts.append(escape(text[cursor:end]))
+    if end < len(text):
+        parts.append('…')
+    return mark_safe(''.join(parts))
+
+
+def read_connection(kind):
+    """اتصال قاعدة القراءة التي يوجّه إليها الموجّه نموذج النوع"""
+    return connections[router.db_for_read(_models()[kind])]
+
+
+def search(kind, text, limit, offset=0, snippets=False, connection=None):
+    """
+    [Hit(id, snippet)] مرتبة بالصلة (bm25) لصفحة واحدة من النتائج.
+    snippet مقتطف HTML آمن من أول عمود مفهرس، أو None.
+    """
+    index = INDEXES[kind]
+    expression = match_expression(text)
+    if not expression:
+        return []
+    if connection is None:
+        connection = read_connection(kind)
+    if not supported(connection):
+        return _fallback_search(kind, text, limit, offset, snippets, connection)
+
+    fts = fts_table(index)
+    weights = ', '.join(str(w) for w in index.weights)
+    snippets = snippets and index.source
+    source = f'p.{index.source}' if snippets else 'NULL'
+    visible = f'AND {index.visible}' if index.visible else ''
+    sql = (
+        f'SELECT f.rowid, {source} FROM {fts} f JOIN {index.table} p ON p.id = f.rowid '
+        f'WHERE {fts} MATCH %s {visible} '
+        f'ORDER BY bm25({fts}, {weights}), f.rowid DESC LIMIT %s OFFSET %s'
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [expression, limit, offset])
+        rows = cursor.fetchall()
+    return [Hit(pk, highlight(value, text) if snippets else None) for pk, value in rows]
+
+
+def count(kind, text, limit, connection=None):
+    """عدد النتائج حتى limit (دون ترتيب ولا مقتطفات)"""
+    index = INDEXES[kind]
+    expression = match_expression(text)
+    if not expression:
+        return 0
+    if connection is None:
+        connection = read_connection(kind)
+    if not supported(connection):
+        return len(_fallback_search(kind, text, limit, 0, False, connection))
+
+    fts = fts_table(index)
+    visible = f'AND {index.visible}' if index.visible else ''
+    sql = (
+        f'SELECT count(*) FROM (SELECT 1 FROM {fts} f JOIN {index.table} p ON p.id = f.rowid '
+        f'WHERE {fts} MATCH %s {visible} LIMIT %s)'
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [expression, limit])
+        return cursor.fetchone()[0]
+
+
+def cached_ids(kind, text, limit, offset=0, connection=None):
+    """معرّفات صفحة النتائج كما في search، من ذاكرة البحث المؤقتة"""
+    terms = query_terms(text)
+    if not terms:
+        return []
+    if connection is None:
+        connection = read_connection(kind)
+    return searchcache.get_or_compute(
+        kind, ('search', ' '.join(terms), limit, offset),
+        lambda: [hit.id for hit in search(kind, text, limit, offset, connection=connection)],
+        connection,
+    )
+
+
+def cached_count(kind, text, limit, connection=None):
+    """count من ذاكرة البحث المؤقتة"""
+    terms = query_terms(text)
+    if not terms:
+        return 0
+    if connection is None:
+        connection = read_connection(kind)
+    return searchcache.get_or_compute(
+        kind, ('count', ' '.join(terms), limit),
+        lambda: count(kind, text, limit, connection),
+        connection,
+    )
+
+
+def _models():
+    from accounts.models import CustomUser
+    from posts.models import Comment, Post
+    return {'post': Post, 'comment': Comment, 'user': CustomUser}
+
+
+def _fallback_search(kind, text, limit, offset, snippets, connection):
+    index = INDEXES[kind]
+    queryset = _models()[kind].objects.using(connection.alias)
+    for term in query_terms(text):
+        queryset = queryset.filter(reduce(or_, (Q(**{f'{c}__contains': term}) for c in index.columns)))
+    if kind == 'post':
+        queryset = queryset.filter(is_deleted=False)
+    elif kind == 'user':
+        queryset = queryset.filter(is_active=True)
+
+    snippets = snippets and index.source
+    rows = queryset.order_by('-pk').values_list('pk', index.source or 'pk')[offset:offset + limit]
+    return [Hit(pk, highlight(value, text) if snippets else None) for pk, value in rows]
+
+
+def search_objects(kind, text, queryset, limit, offset=0, snippets=False):
+    """
+    كائنات صفحة النتائج بترتيب الصلة من queryset (لـ select_related وما شابه)،
+    مع snippet على كل كائن عند الطلب.
+    """
+    ids = cached_ids(kind, text, limit, offset, connections[queryset.db])
+    return _load(kind, ids, queryset, text if snippets else None)
+
+
+def _load(kind, ids, queryset, query=None):
+    """الكائنات بترتيب ids، مع المقتطفات من نصها الأصلي إن مُرّر query"""
+    source = INDEXES[kind].source if query else None
+    objects = queryset.in_bulk(ids)
+    results = []
+    for pk in ids:
+        obj = objects.get(pk)
+        if obj is not None:
+            obj.snippet = highlight(getattr(obj, source), query) if source else None
+            obj.result_type = kind
+            results.append(obj)
+    return results
+
+
+class SearchResults:
+    """
+    نتائج بحث كسولة للتصفيح (Paginator وتصفيح DRF): العدد باستعلام محدود
+    بـ limit، وكل شريحة تجلب صفحتها فقط من الفهرس.
+    """
+
+    def __init__(self, kind, text, queryset, limit, snippets=False):
+        self.kind, self.text, self.queryset = kind, text, queryset
+        self.limit, self.snippets = limit, snippets
+        self._count = None
+
+    def __len__(self):
+        if self._count is None:
+            self._count = cached_count(self.kind, self.text, self.limit, connections[self.queryset.db])
+        return self._count
+
+    def __getitem__(self, key):
+        if not isinstance(key, slice):
+            return self[key:key + 1][0]
+        start, stop, _ = key.indices(self.limit)
+        if stop <= start:
+            return []
+        return search_objects(self.kind, self.text, self.queryset, stop - start, start, self.snippets)
+
+
+# قسم من نتائج مدمجة: نوع الفهرس، queryset للتحميل، والمقتطفات
+SearchSection = namedtuple('SearchSection', 'kind queryset snippets')
+
+
+class SearchPage:
+    """
+    صفحة من نتائج مدمجة، بواجهة Page في Django عدا العدد الكلي وعدد
+    الصفحات: has_next من جلب نتيجة زائدة واحدة.
+    """
+
+    def __init__(self, object_list, number, has_next):
+        self.object_list = object_list
+        self.number = number
+        self._has_next = has_next
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self._has_next
+
+    def has_previous(self):
+        return self.number > 1
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+    def next_page_number(self):
+        return self.number + 1
+
+    def previous_page_number(self):
+        return self.number - 1
+
+
+def merged_page(text, sections, number, per_page):
+    """
+    الصفحة number من نتائج الأقسام متتالية (كل قسم بترتيب صلته)، بجلب
+    نتائج الصفحة فقط من كل فهرس. عدد نتائج القسم يُحسب (محدوداً) فقط
+    حين تبدأ الصفحة بعد نهايته.
+    """
+    offset = (number - 1) * per_page
+    hits = []
+    for section in sections:
+        wanted = per_page + 1 - len(hits)
+        if wanted <= 0:
+            break
+        connection = connections[section.queryset.db]
+        found = cached_ids(section.kind, text, wanted, offset, connection)
+        if offset and not found:
+            offset -= cached_count(section.kind, text, offset, connection)
+            continue
+        hits.extend((section, pk) for pk in found)
+        offset = 0
+
+    has_next = len(hits) > per_page
+    hits = hits[:per_page]
+    objects = []
+    for section in sections:
+        objects.extend(_load(
+            section.kind, [pk for s, pk in hits if s is section], section.queryset,
+            text if section.snippets else None,
+        ))
+    return SearchPage(objects, number, has_next)
@@ -0,0 +1,145 @@
+"""
+نسخ الصور المصغرة (variants)
+
+الصور المرفوعة تُحفظ بدقتها الأصلية، فتُولَّد منها نسخ WebP بأحجام العرض
+الفعلية (مصغرة، عرض الخط الزمني، الصور الشخصية) في مجمّع خيوط خارج مسار
+الطلب بعد تأكيد المعاملة. أسماء النسخ ومقاساتها تُخزن في حقل JSON على
+الكائن نفسه ومعها اسم الصورة الأصلية، فلا تُستخدم نسخ صورة قديمة.
+"""
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connection, transaction
+
+logger = logging.getLogger(__name__)
+
+# نوع الصورة ← [(اسم النسخة، العرض، مربعة؟)]
+IMAGE_VARIANTS = {
+    'post': [('thumb', 320, False), ('feed', 680, False), ('feed_2x', 1360, False)],
+    'avatar': [('avatar_48', 48, True), ('avatar_96', 96, True), ('avatar_192', 192, True)],
+}
+IMAGE_VARIANT_FORMAT = 'WEBP'
+IMAGE_VARIANT_QUALITY = getattr(settings, 'IMAGE_VARIANT_QUALITY', 80)
+IMAGE_VARIANT_WORKERS = getattr(settings, 'IMAGE_VARIANT_WORKERS', 2)
+# False: التوليد داخل الطلب نفسه (للاختبارات وأوامر الإدارة)
+IMAGE_VARIANTS_ASYNC = getattr(settings, 'IMAGE_VARIANTS_ASYNC', True)
+
+_executor = None
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=IMAGE_VARIANT_WORKERS, thread_name_prefix='image-variants')
+    return _executor
+
+
+def variant_name(source, name):
+    """مسار ثابت للنسخة مشتق من مسار الأصل، فالأصل المشترك يُولَّد مرة واحدة"""
+    directory, filename = os.path.split(source)
+    return f'{directory}/variants/{filename}/{name}.{IMAGE_VARIANT_FORMAT.lower()}'
+
+
+def render_variants(source, kind):
+    """توليد نسخ صورة وحفظها، وإرجاع {اسم النسخة: {'name', 'width'}}"""
+    from PIL import Image, ImageOps
+
+    with default_storage.open(source, 'rb') as f:
+        image = Image.open(f)
+        image.load()
+    image = ImageOps.exif_transpose(image)
+    image = image.convert('RGBA' if image.mode in ('RGBA', 'LA', 'P') else 'RGB')
+
+    variants = {}
+    for name, width, square in IMAGE_VARIANTS[kind]:
+        # لا تكبير: النسخ الأعرض من الأصل تُتجاهل
+        if width > image.width and variants:
+            continue
+        path = variant_name(source, name)
+
+        if square:
+            size = (width, width)
+            resized = ImageOps.fit(image, size, Image.LANCZOS)
+        else:
+            height = round(image.height * min(width, image.width) / image.width)
+            size = (min(width, image.width), height)
+            resized = image.resize(size, Image.LANCZOS)
+
+        if not default_storage.exists(path):
+            buffer = BytesIO()
+            resized.save(buffer, IMAGE_VARIANT_FORMAT, quality=IMAGE_VARIANT_QUALITY, method=4)
+            path = default_storage.save(path, ContentFile(buffer.getvalue()))
+        variants[name] = {'name': path, 'width': size[0]}
+    return variants
+
+
+def generate(model, pk, field, variants_field, kind):
+    """توليد نسخ صورة كائن وتسجيلها إن لم تتغير صورته أثناء التوليد"""
+    try:
+        source = model.objects.filter(pk=pk).values_list(field, flat=True).first()
+        if not source:
+            return
+        variants = render_variants(source, kind)
+        # update() بشرط الصورة نفسها: لا save() ولا إشارات ولا تغيير updated_at
+        model.objects.filter(pk=pk, **{field: source}).update(
+            **{variants_field: {'source': source, 'variants': variants}}
+        )
+    except Exception:
+        logger.exception('تعذر توليد نسخ %s #%s', model.__name__, pk)
+
+
+def _generate_in_worker(*args):
+    try:
+        generate(*args)
+    finally:
+        # لكل خيط اتصاله الخاص بقاعدة البيانات
+        connection.close()
+
+
+def schedule(instance, field, variants_field, kind):
+    """جدولة توليد النسخ بعد تأكيد المعاملة إذا تغيّرت الصورة"""
+    image = getattr(instance, field)
+    if not image or getattr(instance, variants_field).get('source') == image.name:
+        return
+    # الصورة الافتراضية مشتركة بين كل المستخدمين وليست رفعاً
+    if image.name == instance._meta.get_field(field).get_default():
+        return
+
+    args = (type(instance), instance.pk, field, variants_field, kind)
+    if IMAGE_VARIANTS_ASYNC:
+        transaction.on_commit(lambda: _get_executor().submit(_generate_in_worker, *args))
+    else:
+        transaction.on_commit(lambda: generate(*args))
+
+
+def delete_variants(source):
+    """حذف نسخ صورة أصلية حُذفت"""
+    for kind in IMAGE_VARIANTS.values():
+        for name, _, _ in kind:
+            path = variant_name(source, name)
+            if default_storage.exists(path):
+                default_storage.delete(path)
+
+
+def variant_urls(instance, field, variants_field):
+    """{اسم النسخة: رابطها} للصورة الحالية فقط"""
+    image = getattr(instance, field)
+    data = getattr(instance, variants_field) or {}
+    if not image or data.get('source') != image.name:
+        return {}
+    return {name: default_storage.url(v['name']) for name, v in data.get('variants', {}).items()}
+
+
+def srcset(instance, field, variants_field):
+    """قيمة srcset بالعرض (w) من النسخ المتاحة"""
+    image = getattr(instance, field)
+    data = getattr(instance, variants_field) or {}
+    if not image or data.get('source') != image.name:
+        return ''
+    variants = sorted(data.get('variants', {}).values(), key=lambda v: v['width'])
+    return ', '.join(f"{default_storage.url(v['name'])} {v['width']}w" for v in variants)
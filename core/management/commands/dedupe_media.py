@@ -0,0 +1,82 @@
+from collections import Counter
+
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from core import blobs, images
+from core.media import is_content_addressed
+from core.models import MediaBlob
+
+
+class Command(BaseCommand):
+    help = (
+        'تحويل ملفات الوسائط القديمة إلى التخزين المعنون بالمحتوى (ملف واحد لكل '
+        'محتوى) ثم إعادة حساب عدّادات المراجع من الجداول'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='عرض ما سيُحوَّل دون تغيير')
+
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+        converted = freed = 0
+
+        for model, fields in blobs.BLOB_FIELDS.items():
+            for field in fields:
+                default = model._meta.get_field(field).get_default()
+                names = (
+                    model.objects.exclude(**{field: ''}).exclude(**{f'{field}__isnull': True})
+                    .exclude(**{field: default or ''})
+                    .values_list(field, flat=True).distinct()
+                )
+                for name in names.iterator():
+                    if is_content_addressed(name) or not default_storage.exists(name):
+                        continue
+                    size = default_storage.size(name)
+                    converted += 1
+                    if dry_run:
+                        self.stdout.write(f'{model.__name__}.{field}: {name}')
+                        continue
+
+                    with default_storage.open(name, 'rb') as f:
+                        new_name = default_storage.save(name, File(f, name=name))
+                    # update() دون إشارات: العدّادات تُحسب كلها في النهاية
+                    model.objects.filter(**{field: name}).update(**{field: new_name})
+                    default_storage.delete(name)
+                    images.delete_variants(name)
+                    freed += size
+
+        if not dry_run:
+            self.recount()
+        self.stdout.write(self.style.SUCCESS(
+            f'{converted} ملف حُوّل، {freed / 1024 / 1024:.1f} MB من الملفات القديمة حُذفت'
+        ))
+        if converted and not dry_run:
+            self.stdout.write('شغّل generate_image_variants لتوليد نسخ الصور المحوّلة')
+
+    def recount(self):
+        counts = Counter()
+        for model, fields in blobs.BLOB_FIELDS.items():
+            for field in fields:
+                for name in model.objects.values_list(field, flat=True).iterator():
+                    if name and is_content_addressed(name):
+                        counts[name] += 1
+
+        with transaction.atomic():
+            existing = {blob.name: blob for blob in MediaBlob.objects.iterator()}
+            changed = []
+            for name, blob in existing.items():
+                if blob.refcount != counts[name]:
+                    blob.refcount = counts[name]
+                    changed.append(blob)
+            MediaBlob.objects.bulk_update(changed, ['refcount'], batch_size=1000)
+            MediaBlob.objects.bulk_create(
+                [MediaBlob(name=name, refcount=count) for name, count in counts.items() if name not in existing],
+                batch_size=1000,
+            )
+            # ملفات لم يعد يشير إليها شيء
+            orphans = [name for name in existing if not counts[name]]
+            transaction.on_commit(lambda: blobs.delete_unreferenced(orphans))
+        self.stdout.write(f'{len(counts)} ملف معنون مستخدم، {len(orphans)} ملف غير مستخدم حُذف')
@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+from accounts.models import CustomUser
+from core import images
+from posts.models import Post
+
+# النموذج ← (حقل الصورة، حقل النسخ، نوع الصورة)
+TARGETS = [
+    (Post, 'image', 'image_variants', 'post'),
+    (CustomUser, 'profile_image', 'profile_image_variants', 'avatar'),
+]
+
+
+class Command(BaseCommand):
+    help = 'توليد النسخ المصغرة للصور الموجودة التي لم تُولَّد لها بعد'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help='إعادة التوليد حتى للصور التي لها نسخ')
+
+    def handle(self, *args, **options):
+        for model, field, variants_field, kind in TARGETS:
+            rows = model.objects.exclude(**{field: ''}).exclude(**{f'{field}__isnull': True})
+            # الصورة الافتراضية مشتركة بين كل المستخدمين وليست رفعاً (كما في images.schedule)
+            image_field = model._meta.get_field(field)
+            if image_field.has_default():
+                rows = rows.exclude(**{field: image_field.get_default()})
+            done = 0
+            for pk, source, variants in rows.values_list('pk', field, variants_field).iterator():
+                if not options['force'] and (variants or {}).get('source') == source:
+                    continue
+                images.generate(model, pk, field, variants_field, kind)
+                done += 1
+            self.stdout.write(self.style.SUCCESS(f'{model.__name__}: {done} صورة'))
@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from accounts.models import CustomUser
+from core import fulltext, searchcache
+from core.normalize import refill_search_keys
+from posts.models import Comment, Post
+
+
+class Command(BaseCommand):
+    help = (
+        'إعادة حساب مفاتيح البحث الموحّدة (بعد تغيير قواعد core.normalize أو '
+        'كتابة تجاوزت save()) ثم إعادة بناء فهارس FTS5'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        for model in (CustomUser, Post, Comment):
+            updated = refill_search_keys(model, model.SEARCH_KEYS, options['batch_size'])
+            self.stdout.write(f'{model._meta.label}: {updated} مفتاح محدّث')
+
+        if fulltext.supported(connection):
+            fulltext.install(connection)
+            fulltext.rebuild(connection)
+            self.stdout.write(self.style.SUCCESS('أُعيد بناء فهارس البحث'))
+        else:
+            self.stdout.write('FTS5 غير متاح؛ البحث يستخدم المفاتيح مباشرة')
+        # النتائج المحفوظة حُسبت بالمفاتيح والفهارس القديمة
+        searchcache.bump(*searchcache.KINDS)
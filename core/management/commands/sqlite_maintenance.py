@@ -0,0 +1,47 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from core import sqlite
+
+
+class Command(BaseCommand):
+    help = (
+        'صيانة SQLite: تحديث الإحصاءات (PRAGMA optimize أو ANALYZE)، وتفريغ ملف WAL، '
+        'و VACUUM عند الطلب، ومزامنة نسخة القراءة'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default='default')
+        parser.add_argument('--analyze', action='store_true', help='ANALYZE كامل بدلاً من PRAGMA optimize')
+        parser.add_argument('--vacuum', action='store_true', help='إعادة بناء الملف (يقفل قاعدة البيانات)')
+        parser.add_argument('--sync-replica', action='store_true', help='تحديث نسخة القراءة')
+        parser.add_argument(
+            '--interval', type=float, default=0,
+            help='التكرار كل عدد من الثواني (VACUUM في التشغيل الأول فقط)'
+        )
+
+    def handle(self, *args, **options):
+        using = options['database']
+        if connections[using].vendor != 'sqlite':
+            raise CommandError(f'{using} ليست قاعدة SQLite')
+
+        vacuum = options['vacuum']
+        while True:
+            started = time.monotonic()
+            sqlite.optimize(using, analyze=options['analyze'])
+            busy, log, checkpointed = sqlite.checkpoint(using)
+            self.stdout.write(f'WAL: {checkpointed}/{log} صفحة' + (' (مشغول)' if busy else ''))
+            if vacuum:
+                sqlite.vacuum(using)
+                vacuum = False
+                self.stdout.write('VACUUM تم')
+            if options['sync_replica']:
+                path = sqlite.sync_replica(using)
+                self.stdout.write(f'النسخة: {path}')
+            self.stdout.write(self.style.SUCCESS(f'تمت الصيانة في {time.monotonic() - started:.2f} ث'))
+
+            if not options['interval']:
+                return
+            time.sleep(options['interval'])
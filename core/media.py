@@ -0,0 +1,176 @@
+"""
+خدمة ملفات الوسائط
+
+بديل لـ django.views.static.serve يصلح للإنتاج:
+- طلبات Range (جزء واحد) بـ 206 حتى يعمل التقديم في مشغلات الفيديو.
+- ETag و Last-Modified مع 304/412 للطلبات الشرطية.
+- Cache-Control طويل و immutable للملفات المعنونة بمحتواها (اسمها يحوي
+  بصمة sha256)، فلا يعيد المتصفح التحقق منها أبداً.
+- MEDIA_SENDFILE: تسليم إرسال الملف للخادم الأمامي بترويسة X-Sendfile
+  (Apache/lighttpd) أو X-Accel-Redirect (nginx) بدلاً من قراءته في Python.
+- كل الوسائط مرفوعة من المستخدمين وتُخدم من أصل الموقع نفسه: يُعرض
+  مباشرة ما في MEDIA_INLINE_TYPES فقط (صور وفيديو)، وغيره (HTML و SVG
+  وغيرها) يُرسل application/octet-stream كمرفق للتنزيل، فلا يُنفَّذ ملف
+  مرفوع كصفحة من الموقع.
+"""
+import mimetypes
+import os
+import re
+import stat
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import Http404, HttpResponse, StreamingHttpResponse
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, parse_http_date_safe
+from django.views.decorators.http import require_safe
+
+# None أو 'x-sendfile' أو 'x-accel-redirect'
+MEDIA_SENDFILE = getattr(settings, 'MEDIA_SENDFILE', None)
+# موقع internal في nginx يقابل MEDIA_ROOT
+MEDIA_ACCEL_PREFIX = getattr(settings, 'MEDIA_ACCEL_PREFIX', '/protected-media/')
+MEDIA_CACHE_MAX_AGE = getattr(settings, 'MEDIA_CACHE_MAX_AGE', 60 * 60)
+MEDIA_IMMUTABLE_MAX_AGE = 365 * 24 * 60 * 60
+# اسم ملف معنون بمحتواه: بصمة sha256 كاملة في أحد أجزاء المسار
+CONTENT_ADDRESSED_RE = re.compile(r'(^|/)[0-9a-f]{64}(\.[^/]*)?$')
+STREAM_BLOCK_SIZE = 64 * 1024
+# أنواع تُعرض في المتصفح؛ SVG ليس منها لأنه قد يحوي سكربتاً
+MEDIA_INLINE_TYPES = getattr(settings, 'MEDIA_INLINE_TYPES', frozenset({
+    'image/jpeg', 'image/png', 'image/gif', 'image/webp', 'image/avif',
+    'video/mp4', 'video/webm', 'video/quicktime', 'video/ogg', 'video/x-m4v',
+}))
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def is_content_addressed(path):
+    return bool(CONTENT_ADDRESSED_RE.search(path))
+
+
+def parse_range(header, size):
+    """
+    (البداية، الطول) لمدى بايتات واحد، أو None لتجاهل الترويسة
+    (غياب أو صيغة غير مدعومة مثل المدى المتعدد). يرفع ValueError إن
+    كان المدى خارج الملف.
+    """
+    match = RANGE_RE.match(header.strip()) if header else None
+    if not match or match.groups() == ('', ''):
+        return None
+    first, last = match.groups()
+    if first:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+        if start >= size or end < start:
+            raise ValueError(header)
+    else:
+        # bytes=-n: آخر n بايت
+        suffix = int(last)
+        if not suffix or not size:
+            raise ValueError(header)
+        start, end = max(size - suffix, 0), size - 1
+    return start, end - start + 1
+
+
+def _if_range_matches(request, etag, mtime):
+    value = request.headers.get('If-Range')
+    if not value:
+        return True
+    if value.startswith(('"', 'W/')):
+        return value == etag
+    date = parse_http_date_safe(value)
+    return date is not None and int(mtime) <= date
+
+
+def _read_range(path, start, length):
+    with open(path, 'rb') as f:
+        f.seek(start)
+        while length > 0:
+            block = f.read(min(STREAM_BLOCK_SIZE, length))
+            if not block:
+                break
+            length -= len(block)
+            yield block
+
+
+def media_type(path):
+    """(نوع المحتوى، عرض مباشر؟) من الامتداد مع قائمة الأنواع المسموحة"""
+    content_type, encoding = mimetypes.guess_type(path)
+    # الملف المضغوط (.gz) يفكّه المتصفح ثم يعرضه بنوعه الأصلي
+    if content_type in MEDIA_INLINE_TYPES and encoding is None:
+        return content_type, True
+    return 'application/octet-stream', False
+
+
+def _sendfile_response(path, relative_path):
+    response = HttpResponse()
+    if MEDIA_SENDFILE == 'x-accel-redirect':
+        response['X-Accel-Redirect'] = MEDIA_ACCEL_PREFIX + relative_path
+    else:
+        response['X-Sendfile'] = path
+    return response
+
+
+@require_safe
+def serve_media(request, path):
+    """خدمة ملف من MEDIA_ROOT مع دعم Range والطلبات الشرطية"""
+    try:
+        full_path = safe_join(settings.MEDIA_ROOT, path)
+        st = os.stat(full_path)
+    except (SuspiciousFileOperation, ValueError, OSError):
+        raise Http404('الملف غير موجود')
+    if not stat.S_ISREG(st.st_mode):
+        raise Http404('الملف غير موجود')
+
+    size, mtime = st.st_size, st.st_mtime
+    # ETag قوي (مطلوب لـ If-Range) من وقت التعديل والحجم، دون قراءة الملف
+    etag = f'"{st.st_mtime_ns:x}-{size:x}"'
+    if is_content_addressed(path):
+        cache_control = f'public, max-age={MEDIA_IMMUTABLE_MAX_AGE}, immutable'
+    else:
+        cache_control = f'public, max-age={MEDIA_CACHE_MAX_AGE}'
+
+    content_type, inline = media_type(full_path)
+
+    def with_headers(response):
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(mtime)
+        response['Cache-Control'] = cache_control
+        response['Accept-Ranges'] = 'bytes'
+        # لا سكربت ولا موارد إن فُتح الملف مباشرة في المتصفح
+        response['Content-Security-Policy'] = "default-src 'none'; sandbox"
+        if not inline:
+            response['Content-Disposition'] = 'attachment'
+        return response
+
+    not_modified = get_conditional_response(request, etag=etag, last_modified=int(mtime))
+    if not_modified is not None:
+        return with_headers(not_modified)
+
+    if MEDIA_SENDFILE:
+        # الخادم الأمامي يتولى Range بنفسه، ونوع المحتوى من القائمة لا من امتداده
+        response = _sendfile_response(full_path, path.replace(os.sep, '/'))
+        response['Content-Type'] = content_type
+        return with_headers(response)
+
+    start, length, status = 0, size, 200
+    if _if_range_matches(request, etag, mtime):
+        try:
+            byte_range = parse_range(request.headers.get('Range'), size)
+        except ValueError:
+            response = with_headers(HttpResponse(status=416))
+            response['Content-Range'] = f'bytes */{size}'
+            return response
+        if byte_range:
+            (start, length), status = byte_range, 206
+
+    if request.method == 'HEAD':
+        response = HttpResponse(content_type=content_type, status=status)
+    else:
+        response = StreamingHttpResponse(
+            _read_range(full_path, start, length), content_type=content_type, status=status
+        )
+    response['Content-Length'] = length
+    if status == 206:
+        response['Content-Range'] = f'bytes {start}-{start + length - 1}/{size}'
+    return with_headers(response)
@@ -1,3 +1,11 @@
 from django.db import models
 
-# Create your models here.
+
+class MediaBlob(models.Model):
+    """ملف وسائط معنون بمحتواه (انظر core.storage) وعدد الحقول التي تشير إليه"""
+    name = models.CharField(max_length=255, unique=True)
+    refcount = models.IntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.name} ({self.refcount})"
@@ -0,0 +1,112 @@
+"""
+توحيد النص للبحث (مفاتيح البحث)
+
+search_key تُطبّق على النص عند الكتابة (أعمدة *_key في المستخدمين والمنشورات
+والتعليقات) وعلى نص البحث، فتتطابق الكلمات التي تختلف فقط في:
+- التشكيل والتطويل (مُحَمَّد، محـــمد ← محمد)
+- صور الألف والهمزة (أ إ آ ٱ ← ا، ؤ ← و، ئ ← ي)
+- التاء المربوطة والألف المقصورة (ة ← ه، ى ← ي)
+- الأرقام الهندية (٣ ← 3) وحالة الأحرف وعلامات الحروف اللاتينية (é ← e)
+
+التحويل حرفاً بحرف، فيُعرف لكل حرف من المفتاح موضعه في النص الأصلي
+(normalize_with_offsets) لإبراز المطابقات في النص الأصلي.
+
+تغيير هذه القواعد يستلزم إعادة حساب المفاتيح: manage.py rebuild_search_index.
+"""
+import unicodedata
+from functools import lru_cache
+
+_LETTERS = {
+    'ٱ': 'ا',
+    'ة': 'ه',
+    'ى': 'ي',
+    'ی': 'ي',  # الياء الفارسية
+    'ک': 'ك',
+    'ـ': '',  # التطويل
+}
+
+
+@lru_cache(maxsize=8192)
+def _fold(char):
+    if char in _LETTERS:
+        return _LETTERS[char]
+    digit = unicodedata.decimal(char, None)
+    if digit is not None:
+        return str(digit)
+    # التفكيك يفصل الهمزة والمد والعلامات اللاتينية كعلامات غير متباعدة (Mn) تُحذف
+    decomposed = unicodedata.normalize('NFKD', char)
+    base = ''.join(c for c in decomposed if unicodedata.category(c) != 'Mn')
+    return ''.join(_LETTERS.get(c, c) for c in base).casefold()
+
+
+def search_key(text):
+    """النص موحّداً للبحث"""
+    return ''.join(_fold(char) for char in text or '')
+
+
+def normalize_with_offsets(text):
+    """(المفتاح، المواضع) حيث المواضع[i] موضع الحرف i من المفتاح في text"""
+    key, positions = [], []
+    for i, char in enumerate(text or ''):
+        folded = _fold(char)
+        key.append(folded)
+        positions.extend([i] * len(folded))
+    return ''.join(key), positions
+
+
+def original_span(text, positions, start, end):
+    """مقابل [start:end) من المفتاح في النص الأصلي، مع علامات التشكيل التالية له"""
+    original_start = positions[start]
+    original_end = positions[end - 1] + 1
+    while original_end < len(text) and not _fold(text[original_end]):
+        original_end += 1
+    return original_start, original_end
+
+
+def _joined_key(obj, fields):
+    return search_key(' '.join(value for value in (getattr(obj, field) for field in fields) if value))
+
+
+def fill_search_keys(instance, update_fields=None):
+    """
+    تعبئة أعمدة المفاتيح من حقولها حسب instance.SEARCH_KEYS
+    ({عمود المفتاح: (الحقول)}) قبل الحفظ. يُرجع update_fields مع المفاتيح
+    التي تغيّرت حقولها (أو None).
+    """
+    deferred = instance.get_deferred_fields()
+    keys = []
+    for key_field, sources in instance.SEARCH_KEYS.items():
+        if deferred.intersection(sources):
+            continue
+        if update_fields is not None and not set(sources).intersection(update_fields):
+            continue
+        setattr(instance, key_field, _joined_key(instance, sources))
+        keys.append(key_field)
+    if update_fields is None:
+        return None
+    return list(update_fields) + [key for key in keys if key not in update_fields]
+
+
+def refill_search_keys(model, search_keys, batch_size=1000):
+    """إعادة حساب المفاتيح لكل صفوف model (للترحيلات وبعد تغيير القواعد)؛ يُرجع عدد المعدّل"""
+    sources = sorted({field for fields in search_keys.values() for field in fields})
+    queryset = model._default_manager.order_by('pk').only('pk', *sources, *search_keys)
+    changed = []
+    updated = 0
+    for obj in queryset.iterator(chunk_size=batch_size):
+        dirty = False
+        for key_field, fields in search_keys.items():
+            value = _joined_key(obj, fields)
+            if getattr(obj, key_field) != value:
+                setattr(obj, key_field, value)
+                dirty = True
+        if dirty:
+            changed.append(obj)
+        if len(changed) >= batch_size:
+            model._default_manager.bulk_update(changed, list(search_keys))
+            updated += len(changed)
+            changed = []
+    if changed:
+        model._default_manager.bulk_update(changed, list(search_keys))
+        updated += len(changed)
+    return updated
@@ -0,0 +1,163 @@
+import base64
+import binascii
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+def encode_cursor(key):
+    """تحويل المفتاح (created_at, id) إلى مؤشر نصي معتم"""
+    created_at, pk = key
+    raw = f'{created_at.isoformat()}|{pk}'.encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """قراءة مؤشر معتم وإرجاع المفتاح (created_at, id)"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        created_at, pk = raw.rsplit('|', 1)
+        created_at = parse_datetime(created_at)
+        pk = int(pk)
+    except (binascii.Error, UnicodeDecodeError, ValueError, TypeError):
+        raise NotFound('مؤشر الصفحة غير صالح')
+
+    if created_at is None:
+        raise NotFound('مؤشر الصفحة غير صالح')
+    return created_at, pk
+
+
+def keyset_q(before=None, after=None, created_field='created_at', id_field='id'):
+    """
+    شرط المفتاح المركب (created_at, id):
+    before يعني الأقدم من المؤشر، و after يعني الأحدث منه.
+    """
+    q = Q()
+    if before is not None:
+        created_at, pk = before
+        q &= Q(**{f'{created_field}__lt': created_at}) | Q(**{created_field: created_at, f'{id_field}__lt': pk})
+    if after is not None:
+        created_at, pk = after
+        q &= Q(**{f'{created_field}__gt': created_at}) | Q(**{created_field: created_at, f'{id_field}__gt': pk})
+    return q
+
+
+def keyset_slice(queryset, limit, before=None, after=None):
+    """
+    أخذ limit عنصراً من queryset بالمفتاح المركب دون OFFSET أو COUNT.
+
+    عند تحديد after وحده تُرجع أقدم العناصر الأحدث من المؤشر
+    (بلا فجوات) ثم تُعكس لتبقى النتيجة من الأحدث إلى الأقدم.
+    """
+    queryset = queryset.filter(keyset_q(before, after))
+    if after is not None and before is None:
+        return list(queryset.order_by('created_at', 'id')[:limit])[::-1]
+    return list(queryset.order_by('-created_at', '-id')[:limit])
+
+
+class KeysetPagination(BasePagination):
+    """
+    تصفيح بالمؤشر على (created_at, id) للقوائم المرتبة من الأحدث.
+
+    - cursor أو until: العناصر الأقدم من المؤشر (الصفحة التالية)
+    - since: العناصر الأحدث من المؤشر فقط (للتحديث التزايدي)
+
+    يقبل queryset أو أي مصدر يوفر keyset_page(limit, before, after)
+    مثل HomeTimeline.
+    """
+    page_size = api_settings.PAGE_SIZE or 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+    until_query_param = 'until'
+    since_query_param = 'since'
+    # معاملات تُحذف من رابط "الأحدث"
+    since_replaces_params = ('cursor', 'until')
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return max(1, min(size, self.max_page_size))
+
+    def _get_cursor(self, request, param):
+        value = request.query_params.get(param)
+        return decode_cursor(value) if value else None
+
+    def get_since(self, request):
+        """مفتاح العناصر الأحدث المطلوبة (أو None)"""
+        return self._get_cursor(request, self.since_query_param)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.limit = self.get_page_size(request)
+        self.before = (
+            self._get_cursor(request, self.cursor_query_param) or
+            self._get_cursor(request, self.until_query_param)
+        )
+        self.after = self.get_since(request)
+
+        # نطلب عنصراً إضافياً لمعرفة وجود صفحة أخرى دون COUNT
+        if hasattr(queryset, 'keyset_page'):
+            rows = queryset.keyset_page(self.limit + 1, before=self.before, after=self.after)
+        else:
+            rows = keyset_slice(queryset, self.limit + 1, before=self.before, after=self.after)
+
+        self.has_more = len(rows) > self.limit
+        if self.after is not None and self.before is None:
+            # الاتجاه تصاعدي: العنصر الزائد هو الأحدث
+            self.page = rows[-self.limit:] if self.has_more else rows
+        else:
+            self.page = rows[:self.limit]
+        return self.page
+
+    def _key(self, obj):
+        return obj.created_at, obj.pk
+
+    def get_next_link(self):
+        """الصفحة الأقدم"""
+        newer_only = self.after is not None and self.before is None
+        if not self.page or not self.has_more or newer_only:
+            return None
+
+        url = self.request.build_absolute_uri()
+        url = remove_query_param(url, self.until_query_param)
+        return replace_query_param(url, self.cursor_query_param, encode_cursor(self._key(self.page[-1])))
+
+    def get_previous_link(self):
+        """العناصر الأحدث من هذه الصفحة"""
+        if self.page:
+            since = encode_cursor(self._key(self.page[0]))
+        elif self.after is not None:
+            since = encode_cursor(self.after)
+        else:
+            return None
+
+        url = self.request.build_absolute_uri()
+        for param in self.since_replaces_params:
+            url = remove_query_param(url, param)
+        return replace_query_param(url, self.since_query_param, since)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
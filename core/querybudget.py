@@ -0,0 +1,152 @@
+"""
+ميزانية الاستعلامات لكل view
+
+- query_budget: مزخرف يعلن أقصى عدد استعلامات مسموح به للـ view
+- QueryBudgetMiddleware: يسجل عدد الاستعلامات وزمنها والمكرر منها لكل طلب،
+  ويحذر أو يرفع استثناء عند تجاوز الميزانية (QUERY_BUDGET_MODE)
+- assert_query_budget: أداة للاختبارات تتحقق من الميزانية المعلنة
+"""
+import logging
+import time
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger('querybudget')
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+class QueryBudget:
+    def __init__(self, max_queries, max_similar=None):
+        self.max_queries = max_queries
+        # أقصى تكرار لنفس SQL بمعاملات مختلفة (مؤشر N+1)
+        self.max_similar = max_similar
+
+    def violations(self, recorder):
+        problems = []
+        if recorder.count > self.max_queries:
+            problems.append(f'{recorder.count} استعلام (الحد {self.max_queries})')
+        if self.max_similar is not None:
+            for sql, times in recorder.similar():
+                if times > self.max_similar:
+                    problems.append(f'{times}× {sql[:120]}')
+        return problems
+
+
+def query_budget(max_queries, max_similar=None):
+    """إعلان ميزانية الاستعلامات لدالة view أو لصنف view"""
+    def decorator(view):
+        view.query_budget = QueryBudget(max_queries, max_similar)
+        return view
+    return decorator
+
+
+def get_query_budget(view):
+    budget = getattr(view, 'query_budget', None)
+    if budget is None:
+        # as_view() تعيد دالة تحمل الصنف الأصلي في view_class
+        budget = getattr(getattr(view, 'view_class', None), 'query_budget', None)
+    return budget
+
+
+class QueryRecorder:
+    """يُركّب على الاتصالات عبر execute_wrapper ويسجل كل استعلام"""
+
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.monotonic()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append((sql, repr(params), time.monotonic() - start))
+
+    @property
+    def count(self):
+        return len(self.queries)
+
+    @property
+    def duration(self):
+        return sum(duration for _, _, duration in self.queries)
+
+    def duplicates(self):
+        """نفس SQL بنفس المعاملات أكثر من مرة"""
+        counts = Counter((sql, params) for sql, params, _ in self.queries)
+        return [(sql, times) for (sql, _), times in counts.most_common() if times > 1]
+
+    def similar(self):
+        """نفس SQL بمعاملات مختلفة أكثر من مرة"""
+        counts = Counter(sql for sql, _, _ in self.queries)
+        return [(sql, times) for sql, times in counts.most_common() if times > 1]
+
+    @contextmanager
+    def record(self):
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(self))
+            yield self
+
+
+class QueryBudgetMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.mode = getattr(settings, 'QUERY_BUDGET_MODE', 'warn')
+
+    def __call__(self, request):
+        if self.mode == 'off':
+            return self.get_response(request)
+
+        recorder = QueryRecorder()
+        with recorder.record():
+            response = self.get_response(request)
+
+        if settings.DEBUG:
+            response['X-DB-Queries'] = recorder.count
+            response['X-DB-Time'] = f'{recorder.duration * 1000:.1f}ms'
+
+        view_name = getattr(request, 'query_budget_view', request.path)
+        duplicates = recorder.duplicates()
+        if duplicates:
+            logger.info('%s: %d استعلام مكرر، أكثرها: %s', view_name, len(duplicates), duplicates[0][0][:120])
+
+        budget = getattr(request, 'query_budget', None)
+        problems = budget.violations(recorder) if budget else []
+        if problems:
+            message = f'تجاوز ميزانية الاستعلامات في {view_name}: ' + '؛ '.join(problems)
+            if self.mode == 'raise':
+                raise QueryBudgetExceeded(message)
+            logger.warning(message)
+
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request.query_budget = get_query_budget(view_func)
+        request.query_budget_view = getattr(view_func, '__qualname__', request.path)
+
+
+@contextmanager
+def assert_query_budget(view=None, max_queries=None, max_similar=None):
+    """
+    للاختبارات: التحقق من أن الكود داخل الكتلة ضمن ميزانية view
+    المعلنة بـ query_budget (أو ضمن max_queries الممرر مباشرة).
+    """
+    budget = get_query_budget(view) if view is not None else None
+    if max_queries is not None:
+        budget = QueryBudget(max_queries, max_similar)
+    if budget is None:
+        raise ValueError('لا توجد ميزانية استعلامات معلنة لهذا الـ view')
+
+    recorder = QueryRecorder()
+    with recorder.record():
+        yield recorder
+
+    problems = budget.violations(recorder)
+    if problems:
+        queries = '\n'.join(sql for sql, _, _ in recorder.queries)
+        raise AssertionError('تجاوز ميزانية الاستعلامات: ' + '؛ '.join(problems) + '\n' + queries)
@@ -0,0 +1,122 @@
+"""
+توجيه قراءات الصفحات القرائية إلى نسخة SQLite المتزامنة
+
+الصفحات المعلّمة بـ use_replica (الخط الزمني، البحث، الملفات الشخصية)
+تقرأ من نسخة القراءة بعد المصادقة، فلا تنتظر أقفال الكتابة على الملف
+الرئيسي. الكتابة دائماً إلى default، وكذلك القراءة داخل معاملة أو إن لم
+توجد النسخة بعد.
+
+النسخة متأخرة حتى المزامنة التالية، فمن كتب شيئاً (طلب غير آمن) يُثبَّت
+على default مدة REPLICA_PIN_SECONDS بكوكي حتى يرى ما كتبه.
+"""
+import os
+from contextvars import ContextVar
+from functools import wraps
+
+from django.conf import settings
+from django.db import connections
+
+from .sqlite import REPLICA_ALIAS, replica_path
+
+# أطول من فترة مزامنة النسخة
+REPLICA_PIN_SECONDS = getattr(settings, 'REPLICA_PIN_SECONDS', 120)
+REPLICA_PIN_COOKIE = 'replica_pin'
+
+_replica_reads = ContextVar('replica_reads', default=False)
+_replica_ready = False
+
+
+def replica_ready():
+    """وجود ملف النسخة (يُفحص حتى يظهر ثم يُحفظ)"""
+    global _replica_ready
+    if not _replica_ready and replica_path():
+        # من الاتصال لا من الإعدادات: في الاختبارات تكون النسخة مرآة لقاعدة الاختبار
+        _replica_ready = os.path.exists(connections[REPLICA_ALIAS].settings_dict['NAME'])
+    return _replica_ready
+
+
+def _wants_replica(request):
+    return REPLICA_PIN_COOKIE not in request.COOKIES and replica_ready()
+
+
+def replica_generation():
+    """
+    معرّف نسخة القراءة الحالية إن كانت القراءة منها، للإضافة إلى ETag: إصدار
+    الخط الزمني في الذاكرة المؤقتة يسبق النسخة، فلا يُحفظ عند العميل محتوى
+    قديم باسم الإصدار الجديد. '' عند القراءة من default.
+    """
+    if not _replica_reads.get():
+        return ''
+    try:
+        return f'r{os.stat(connections[REPLICA_ALIAS].settings_dict["NAME"]).st_mtime_ns:x}'
+    except OSError:
+        return ''
+
+
+class ReplicaRouter:
+
+    def db_for_read(self, model, **hints):
+        if _replica_reads.get() and not connections['default'].in_atomic_block:
+            return REPLICA_ALIAS
+        # صراحةً: الكائنات المقروءة من النسخة لا تجرّ ما بعدها إليها
+        return 'default'
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, **hints):
+        # النسخة تُنشأ بالنسخ من default لا بالترحيلات
+        return db != REPLICA_ALIAS
+
+
+def use_replica(view):
+    """
+    قراءات الـ view من النسخة بعد المصادقة. للدوال يُحمّل request.user أولاً
+    من default، ولأصناف DRF تُفعَّل النسخة بعد initial() (المصادقة والصلاحيات).
+    """
+    if isinstance(view, type):
+        dispatch, initial = view.dispatch, view.initial
+
+        @wraps(dispatch)
+        def wrapped_dispatch(self, request, *args, **kwargs):
+            token = _replica_reads.set(False)
+            try:
+                return dispatch(self, request, *args, **kwargs)
+            finally:
+                _replica_reads.reset(token)
+
+        @wraps(initial)
+        def wrapped_initial(self, request, *args, **kwargs):
+            initial(self, request, *args, **kwargs)
+            _replica_reads.set(_wants_replica(request))
+
+        view.dispatch, view.initial = wrapped_dispatch, wrapped_initial
+        return view
+
+    @wraps(view)
+    def wrapped(request, *args, **kwargs):
+        user = getattr(request, 'user', None)
+        if user is not None:
+            user.is_authenticated  # تحميل المستخدم من الجلسة على default
+        token = _replica_reads.set(_wants_replica(request))
+        try:
+            return view(request, *args, **kwargs)
+        finally:
+            _replica_reads.reset(token)
+    return wrapped
+
+
+class ReplicaPinMiddleware:
+    """تثبيت من كتب للتو على default حتى تلحق النسخة بما كتبه"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        if request.method not in ('GET', 'HEAD', 'OPTIONS') and response.status_code < 400:
+            response.set_cookie(REPLICA_PIN_COOKIE, '1', max_age=REPLICA_PIN_SECONDS, httponly=True, samesite='Lax')
+        return response
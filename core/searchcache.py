@@ -0,0 +1,114 @@
+"""
+ذاكرة مؤقتة لنتائج البحث بإصدارات لكل نوع
+
+نتيجة كل صفحة (معرّفات الكائنات بترتيب الصلة، أو عدد النتائج) تُحفظ
+بمفتاح من النوع ونص البحث بعد التوحيد وحدود الصفحة وإصدار النوع: رمز
+في الذاكرة المؤقتة تغيّره كل كتابة على المنشورات أو التعليقات أو
+المستخدمين بعد تأكيد المعاملة (core.signals والإدخال المجمّع)، فلا تصل
+الطلبات التالية إلى النتائج القديمة دون انتظار انتهاء مدتها.
+SEARCH_CACHE_SECONDS حد لحجم الذاكرة لا للتحديث.
+
+تُحفظ المعرّفات فقط: الكائنات وحالة المشاهد والمقتطفات تُحمّل لكل طلب.
+
+نتائج نسخة القراءة تُحفظ بمفتاح منفصل يتضمن وقت تعديل ملفها: النسخة
+متأخرة عن تغيير الإصدار، فنتيجتها تبقى حتى المزامنة التالية فقط.
+
+عند الفقد يحسب النتيجة طلب واحد (قفل بـ cache.add) والبقية تنتظر ظهورها
+حتى SEARCH_CACHE_WAIT ثانية ثم تحسبها بنفسها. القفل مشترك بين العمليات
+فقط مع ذاكرة مؤقتة مشتركة (Redis أو Memcached).
+"""
+import hashlib
+import os
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connection as default_connection
+
+KINDS = ('post', 'comment', 'user')
+
+SEARCH_CACHE_SECONDS = getattr(settings, 'SEARCH_CACHE_SECONDS', 600)
+# أطول من أبطأ بحث متوقع: بعدها يُعدّ صاحب القفل متعطلاً
+SEARCH_CACHE_LOCK_SECONDS = getattr(settings, 'SEARCH_CACHE_LOCK_SECONDS', 10)
+SEARCH_CACHE_WAIT = getattr(settings, 'SEARCH_CACHE_WAIT', 2.0)
+SEARCH_CACHE_POLL = 0.05
+
+
+def _generation_key(kind):
+    return f'search:gen:{kind}'
+
+
+def bump(*kinds):
+    """تغيير إصدار نتائج الأنواع المتأثرة بعملية كتابة"""
+    token = uuid.uuid4().hex[:12]
+    cache.set_many(dict.fromkeys([_generation_key(kind) for kind in kinds], token), timeout=None)
+
+
+def generation(kind):
+    key = _generation_key(kind)
+    token = cache.get(key)
+    if token is None:
+        cache.add(key, uuid.uuid4().hex[:12], timeout=None)
+        token = cache.get(key)
+    return token
+
+
+def cacheable(connection=default_connection):
+    """
+    داخل معاملة قد ترى القراءة كتابات لم تُؤكَّد (ولا تُغيّر الإصدار إن
+    أُلغيت)، فلا تُحفظ نتائجها.
+    """
+    return not connection.in_atomic_block
+
+
+def _key(kind, parts):
+    raw = '|'.join(str(part) for part in parts)
+    return f'search:{kind}:{generation(kind)}:{hashlib.md5(raw.encode()).hexdigest()}'
+
+
+def _source(connection):
+    """مصدر النتائج: default، أو النسخة ووقت آخر مزامنة لها"""
+    if connection.alias == DEFAULT_DB_ALIAS:
+        return ()
+    try:
+        synced = os.path.getmtime(connection.settings_dict['NAME'])
+    except (OSError, TypeError):
+        synced = None
+    return (connection.alias, synced)
+
+
+def get_or_compute(kind, parts, compute, connection=default_connection):
+    """نتيجة compute() المحفوظة لـ (النوع، parts) في إصدار النوع الحالي"""
+    if not cacheable(connection):
+        return compute()
+    key = _key(kind, (*parts, *_source(connection)))
+    value = cache.get(key)
+    if value is not None:
+        return value
+
+    lock = f'{key}:lock'
+    if not cache.add(lock, 1, SEARCH_CACHE_LOCK_SECONDS):
+        value = _wait(key)
+        if value is not None:
+            return value
+        # صاحب القفل بطيء أو تعطل: الحساب دون انتظار أطول
+        value = compute()
+        cache.set(key, value, SEARCH_CACHE_SECONDS)
+        return value
+    try:
+        value = compute()
+        cache.set(key, value, SEARCH_CACHE_SECONDS)
+    finally:
+        cache.delete(lock)
+    return value
+
+
+def _wait(key):
+    deadline = time.monotonic() + SEARCH_CACHE_WAIT
+    while time.monotonic() < deadline:
+        time.sleep(SEARCH_CACHE_POLL)
+        value = cache.get(key)
+        if value is not None:
+            return value
+    return None
@@ -1,8 +1,32 @@
 from rest_framework import serializers
 from rest_framework.authtoken.models import Token
 from accounts.models import CustomUser, UserSettings
-from posts.models import Post, Comment, Like
+from posts import counters, uploads
+from posts.models import Post, Comment, Like, UploadSession
 from friends.models import Friendship, Follow
+from posts.threads import attach_threads, iter_thread
+from . import images
+from .viewer import get_viewer_state
+
+
+class ViewerStateListSerializer(serializers.ListSerializer):
+    """يحمّل العدّادات المعلّقة وحالة المشاهد لكل عناصر الصفحة قبل تمثيلها"""
+    
+    def to_representation(self, data):
+        items = list(data.all() if hasattr(data, 'all') else data)
+        if hasattr(self.child, 'merge_counters'):
+            self.child.merge_counters(items)
+        state = get_viewer_state(self.context)
+        if state is not None:
+            self.child.prime_viewer_state(state, items)
+        return super().to_representation(items)
+
+def _absolute_urls(context, urls):
+    """روابط كاملة للنسخ المصغرة كما يفعل DRF مع حقول الملفات"""
+    request = context.get('request')
+    if request is None:
+        return urls
+    return {name: request.build_absolute_uri(url) for name, url in urls.items()}
 
 # تسجيل User
 class RegisterSerializer(serializers.ModelSerializer):
@@ -48,28 +72,33 @@ class UserSerializer(serializers.ModelSerializer):
     settings = UserSettingsSerializer(read_only=True)
     is_following = serializers.SerializerMethodField()
     is_followed_by = serializers.SerializerMethodField()
+    profile_image_variants = serializers.SerializerMethodField()
     
     class Meta:
         model = CustomUser
         fields = [
             'id', 'username', 'email', 'first_name', 'last_name',
-            'bio', 'location', 'website', 'profile_image', 'cover_image',
+            'bio', 'location', 'website', 'profile_image', 'profile_image_variants', 'cover_image',
             'followers_count', 'following_count', 'is_private',
             'created_at', 'settings', 'is_following', 'is_followed_by'
         ]
         read_only_fields = ['followers_count', 'following_count', 'created_at']
+        list_serializer_class = ViewerStateListSerializer
+    
+    @staticmethod
+    def prime_viewer_state(state, users):
+        state.prime(users=users)
+    
+    def get_profile_image_variants(self, obj):
+        return _absolute_urls(self.context, images.variant_urls(obj, 'profile_image', 'profile_image_variants'))
     
     def get_is_following(self, obj):
-        request = self.context.get('request')
-        if request and request.user.is_authenticated:
-            return Follow.objects.filter(follower=request.user, following=obj).exists()
-        return False
+        state = get_viewer_state(self.context)
+        return state.is_following(obj) if state else False
     
     def get_is_followed_by(self, obj):
-        request = self.context.get('request')
-        if request and request.user.is_authenticated:
-            return Follow.objects.filter(follower=obj, following=request.user).exists()
-        return False
+        state = get_viewer_state(self.context)
+        return state.is_followed_by(obj) if state else False
 
 # منشور مختصر (للقوائم)
 class PostListSerializer(serializers.ModelSerializer):
@@ -77,19 +106,37 @@ class PostListSerializer(serializers.ModelSerializer):
     likes_count = serializers.IntegerField(read_only=True)
     comments_count = serializers.IntegerField(read_only=True)
     liked = serializers.SerializerMethodField()
+    image_variants = serializers.SerializerMethodField()
+    # مقتطف HTML من نتائج البحث فقط؛ يُحذف الحقل خارجها
+    snippet = serializers.CharField(read_only=True)
     
     class Meta:
         model = Post
         fields = [
-            'id', 'user', 'content', 'post_type', 'image', 'video',
-            'likes_count', 'comments_count', 'created_at', 'is_edited', 'liked'
+            'id', 'user', 'content', 'post_type', 'image', 'image_variants', 'video',
+            'likes_count', 'comments_count', 'created_at', 'is_edited', 'liked', 'snippet'
         ]
+        list_serializer_class = ViewerStateListSerializer
+    
+    @staticmethod
+    def prime_viewer_state(state, posts):
+        state.prime(posts=posts, users=[post.user for post in posts])
+    
+    @staticmethod
+    def merge_counters(posts):
+        counters.merge_pending(posts)
+    
+    def to_representation(self, instance):
+        # لا استعلام إضافي إذا دمجت القائمة عدّادات الصفحة مسبقاً
+        counters.merge_pending([instance])
+        return super().to_representation(instance)
     
     def get_liked(self, obj):
-        request = self.context.get('request')
-        if request and request.user.is_authenticated:
-            return Like.objects.filter(post=obj, user=request.user).exists()
-        return False
+        state = get_viewer_state(self.context)
+        return state.has_liked_post(obj) if state else False
+    
+    def get_image_variants(self, obj):
+        return _absolute_urls(self.context, images.variant_urls(obj, 'image', 'image_variants'))
 
 # منشور كامل
 class PostDetailSerializer(PostListSerializer):
@@ -99,7 +146,7 @@ class PostDetailSerializer(PostListSerializer):
         fields = PostListSerializer.Meta.fields + ['updated_at', 'comments']
     
     def get_comments(self, obj):
-        comments = Comment.objects.filter(post=obj, parent=None)[:10]
+        comments = Comment.objects.filter(post=obj, parent=None).select_related('user__user_settings').order_by('path')[:10]
         return CommentSerializer(comments, many=True, context=self.context).data
 
 # إنشاء منشور
@@ -108,33 +155,107 @@ class PostCreateSerializer(serializers.ModelSerializer):
         model = Post
         fields = ['content', 'image', 'video', 'post_type']
     
+    def validate_video(self, video):
+        if video is not None:
+            try:
+                uploads.check_video_file(video)
+            except uploads.UploadError as e:
+                raise serializers.ValidationError(str(e))
+        return video
+    
     def create(self, validated_data):
         validated_data['user'] = self.context['request'].user
         return super().create(validated_data)
 
+# جلسة رفع فيديو على أجزاء
+class UploadSessionSerializer(serializers.ModelSerializer):
+    post = serializers.PrimaryKeyRelatedField(queryset=Post.objects.filter(is_deleted=False), required=False)
+    upload_url = serializers.HyperlinkedIdentityField(view_name='upload-detail')
+    
+    class Meta:
+        model = UploadSession
+        fields = [
+            'id', 'upload_url', 'post', 'filename', 'content_type', 'size',
+            'received', 'created_at', 'completed_at'
+        ]
+        read_only_fields = ['received', 'created_at', 'completed_at']
+    
+    def validate_filename(self, value):
+        # الاسم فقط دون أي مسار يرسله العميل
+        value = value.replace('\\', '/').rsplit('/', 1)[-1]
+        if value in ('', '.', '..'):
+            raise serializers.ValidationError('اسم ملف غير صالح')
+        return value
+    
+    def validate_content_type(self, value):
+        if not value.startswith('video/'):
+            raise serializers.ValidationError('يُقبل الفيديو فقط')
+        return value
+    
+    def validate(self, attrs):
+        # الامتداد من قائمة الفيديو المقبولة ومطابق للنوع المُعلن
+        try:
+            uploads.check_video_type(attrs['filename'], attrs['content_type'])
+        except uploads.UploadError as e:
+            raise serializers.ValidationError({'filename': str(e)})
+        return attrs
+    
+    def validate_size(self, value):
+        if not 0 < value <= uploads.VIDEO_UPLOAD_MAX_SIZE:
+            raise serializers.ValidationError(f'الحجم الأقصى {uploads.VIDEO_UPLOAD_MAX_SIZE} بايت')
+        return value
+    
+    def validate_post(self, post):
+        if not post.can_edit(self.context['request'].user):
+            raise serializers.ValidationError('ليس لديك صلاحية تعديل هذا المنشور')
+        return post
+
+# قائمة تعليقات: تُحمّل ردود الصفحة كاملة باستعلام واحد قبل التمثيل
+class CommentListSerializer(ViewerStateListSerializer):
+    
+    def to_representation(self, data):
+        items = list(data.all() if hasattr(data, 'all') else data)
+        attach_threads(items)
+        return super().to_representation(items)
+
 # تعليق
 class CommentSerializer(serializers.ModelSerializer):
     user = UserSerializer(read_only=True)
     replies = serializers.SerializerMethodField()
     liked = serializers.SerializerMethodField()
+    snippet = serializers.CharField(read_only=True)
     
     class Meta:
         model = Comment
         fields = [
-            'id', 'user', 'content', 'parent', 'likes_count',
-            'created_at', 'updated_at', 'is_edited', 'replies', 'liked'
+            'id', 'user', 'content', 'parent', 'depth', 'likes_count',
+            'created_at', 'updated_at', 'is_edited', 'replies', 'liked', 'snippet'
         ]
         read_only_fields = ['created_at', 'updated_at', 'is_edited']
+        list_serializer_class = CommentListSerializer
+    
+    @staticmethod
+    def prime_viewer_state(state, comments):
+        # التعليقات مع كل ردودها المحمّلة في الشجرة
+        nodes = list(iter_thread(comments))
+        state.prime(comments=nodes, users=[comment.user for comment in nodes])
+    
+    @staticmethod
+    def merge_counters(comments):
+        counters.merge_pending(iter_thread(comments))
+    
+    def to_representation(self, instance):
+        counters.merge_pending([instance])
+        return super().to_representation(instance)
     
     def get_replies(self, obj):
-        replies = Comment.objects.filter(parent=obj)[:5]
-        return CommentSerializer(replies, many=True, context=self.context).data
+        # الردود من الشجرة المبنية في الذاكرة (بعمق محدود)
+        attach_threads([obj])
+        return CommentSerializer(obj.thread_children[:5], many=True, context=self.context).data
     
     def get_liked(self, obj):
-        request = self.context.get('request')
-        if request and request.user.is_authenticated:
-            return Like.objects.filter(comment=obj, user=request.user).exists()
-        return False
+        state = get_viewer_state(self.context)
+        return state.has_liked_comment(obj) if state else False
 
 # إعجاب
 class LikeSerializer(serializers.ModelSerializer):
@@ -144,6 +265,11 @@ class LikeSerializer(serializers.ModelSerializer):
         model = Like
         fields = ['id', 'user', 'post', 'comment', 'created_at']
         read_only_fields = ['created_at']
+        list_serializer_class = ViewerStateListSerializer
+    
+    @staticmethod
+    def prime_viewer_state(state, likes):
+        state.prime(users=[like.user for like in likes])
 
 # متابعة
 class FollowSerializer(serializers.ModelSerializer):
@@ -154,6 +280,11 @@ class FollowSerializer(serializers.ModelSerializer):
         model = Follow
         fields = ['id', 'follower', 'following', 'created_at']
         read_only_fields = ['created_at']
+        list_serializer_class = ViewerStateListSerializer
+    
+    @staticmethod
+    def prime_viewer_state(state, follows):
+        state.prime(users=[follow.follower for follow in follows] + [follow.following for follow in follows])
 
 # صداقة
 class FriendshipSerializer(serializers.ModelSerializer):
@@ -164,3 +295,8 @@ class FriendshipSerializer(serializers.ModelSerializer):
         model = Friendship
         fields = ['id', 'from_user', 'to_user', 'status', 'created_at', 'updated_at']
         read_only_fields = ['created_at', 'updated_at']
+        list_serializer_class = ViewerStateListSerializer
+    
+    @staticmethod
+    def prime_viewer_state(state, friendships):
+        state.prime(users=[f.from_user for f in friendships] + [f.to_user for f in friendships])
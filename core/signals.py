@@ -0,0 +1,100 @@
+from django.db import connections, transaction
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_init, post_migrate, post_save
+from django.dispatch import receiver
+from accounts.models import CustomUser
+from friends.models import Follow
+from posts.models import Comment, Hashtag, Post
+from . import autocomplete, blobs, fulltext, images, searchcache, sqlite
+
+@receiver(post_save, sender=Post)
+def post_image_saved(sender, instance, **kwargs):
+    """توليد نسخ صورة المنشور عند رفعها أو تغييرها"""
+    images.schedule(instance, 'image', 'image_variants', 'post')
+
+@receiver(post_save, sender=CustomUser)
+def profile_image_saved(sender, instance, **kwargs):
+    """توليد نسخ الصورة الشخصية عند رفعها أو تغييرها"""
+    images.schedule(instance, 'profile_image', 'profile_image_variants', 'avatar')
+
+def blob_instance_loaded(sender, instance, **kwargs):
+    """أسماء الملفات كما قُرئت، لمعرفة ما استُبدل عند الحفظ"""
+    blobs.snapshot(instance)
+
+def blob_instance_saved(sender, instance, created, update_fields=None, **kwargs):
+    """عدّ مراجع الملفات الجديدة وإنقاص المستبدلة"""
+    blobs.saved(instance, created, update_fields)
+
+def blob_instance_deleted(sender, instance, **kwargs):
+    """إنقاص مراجع ملفات الكائن المحذوف"""
+    blobs.deleted(instance)
+
+for model in blobs.BLOB_FIELDS:
+    post_init.connect(blob_instance_loaded, sender=model)
+    post_save.connect(blob_instance_saved, sender=model)
+    post_delete.connect(blob_instance_deleted, sender=model)
+
+@receiver(connection_created)
+def sqlite_connection_created(sender, connection, **kwargs):
+    """ضبط PRAGMA على كل اتصال SQLite جديد"""
+    sqlite.configure_connection(connection)
+
+@receiver(post_migrate)
+def fulltext_index_installed(sender, using, **kwargs):
+    """إنشاء فهارس البحث أو إصلاحها بعد الترحيلات (إعادة بناء جدول تحذف قوادحه)"""
+    if sender.name == 'core':
+        fulltext.install(connections[using])
+
+@receiver(post_save, sender=CustomUser)
+def autocomplete_user_saved(sender, instance, update_fields=None, **kwargs):
+    """تحديث المستخدم في فهرس الاقتراح (لا عند تحديث last_login وحده)"""
+    if update_fields is None or autocomplete.USER_FIELDS.intersection(update_fields):
+        transaction.on_commit(lambda: autocomplete.user_saved(instance))
+
+@receiver(post_delete, sender=CustomUser)
+def autocomplete_user_deleted(sender, instance, **kwargs):
+    pk = instance.pk
+    transaction.on_commit(lambda: autocomplete.user_deleted(pk))
+
+@receiver(post_save, sender=Follow)
+def autocomplete_follow_saved(sender, instance, created, **kwargs):
+    """وزن المستخدم في الاقتراح هو عدد متابعيه"""
+    if created:
+        transaction.on_commit(lambda: autocomplete.followers_changed(instance.following_id, 1))
+
+@receiver(post_delete, sender=Follow)
+def autocomplete_follow_deleted(sender, instance, **kwargs):
+    transaction.on_commit(lambda: autocomplete.followers_changed(instance.following_id, -1))
+
+@receiver(post_save, sender=Hashtag)
+def autocomplete_hashtag_saved(sender, instance, **kwargs):
+    transaction.on_commit(lambda: autocomplete.hashtag_saved(instance))
+
+@receiver(post_delete, sender=Hashtag)
+def autocomplete_hashtag_deleted(sender, instance, **kwargs):
+    pk = instance.pk
+    transaction.on_commit(lambda: autocomplete.hashtag_deleted(pk))
+
+def _searched_fields(model, *visibility):
+    return frozenset(field for fields in model.SEARCH_KEYS.values() for field in fields).union(visibility)
+
+# نوع نتائج البحث لكل نموذج، والحقول التي يغيّر حفظها النتائج
+SEARCH_KINDS = {
+    Post: ('post', _searched_fields(Post, 'is_deleted')),
+    Comment: ('comment', _searched_fields(Comment)),
+    CustomUser: ('user', _searched_fields(CustomUser, 'is_active')),
+}
+
+def search_results_saved(sender, instance, update_fields=None, **kwargs):
+    """إصدار جديد لنتائج البحث بعد تأكيد المعاملة (لا عند حفظ حقول لا يُبحث فيها)"""
+    kind, fields = SEARCH_KINDS[sender]
+    if update_fields is None or fields.intersection(update_fields):
+        transaction.on_commit(lambda: searchcache.bump(kind))
+
+def search_results_deleted(sender, instance, **kwargs):
+    kind, _ = SEARCH_KINDS[sender]
+    transaction.on_commit(lambda: searchcache.bump(kind))
+
+for model in SEARCH_KINDS:
+    post_save.connect(search_results_saved, sender=model)
+    post_delete.connect(search_results_deleted, sender=model)
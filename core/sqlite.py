@@ -0,0 +1,98 @@
+"""
+إعداد SQLite للإنتاج
+
+- كل اتصال جديد يُضبط بـ PRAGMA: وضع WAL يسمح للقراءات بالاستمرار أثناء
+  الكتابة بدلاً من قفل الملف كله، و busy_timeout ينتظر القفل بدلاً من
+  الفشل الفوري، و synchronous=NORMAL (آمن مع WAL) مع ذاكرة أكبر للصفحات
+  و mmap.
+- صيانة دورية (sqlite_maintenance): PRAGMA optimize أو ANALYZE، و
+  wal_checkpoint لتقليص ملف WAL، و VACUUM عند الطلب.
+- نسخة قراءة (replica) تُحدَّث بواجهة النسخ الاحتياطي في SQLite ثم تُستبدل
+  ذرياً، وتوجَّه إليها قراءات بعض الصفحات (انظر core.replica).
+"""
+import os
+import sqlite3
+
+from django.conf import settings
+from django.db import connections
+
+REPLICA_ALIAS = 'replica'
+
+# تُطبّق على كل اتصال؛ journal_mode دائم في الملف لكن إعادته رخيصة
+SQLITE_PRAGMAS = getattr(settings, 'SQLITE_PRAGMAS', {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'busy_timeout': 5000,
+    'cache_size': -64000,  # بالكيلوبايت عند السالب (~64MB)
+    'mmap_size': 256 * 1024 * 1024,
+    'temp_store': 'MEMORY',
+})
+# نسخة القراءة لا تُكتب ولا تغيّر وضع السجل
+REPLICA_PRAGMAS = {
+    'query_only': 'ON',
+    'busy_timeout': 5000,
+    'cache_size': -64000,
+    'mmap_size': 256 * 1024 * 1024,
+}
+# عدد الصفحات في كل خطوة نسخ: بين الخطوات يستطيع الكتّاب التقدم
+REPLICA_BACKUP_PAGES = 1024
+
+
+def configure_connection(connection):
+    """تطبيق PRAGMA على اتصال SQLite جديد"""
+    if connection.vendor != 'sqlite':
+        return
+    pragmas = REPLICA_PRAGMAS if connection.alias == REPLICA_ALIAS else SQLITE_PRAGMAS
+    with connection.cursor() as cursor:
+        for name, value in pragmas.items():
+            cursor.execute(f'PRAGMA {name} = {value}')
+
+
+def optimize(using='default', analyze=False):
+    """تحديث إحصاءات المخطط: optimize يحلل ما يحتاج فقط، و ANALYZE كل الجداول"""
+    with connections[using].cursor() as cursor:
+        cursor.execute('ANALYZE' if analyze else 'PRAGMA optimize')
+
+
+def checkpoint(using='default'):
+    """نقل صفحات WAL إلى الملف الرئيسي وتفريغه؛ يُرجع (busy, log, checkpointed)"""
+    with connections[using].cursor() as cursor:
+        cursor.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+        return cursor.fetchone()
+
+
+def vacuum(using='default'):
+    """إعادة بناء الملف لاسترداد المساحة (يقفل قاعدة البيانات طوال تشغيله)"""
+    connection = connections[using]
+    if connection.in_atomic_block:
+        raise RuntimeError('VACUUM لا يعمل داخل معاملة')
+    with connection.cursor() as cursor:
+        cursor.execute('VACUUM')
+
+
+def replica_path():
+    database = settings.DATABASES.get(REPLICA_ALIAS)
+    return database and database['NAME']
+
+
+def sync_replica(using='default', target=None):
+    """
+    نسخ قاعدة البيانات إلى ملف مؤقت بواجهة backup ثم استبداله بالنسخة
+    ذرياً، فلا يرى القرّاء نسخة نصف مكتملة. يُرجع مسار النسخة.
+    """
+    target = target or replica_path()
+    if not target:
+        raise RuntimeError(f'لا توجد قاعدة بيانات {REPLICA_ALIAS} في الإعدادات')
+
+    source = connections[using]
+    source.ensure_connection()
+    tmp_path = f'{target}.tmp'
+    destination = sqlite3.connect(tmp_path)
+    try:
+        source.connection.backup(destination, pages=REPLICA_BACKUP_PAGES)
+        # ملف واحد دون WAL: يُنقل كاملاً بإعادة التسمية
+        destination.execute('PRAGMA journal_mode = DELETE')
+    finally:
+        destination.close()
+    os.replace(tmp_path, target)
+    return target
@@ -0,0 +1,85 @@
+"""
+تخزين الوسائط المعنون بمحتواه
+
+الملفات المرفوعة إلى مجلدات CONTENT_ADDRESSED_DIRS تُحفظ باسم بصمتها
+(sha256) بدلاً من اسمها الأصلي: post_images/ab/<sha256>.jpg. البصمة تُحسب
+أثناء كتابة الكتل إلى ملف مؤقت، فإن كان الملف موجوداً مسبقاً يُحذف المؤقت
+ويُعاد الاسم نفسه، فلا يُخزن المحتوى الواحد إلا مرة. الاسم لا يتغير
+محتواه أبداً فتُخدم هذه الملفات بتخزين مؤقت دائم (انظر core.media).
+
+عدد المراجع لكل ملف وحذفه عند انتهائها في core.blobs.
+"""
+import hashlib
+import os
+import tempfile
+
+from django.conf import settings
+from django.core.files.move import file_move_safe
+from django.core.files.storage import FileSystemStorage
+from django.db import transaction
+
+# مجلدات upload_to التي تُعنون ملفاتها بالمحتوى؛ المجلدات الأعمق (مثل النسخ المصغرة) تُحفظ كما هي
+CONTENT_ADDRESSED_DIRS = getattr(
+    settings, 'CONTENT_ADDRESSED_DIRS', ('post_images', 'post_videos', 'profile_pics', 'cover_pics')
+)
+HASH_BLOCK_SIZE = 64 * 1024
+
+
+def blob_name(directory, digest, filename):
+    ext = os.path.splitext(filename)[1].lower()[:10]
+    return f'{directory}/{digest[:2]}/{digest}{ext}'
+
+
+class ContentAddressedStorage(FileSystemStorage):
+
+    def is_content_addressed_dir(self, name):
+        return os.path.dirname(name) in CONTENT_ADDRESSED_DIRS
+
+    def get_available_name(self, name, max_length=None):
+        # الاسم النهائي من البصمة في _save؛ لا لاحقة عشوائية هنا
+        if self.is_content_addressed_dir(name):
+            return name
+        return super().get_available_name(name, max_length)
+
+    def _save(self, name, content):
+        if not self.is_content_addressed_dir(name):
+            return super()._save(name, content)
+
+        directory, filename = os.path.split(name)
+        hasher = hashlib.sha256()
+
+        # ملف مؤقت على القرص (رفع كبير أو جلسة رفع) يُقرأ للبصمة ثم يُنقل دون نسخ
+        own_tmp = not hasattr(content, 'temporary_file_path')
+        if own_tmp:
+            os.makedirs(self.location, exist_ok=True)
+            # في MEDIA_ROOT نفسه حتى يكون النقل إعادة تسمية
+            fd, tmp_path = tempfile.mkstemp(dir=self.location, prefix='.upload-')
+            with os.fdopen(fd, 'wb') as f:
+                for chunk in content.chunks():
+                    hasher.update(chunk)
+                    f.write(chunk)
+        else:
+            tmp_path = content.temporary_file_path()
+            with open(tmp_path, 'rb') as f:
+                for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b''):
+                    hasher.update(block)
+
+        name = blob_name(directory, hasher.hexdigest(), filename)
+        full_path = self.path(name)
+        from . import blobs
+
+        # قفل صف الملف نفسه الذي يأخذه blobs.delete_unreferenced: لا يُحذف الملف
+        # بين التحقق من وجوده هنا وزيادة عدّاده بعد حفظ الكائن في المعاملة نفسها
+        with transaction.atomic():
+            blobs.lock(name)
+            if os.path.exists(full_path):
+                if own_tmp:
+                    os.remove(tmp_path)
+                return name
+
+            os.makedirs(os.path.dirname(full_path), exist_ok=True)
+            # الاستبدال آمن: رفعان متزامنان لنفس المحتوى يكتبان البايتات نفسها
+            file_move_safe(tmp_path, full_path, allow_overwrite=True)
+            if self.file_permissions_mode is not None:
+                os.chmod(full_path, self.file_permissions_mode)
+        return name
@@ -1,3 +1,853 @@
-from django.test import TestCase
+import base64
+import os
+import shutil
+import tempfile
+import threading
+from io import BytesIO, StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import cache
+from django.utils import timezone
+from rest_framework.exceptions import NotFound
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.http import HttpResponse
+from django.db import connections, router
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from accounts.models import CustomUser
+from friends.models import Follow
+from posts import counters, uploads
+from posts.forms import EditPostForm
+from posts.models import Comment, Like, Post, UploadSession
+from posts.views import home_view
+from . import autocomplete, blobs, fulltext, images, media, normalize, replica, searchcache, sqlite
+from .api_views import FeedView
+from .models import MediaBlob
+from .serializers import PostListSerializer
+from .pagination import decode_cursor, encode_cursor
+from .querybudget import (
+    QueryBudgetExceeded, QueryBudgetMiddleware, assert_query_budget, query_budget,
+)
+
+
+class QueryBudgetTests(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user('viewer', password='pass12345')
+        self.author = CustomUser.objects.create_user('author', password='pass12345')
+        Follow.objects.create(follower=self.user, following=self.author)
+        for i in range(15):
+            Post.objects.create(user=self.author, content=f'post {i}')
+
+    def test_home_view_within_budget(self):
+        self.client.force_login(self.user)
+        with assert_query_budget(home_view):
+            response = self.client.get(reverse('home'))
+        self.assertEqual(response.status_code, 200)
+
+    def test_feed_within_budget(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        with assert_query_budget(FeedView.as_view()) as recorder:
+            response = client.get('/api/feed/')
+        self.assertEqual(len(response.data['results']), 15)
+        self.assertFalse(recorder.duplicates())
+
+    def test_assert_query_budget_reports_overrun(self):
+        with self.assertRaises(AssertionError):
+            with assert_query_budget(max_queries=1):
+                list(Post.objects.all())
+                list(CustomUser.objects.all())
+
+    @override_settings(QUERY_BUDGET_MODE='raise')
+    def test_middleware_enforces_declared_budget(self):
+        @query_budget(1)
+        def view(request):
+            for post in Post.objects.all()[:3]:
+                post.user.username
+            return HttpResponse()
+
+        request = RequestFactory().get('/')
+        middleware = QueryBudgetMiddleware(lambda request: view(request))
+        middleware.process_view(request, view, (), {})
+        with self.assertRaises(QueryBudgetExceeded):
+            middleware(request)
+
+    @override_settings(QUERY_BUDGET_MODE='warn')
+    def test_middleware_warns_in_warn_mode(self):
+        @query_budget(0)
+        def view(request):
+            Post.objects.count()
+            return HttpResponse()
+
+        request = RequestFactory().get('/')
+        middleware = QueryBudgetMiddleware(lambda request: view(request))
+        middleware.process_view(request, view, (), {})
+        with self.assertLogs('querybudget', 'WARNING'):
+            response = middleware(request)
+        self.assertEqual(response.status_code, 200)
+
+
+
+class KeysetPaginationTests(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user('pager', password='pass12345')
+        self.posts = [Post.objects.create(user=self.user, content=f'p{i}') for i in range(7)]
+        # منشورات بالوقت نفسه: الترتيب يحسمه المعرّف
+        Post.objects.filter(pk__in=[p.pk for p in self.posts[2:5]]).update(created_at=self.posts[2].created_at)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def newest_first(self):
+        return list(Post.objects.order_by('-created_at', '-id').values_list('id', flat=True))
+
+    def walk(self, url):
+        ids = []
+        while url:
+            body = self.client.get(url).json()
+            ids += [item['id'] for item in body['results']]
+            url = body['next']
+        return ids
+
+    def test_cursor_round_trip(self):
+        key = (timezone.now().replace(microsecond=123456), 42)
+        self.assertEqual(decode_cursor(encode_cursor(key)), key)
+
+    def test_pages_cover_list_once_with_ties(self):
+        self.assertEqual(self.walk('/api/posts/?page_size=2'), self.newest_first())
+
+    def test_older_and_newer_pages_are_stable_under_inserts(self):
+        expected = self.newest_first()
+        first = self.client.get('/api/posts/?page_size=3').json()
+        new = [Post.objects.create(user=self.user, content=f'new{i}').pk for i in range(4)]
+
+        ids = [item['id'] for item in first['results']] + self.walk(first['next'])
+        self.assertEqual(ids, expected)
+
+        # since: أقدم الجديد أولاً بلا فجوات، ثم الرابط الأحدث يكمل
+        newer = self.client.get(first['previous']).json()
+        self.assertEqual([item['id'] for item in newer['results']], new[:3][::-1])
+        self.assertIsNone(newer['next'])
+        newer = self.client.get(newer['previous']).json()
+        self.assertEqual([item['id'] for item in newer['results']], new[3:])
+        newest = self.client.get(newer['previous']).json()
+        self.assertEqual(newest['results'], [])
+
+    def test_invalid_cursor_is_not_found(self):
+        bad_cursors = [
+            'not base64!',
+            base64.urlsafe_b64encode(b'no separator').decode(),
+            base64.urlsafe_b64encode(b'yesterday|1').decode(),
+            base64.urlsafe_b64encode(b'2026-01-01T00:00:00|x').decode(),
+            base64.urlsafe_b64encode(b'\xff\xfe').decode(),
+        ]
+        for cursor in bad_cursors:
+            with self.assertRaises(NotFound):
+                decode_cursor(cursor)
+            for param in ('cursor', 'until', 'since'):
+                response = self.client.get('/api/posts/', {param: cursor})
+                self.assertEqual(response.status_code, 404, (param, cursor))
+
+
+class ViewerStateSerializerTests(TestCase):
+    """تمثيل صفحة منشورات بعدد ثابت من الاستعلامات مهما كان حجمها"""
+
+    def setUp(self):
+        self.viewer = CustomUser.objects.create_user('viewer', password='pass12345')
+        self.request = RequestFactory().get('/api/posts/')
+        self.request.user = self.viewer
+
+    def make_posts(self, n):
+        posts = []
+        for i in range(n):
+            author = CustomUser.objects.create(username=f'author{n}_{i}')
+            post = Post.objects.create(user=author, content=f'post {i}')
+            if i % 2:
+                Follow.objects.create(follower=self.viewer, following=author)
+                Like.objects.create(user=self.viewer, post=post)
+                counters.record(post, 'likes_count', 1)
+            posts.append(post.pk)
+        return list(Post.objects.filter(pk__in=posts).select_related('user__user_settings').order_by('-id'))
+
+    def serialize(self, posts):
+        with CaptureQueriesContext(connections['default']) as queries:
+            data = PostListSerializer(posts, many=True, context={'request': self.request}).data
+        return data, len(queries)
+
+    def test_query_count_independent_of_page_size(self):
+        _, small_queries = self.serialize(self.make_posts(2))
+        posts = self.make_posts(12)
+        with assert_query_budget(max_queries=small_queries, max_similar=1):
+            large, _ = self.serialize(posts)
+
+        self.assertEqual(len(large), 12)
+        liked = [item for item in large if item['liked']]
+        self.assertEqual(len(liked), 6)
+        self.assertTrue(all(item['likes_count'] == 1 and item['user']['is_following'] for item in liked))
+
+    def test_api_list_query_count_independent_of_page_size(self):
+        self.make_posts(12)
+        client = APIClient()
+        client.force_authenticate(self.viewer)
+        with CaptureQueriesContext(connections['default']) as small:
+            client.get('/api/posts/', {'page_size': 2})
+        with self.assertNumQueries(len(small)):
+            response = client.get('/api/posts/', {'page_size': 12})
+        self.assertEqual(len(response.json()['results']), 12)
+
+
+class FeedETagTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.viewer = CustomUser.objects.create_user('reader', password='pass12345')
+        self.author = CustomUser.objects.create_user('author', password='pass12345')
+        Follow.objects.create(follower=self.viewer, following=self.author)
+        self.post = Post.objects.create(user=self.author, content='first version')
+        self.client = APIClient()
+        self.client.force_authenticate(self.viewer)
+        self.etag = self.client.get(reverse('api_feed'))['ETag']
+
+    def get_feed(self, **params):
+        return self.client.get(reverse('api_feed'), params, HTTP_IF_NONE_MATCH=self.etag)
+
+    def assertChanged(self):
+        response = self.get_feed()
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], self.etag)
+        return response
+
+    def test_unchanged_feed_is_not_modified_without_post_queries(self):
+        with CaptureQueriesContext(connections['default']) as queries:
+            response = self.get_feed()
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], self.etag)
+        self.assertEqual(len(queries), 1)
+        self.assertNotIn('posts_', queries[0]['sql'])
+
+    def test_like_changes_etag(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('post-like', args=[self.post.pk]))
+        response = self.assertChanged()
+        self.assertTrue(response.data['results'][0]['liked'])
+        self.assertEqual(response.data['results'][0]['likes_count'], 1)
+
+    def test_edit_and_delete_change_etag(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.post.content = 'second version'
+            self.post.save()
+        response = self.assertChanged()
+        self.assertEqual(response.data['results'][0]['content'], 'second version')
+
+        self.etag = response['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            self.post.soft_delete()
+        self.assertEqual(self.assertChanged().data['results'], [])
+
+    def test_new_post_changes_etag(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            newer = Post.objects.create(user=self.author, content='newer')
+        self.assertEqual(self.assertChanged().data['results'][0]['id'], newer.pk)
+
+    def test_follow_and_unfollow_change_etag(self):
+        other = CustomUser.objects.create_user('other', password='pass12345')
+        with self.captureOnCommitCallbacks(execute=True):
+            Follow.objects.create(follower=self.viewer, following=other)
+        self.etag = self.assertChanged()['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            Follow.objects.filter(follower=self.viewer, following=self.author).delete()
+        self.assertChanged()
+
+    def test_flush_counters_changes_etag(self):
+        counters.record(self.post, 'shares_count', 1)
+        self.etag = self.client.get(reverse('api_feed'))['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            counters.flush_all()
+        self.assertChanged()
+
+    def test_etag_is_per_request_shape(self):
+        since = self.get_feed(since_id=self.post.pk)
+        self.assertEqual(since.status_code, 200)
+        self.assertNotEqual(since['ETag'], self.etag)
+        response = self.client.get(
+            reverse('api_feed'), {'since_id': self.post.pk}, HTTP_IF_NONE_MATCH=since['ETag'],
+        )
+        self.assertEqual(response.status_code, 304)
+
+
+class ImageVariantTests(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        patcher = mock.patch.object(images, 'IMAGE_VARIANTS_ASYNC', False)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.user = CustomUser.objects.create_user('painter', password='pass12345')
+
+    def upload(self, size):
+        from PIL import Image
+        buffer = BytesIO()
+        Image.new('RGB', size, 'red').save(buffer, 'JPEG')
+        return SimpleUploadedFile('photo.jpg', buffer.getvalue(), content_type='image/jpeg')
+
+    def test_variants_generated_after_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            post = Post.objects.create(user=self.user, content='pic', image=self.upload((1000, 500)))
+
+        post.refresh_from_db()
+        variants = post.image_variants['variants']
+        self.assertEqual(post.image_variants['source'], post.image.name)
+        # لا تكبير: feed_2x أعرض من الأصل
+        self.assertEqual({name: v['width'] for name, v in variants.items()}, {'thumb': 320, 'feed': 680})
+
+        client = APIClient()
+        client.force_authenticate(self.user)
+        data = client.get(f'/api/posts/{post.id}/').json()
+        self.assertTrue(data['image_variants']['feed'].startswith('http://testserver/'))
+        self.assertTrue(data['image_variants']['feed'].endswith('/feed.webp'))
+
+        # صورة جديدة تُبطل النسخ القديمة حتى تُولَّد نسخها
+        post.image = self.upload((200, 200))
+        post.save()
+        self.assertEqual(images.variant_urls(post, 'image', 'image_variants'), {})
+
+
+    def test_backfill_skips_default_avatar(self):
+        CustomUser.objects.create_user('plain', password='pass12345')
+        post = Post.objects.create(user=self.user, content='pic')
+        Post.objects.filter(pk=post.pk).update(image='post_images/old.jpg')
+        with mock.patch.object(images, 'generate') as generate:
+            call_command('generate_image_variants', stdout=StringIO())
+        generate.assert_called_once_with(Post, post.pk, 'image', 'image_variants', 'post')
+
+
+class UploadSessionTests(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        patcher = mock.patch.object(uploads, 'UPLOAD_SESSION_DIR', f'{self.media_root}/sessions')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.user = CustomUser.objects.create_user('uploader', password='pass12345')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        # يبدأ بصندوق ftyp كملف mp4 حقيقي
+        self.data = b'\x00\x00\x00\x18ftypmp42' + bytes(range(256)) * 40
+
+    def put(self, url, start, end):
+        return self.client.generic(
+            'PUT', url, self.data[start:end + 1], content_type='application/octet-stream',
+            HTTP_CONTENT_RANGE=f'bytes {start}-{end}/{len(self.data)}',
+        )
+
+    def test_resumable_upload_creates_video_post(self):
+        response = self.client.post('/api/uploads/', {
+            'filename': 'clip.mp4', 'content_type': 'video/mp4', 'size': len(self.data),
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+        url = response.data['upload_url']
+
+        self.assertEqual(self.put(url, 0, 4095).status_code, 200)
+        # جزء مكرر بعد انقطاع: الخادم يرد بالموضع الصحيح
+        response = self.put(url, 0, 4095)
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response['Upload-Offset'], '4096')
+        self.assertEqual(self.client.get(url).data['received'], 4096)
+
+        self.assertEqual(self.client.post(f'{url}complete/', {'content': 'clip'}).status_code, 400)
+        self.assertEqual(self.put(url, 4096, len(self.data) - 1).status_code, 200)
+
+        response = self.client.post(f'{url}complete/', {'content': 'clip'})
+        self.assertEqual(response.status_code, 201)
+        post = Post.objects.get(pk=response.data['id'])
+        self.assertEqual(post.post_type, 'video')
+        with post.video.open('rb') as f:
+            self.assertEqual(f.read(), self.data)
+        self.assertFalse(os.listdir(uploads.UPLOAD_SESSION_DIR))
+
+        self.assertEqual(self.client.post(f'{url}complete/', {'content': 'clip'}).status_code, 400)
+
+    def test_rejects_non_video_names_and_content(self):
+        for filename, content_type in [('x.html', 'video/mp4'), ('clip.webm', 'video/mp4'), ('clip', 'video/mp4')]:
+            response = self.client.post('/api/uploads/', {
+                'filename': filename, 'content_type': content_type, 'size': 10,
+            }, format='json')
+            self.assertEqual(response.status_code, 400, filename)
+        self.assertFalse(UploadSession.objects.exists())
+
+        self.data = b'<html><script>alert(1)</script></html>'
+        url = self.client.post('/api/uploads/', {
+            'filename': 'clip.mp4', 'content_type': 'video/mp4', 'size': len(self.data),
+        }, format='json').data['upload_url']
+        self.put(url, 0, len(self.data) - 1)
+        response = self.client.post(f'{url}complete/', {'content': 'clip'})
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Post.objects.exists())
+        self.assertFalse(UploadSession.objects.exists())
+        self.assertFalse(os.listdir(uploads.UPLOAD_SESSION_DIR))
+
+        # الرفع المباشر مع المنشور يُفحص بالقواعد نفسها
+        for name in ('x.html', 'clip.mp4'):
+            video = SimpleUploadedFile(name, self.data, content_type='video/mp4')
+            response = self.client.post('/api/posts/', {'content': 'clip', 'video': video}, format='multipart')
+            self.assertEqual(response.status_code, 400, name)
+
+    def test_attach_to_own_post_only(self):
+        other = CustomUser.objects.create_user('other', password='pass12345')
+        post = Post.objects.create(user=other, content='not mine')
+        response = self.client.post('/api/uploads/', {
+            'filename': 'clip.mp4', 'content_type': 'video/mp4', 'size': 10, 'post': post.id,
+        }, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(UploadSession.objects.exists())
+
+
+class MediaServeTests(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        os.makedirs(os.path.join(self.media_root, 'post_videos'))
+        self.data = bytes(range(256)) * 4
+        with open(os.path.join(self.media_root, 'post_videos', 'clip.mp4'), 'wb') as f:
+            f.write(self.data)
+        self.url = '/media/post_videos/clip.mp4'
+
+    def test_full_and_conditional(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), self.data)
+        self.assertEqual(response['Content-Type'], 'video/mp4')
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertNotIn('immutable', response['Cache-Control'])
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(self.client.get('/media/../settings.py').status_code, 404)
+
+    def test_ranges(self):
+        response = self.client.get(self.url, HTTP_RANGE='bytes=10-19')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], f'bytes 10-19/{len(self.data)}')
+        self.assertEqual(b''.join(response.streaming_content), self.data[10:20])
+
+        response = self.client.get(self.url, HTTP_RANGE='bytes=-4')
+        self.assertEqual(b''.join(response.streaming_content), self.data[-4:])
+
+        response = self.client.get(self.url, HTTP_RANGE=f'bytes={len(self.data)}-')
+        self.assertEqual(response.status_code, 416)
+
+        # If-Range لا يطابق: الملف كاملاً
+        response = self.client.get(self.url, HTTP_RANGE='bytes=0-1', HTTP_IF_RANGE='"stale"')
+        self.assertEqual(response.status_code, 200)
+
+    def test_content_addressed_is_immutable_and_sendfile(self):
+        name = 'a' * 64 + '.mp4'
+        shutil.copy(os.path.join(self.media_root, 'post_videos', 'clip.mp4'), os.path.join(self.media_root, name))
+        with mock.patch.object(media, 'MEDIA_SENDFILE', 'x-accel-redirect'):
+            response = self.client.get(f'/media/{name}')
+        self.assertIn('immutable', response['Cache-Control'])
+        self.assertEqual(response['X-Accel-Redirect'], f'/protected-media/{name}')
+        self.assertEqual(response.content, b'')
+        self.assertEqual(response['Content-Type'], 'video/mp4')
+
+    def test_untrusted_types_are_downloaded(self):
+        for name in ('x.html', 'x.svg', 'x.html.gz'):
+            with open(os.path.join(self.media_root, 'post_videos', name), 'wb') as f:
+                f.write(b'<script>alert(1)</script>')
+            for sendfile in (None, 'x-sendfile'):
+                with mock.patch.object(media, 'MEDIA_SENDFILE', sendfile):
+                    response = self.client.get(f'/media/post_videos/{name}')
+                self.assertEqual(response['Content-Type'], 'application/octet-stream', name)
+                self.assertEqual(response['Content-Disposition'], 'attachment')
+                self.assertNotIn('Content-Encoding', response)
+
+        response = self.client.get(self.url)
+        self.assertNotIn('Content-Disposition', response)
+        self.assertIn('sandbox', response['Content-Security-Policy'])
+
+
+class ContentAddressedStorageTests(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        patcher = mock.patch.object(images, 'IMAGE_VARIANTS_ASYNC', False)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.user = CustomUser.objects.create_user('reposter', password='pass12345')
+
+    def upload(self, content=b'same bytes'):
+        return SimpleUploadedFile('clip.mp4', content, content_type='video/mp4')
+
+    def refcount(self, name):
+        return MediaBlob.objects.get(name=name).refcount
+
+    def test_same_content_stored_once_and_released(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            first = Post.objects.create(user=self.user, content='1', video=self.upload())
+            second = Post.objects.create(user=self.user, content='2', video=self.upload())
+        name = first.video.name
+        self.assertEqual(second.video.name, name)
+        self.assertRegex(name, r'^post_videos/[0-9a-f]{2}/[0-9a-f]{64}\.mp4$')
+        self.assertEqual(self.refcount(name), 2)
+
+        # إزالة الفيديو من منشور: الملف باقٍ للآخر
+        form = EditPostForm({'content': '1', 'remove_video': True}, instance=Post.objects.get(pk=first.pk))
+        self.assertTrue(form.is_valid())
+        with self.captureOnCommitCallbacks(execute=True):
+            form.save()
+        self.assertEqual(self.refcount(name), 1)
+        self.assertTrue(default_storage.exists(name))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Post.objects.get(pk=second.pk).delete()
+        self.assertFalse(MediaBlob.objects.filter(name=name).exists())
+        self.assertFalse(default_storage.exists(name))
+
+    def test_reupload_during_pending_delete_keeps_file(self):
+        with mock.patch.object(blobs, 'lock', wraps=blobs.lock) as lock:
+            with self.captureOnCommitCallbacks(execute=True):
+                post = Post.objects.create(user=self.user, content='1', video=self.upload())
+        name = post.video.name
+        lock.assert_called_once_with(name)
+
+        # الحذف ينتظر التأكيد، ورفعٌ جديد للمحتوى نفسه يسبقه
+        with self.captureOnCommitCallbacks() as callbacks:
+            Post.objects.get(pk=post.pk).delete()
+        self.assertEqual(self.refcount(name), 0)
+        Post.objects.create(user=self.user, content='2', video=self.upload())
+        for callback in callbacks:
+            callback()
+        self.assertEqual(self.refcount(name), 1)
+        self.assertTrue(default_storage.exists(name))
+
+    def test_dedupe_media_converts_legacy_files(self):
+        # ملفات رُفعت قبل التخزين المعنون: نسختان بالمحتوى نفسه
+        os.makedirs(os.path.join(self.media_root, 'post_videos'))
+        for i in range(2):
+            with open(os.path.join(self.media_root, 'post_videos', f'old{i}.mp4'), 'wb') as f:
+                f.write(b'same bytes')
+            post = Post.objects.create(user=self.user, content=str(i))
+            Post.objects.filter(pk=post.pk).update(video=f'post_videos/old{i}.mp4')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('dedupe_media', stdout=StringIO())
+        names = set(Post.objects.values_list('video', flat=True))
+        self.assertEqual(len(names), 1)
+        self.assertEqual(self.refcount(names.pop()), 2)
+        self.assertFalse(default_storage.exists('post_videos/old0.mp4'))
+
+
+class ReplicaTests(TestCase):
+    def setUp(self):
+        patcher = mock.patch.object(replica, 'replica_ready', return_value=True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.router = replica.ReplicaRouter()
+
+    def test_use_replica_routes_reads_after_authentication(self):
+        seen = []
+
+        @replica.use_replica
+        def view(request):
+            # خارج معاملة الاختبار
+            with mock.patch.object(connections['default'], 'in_atomic_block', False):
+                seen.append(self.router.db_for_read(Post))
+            seen.append(self.router.db_for_read(Post))
+            seen.append(self.router.db_for_write(Post))
+            return HttpResponse()
+
+        view(RequestFactory().get('/'))
+        self.assertEqual(seen, ['replica', 'default', 'default'])
+        with mock.patch.object(connections['default'], 'in_atomic_block', False):
+            self.assertEqual(self.router.db_for_read(Post), 'default')
+
+            # من كتب للتو يبقى على default
+            seen.clear()
+            request = RequestFactory().get('/')
+            request.COOKIES[replica.REPLICA_PIN_COOKIE] = '1'
+            view(request)
+            self.assertEqual(seen[0], 'default')
+
+    def test_search_matches_on_the_database_it_loads_from(self):
+        post = Post.objects.create(user=CustomUser.objects.create_user('mirror', password='pass12345'), content='mirrored words')
+        with mock.patch.object(router, 'db_for_read', return_value='replica'):
+            self.assertIs(fulltext.read_connection('post'), connections['replica'])
+            with mock.patch.object(fulltext, 'search', return_value=[]) as search:
+                fulltext.search_objects('post', 'mirrored', Post.objects.all(), 10)
+                fulltext.merged_page('mirrored', [fulltext.SearchSection('post', Post.objects.all(), False)], 1, 10)
+            self.assertEqual({call.kwargs['connection'].alias for call in search.call_args_list}, {'replica'})
+
+            # queryset على default صراحةً: المطابقة عليها أيضاً
+            with CaptureQueriesContext(connections['default']) as queries:
+                found = fulltext.search_objects('post', 'mirrored', Post.objects.using('default'), 10)
+        self.assertEqual([p.pk for p in found], [post.pk])
+        self.assertIn('MATCH', ' '.join(query['sql'] for query in queries))
+
+    def test_writes_pin_client_to_primary(self):
+        middleware = replica.ReplicaPinMiddleware(lambda request: HttpResponse())
+        self.assertNotIn(replica.REPLICA_PIN_COOKIE, middleware(RequestFactory().get('/')).cookies)
+        self.assertIn(replica.REPLICA_PIN_COOKIE, middleware(RequestFactory().post('/')).cookies)
+
+
+class SyncReplicaTests(TransactionTestCase):
+    def test_sync_replica_copies_database(self):
+        import sqlite3
+        Post.objects.create(user=CustomUser.objects.create_user('copied', password='pass12345'), content='x')
+        target = os.path.join(tempfile.mkdtemp(), 'replica.sqlite3')
+        self.addCleanup(shutil.rmtree, os.path.dirname(target))
+
+        sqlite.sync_replica(target=target)
+        with sqlite3.connect(target) as db:
+            count, = db.execute(f'SELECT COUNT(*) FROM {Post._meta.db_table}').fetchone()
+        self.assertEqual(count, 1)
+
+
+class FullTextSearchTests(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user('searcher', password='pass12345', bio='يحب القهوة')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_ranks_posts_and_excludes_deleted(self):
+        once = Post.objects.create(user=self.user, content='coffee and tea')
+        twice = Post.objects.create(user=self.user, content='coffee coffee coffee')
+        Post.objects.create(user=self.user, content='coffee gone', is_deleted=True)
+
+        hits = fulltext.search('post', 'coff', 10)
+        self.assertEqual([hit.id for hit in hits], [twice.id, once.id])
+
+        response = self.client.get(reverse('api_search'), {'q': 'coffee', 'type': 'posts'})
+        self.assertEqual([post['id'] for post in response.data['results']], [twice.id, once.id])
+        self.assertEqual(response.data['count'], 2)
+        self.assertIn('<mark>coffee</mark>', response.data['results'][1]['snippet'])
+
+    def test_index_follows_updates_and_deletes(self):
+        post = Post.objects.create(user=self.user, content='first draft')
+        comment = Comment.objects.create(post=post, user=self.user, content='nice draft')
+        self.assertEqual([hit.id for hit in fulltext.search('comment', 'draft', 10)], [comment.id])
+
+        post.content = 'final version'
+        post.save(update_fields=['content'])
+        self.assertEqual(fulltext.search('post', 'draft', 10), [])
+        self.assertEqual([hit.id for hit in fulltext.search('post', 'final', 10)], [post.id])
+
+        comment.delete()
+        self.assertEqual(fulltext.search('comment', 'draft', 10), [])
+
+    def test_users_and_arabic_bio(self):
+        other = CustomUser.objects.create_user('coffeelover', password='pass12345')
+        self.assertEqual([hit.id for hit in fulltext.search('user', 'القهوة', 10)], [self.user.id])
+        # الاسم أعلى وزناً من النبذة
+        other.bio = 'searcher fan'
+        other.save()
+        self.assertEqual([hit.id for hit in fulltext.search('user', 'searcher', 10)], [self.user.id, other.id])
+
+    def test_snippet_escapes_html_and_query_syntax(self):
+        Post.objects.create(user=self.user, content='<b>bold</b> claim')
+        hit, = fulltext.search('post', 'bold" (*', 10, snippets=True)
+        self.assertIn('&lt;b&gt;<mark>bold</mark>&lt;/b&gt;', hit.snippet)
+        self.assertEqual(fulltext.search('post', '"* -', 10), [])
+
+    def test_install_repairs_dropped_triggers(self):
+        with connections['default'].cursor() as cursor:
+            cursor.execute('DROP TRIGGER posts_post_fts_ai')
+        self.assertEqual(fulltext.install(), ['post'])
+        self.assertEqual(fulltext.install(), [])
+        post = Post.objects.create(user=self.user, content='restored index')
+        self.assertEqual([hit.id for hit in fulltext.search('post', 'restored', 10)], [post.id])
+
+
+class SearchCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.user = CustomUser.objects.create_user('cacher', password='pass12345')
+
+    def ids(self, text):
+        # معاملة الاختبار تمنع الحفظ عادةً
+        with mock.patch.object(searchcache, 'cacheable', return_value=True):
+            return fulltext.cached_ids('post', text, 10)
+
+    def test_repeated_and_equivalent_queries_hit_cache(self):
+        post = Post.objects.create(user=self.user, content='قهوة عربية')
+        self.assertEqual(self.ids('قهوة'), [post.pk])
+        with self.assertNumQueries(0):
+            self.assertEqual(self.ids('قَهْوَه'), [post.pk])
+        # داخل معاملة لا يُستخدم المحفوظ
+        Post.objects.create(user=self.user, content='قهوة تركية')
+        self.assertEqual(len(fulltext.cached_ids('post', 'قهوة', 10)), 2)
+
+    def test_writes_bump_generation(self):
+        first = Post.objects.create(user=self.user, content='green tea')
+        self.assertEqual(self.ids('tea'), [first.pk])
+        with self.captureOnCommitCallbacks(execute=True):
+            second = Post.objects.create(user=self.user, content='black tea')
+        self.assertEqual(self.ids('tea'), [second.pk, first.pk])
+        with self.captureOnCommitCallbacks(execute=True):
+            first.soft_delete()
+        self.assertEqual(self.ids('tea'), [second.pk])
+
+        generation = searchcache.generation('user')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.save(update_fields=['last_login'])
+        self.assertEqual(searchcache.generation('user'), generation)
+
+    def test_replica_results_last_until_next_sync(self):
+        replica_file = tempfile.NamedTemporaryFile()
+        self.addCleanup(replica_file.close)
+        replica_connection = mock.Mock(in_atomic_block=False, alias='replica', settings_dict={'NAME': replica_file.name})
+        default_connection = mock.Mock(in_atomic_block=False, alias='default')
+        compute = mock.Mock(side_effect=[[1], [2], [3]])
+
+        self.assertEqual(searchcache.get_or_compute('post', ('q',), compute, replica_connection), [1])
+        self.assertEqual(searchcache.get_or_compute('post', ('q',), compute, replica_connection), [1])
+        # default لا يشارك النسخة نتائجها
+        self.assertEqual(searchcache.get_or_compute('post', ('q',), compute, default_connection), [2])
+        # المزامنة تستبدل الملف فيتغير وقت تعديله
+        os.utime(replica_file.name, (0, 0))
+        self.assertEqual(searchcache.get_or_compute('post', ('q',), compute, replica_connection), [3])
+
+    def test_concurrent_misses_compute_once(self):
+        started, release = threading.Event(), threading.Event()
+        calls, results = [], []
+
+        def compute():
+            calls.append(1)
+            started.set()
+            release.wait(5)
+            return [42]
+
+        def run():
+            results.append(searchcache.get_or_compute('post', ('q',), compute, mock.Mock(in_atomic_block=False, alias='default')))
+
+        first = threading.Thread(target=run)
+        first.start()
+        started.wait(5)
+        second = threading.Thread(target=run)
+        second.start()
+        release.set()
+        first.join()
+        second.join()
+        self.assertEqual(results, [[42], [42]])
+        self.assertEqual(len(calls), 1)
+
+
+class AutocompleteTests(TestCase):
+    def setUp(self):
+        autocomplete.reset()
+        self.addCleanup(autocomplete.reset)
+        self.popular = CustomUser.objects.create_user('samira', password='pass12345', first_name='Sara')
+        self.other = CustomUser.objects.create_user('sarah_k', password='pass12345')
+        CustomUser.objects.filter(pk=self.popular.pk).update(followers_count=1)
+
+    def usernames(self, prefix):
+        return [s.payload['username'] for s in autocomplete.suggest_users(prefix, 5)]
+
+    def test_prefix_ranked_by_followers_without_queries(self):
+        self.assertEqual(self.usernames('SAR'), ['samira', 'sarah_k'])
+        with self.assertNumQueries(0):
+            self.assertEqual(self.usernames('sam'), ['samira'])
+            self.assertEqual(self.usernames('sa'), ['samira', 'sarah_k'])
+            self.assertEqual(self.usernames('x'), [])
+
+    def test_signals_update_built_index(self):
+        self.assertEqual(self.usernames('sar'), ['samira', 'sarah_k'])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.other.first_name = 'Zed'
+            self.other.save()
+            Follow.objects.create(follower=self.popular, following=self.other)
+            Follow.objects.create(follower=CustomUser.objects.create(username='fan'), following=self.other)
+        self.assertEqual(self.usernames('sar'), ['sarah_k', 'samira'])
+        self.assertEqual(self.usernames('ze'), ['sarah_k'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.other.delete()
+        self.assertEqual(self.usernames('sar'), ['samira'])
+
+    def test_hashtags_follow_post_indexing(self):
+        Post.objects.create(user=self.popular, content='#django #djangocon')
+        self.assertEqual([s.payload['name'] for s in autocomplete.suggest_hashtags('#djan', 5)], ['djangocon', 'django'])
+        with self.captureOnCommitCallbacks(execute=True):
+            Post.objects.create(user=self.other, content='#django again')
+            Post.objects.create(user=self.other, content='#djangonaut')
+        self.assertEqual(
+            [(s.payload['name'], s.weight) for s in autocomplete.suggest_hashtags('django', 5)],
+            [('django', 2), ('djangonaut', 1), ('djangocon', 1)],
+        )
+
+
+    def test_bulk_build_matches_incremental_index(self):
+        items = [(pk, (f'user{pk % 7}', f'name{pk}'), pk % 5, {'id': pk}) for pk in range(200)]
+        incremental = autocomplete.PrefixIndex()
+        for item in items:
+            incremental.add(*item)
+        bulk = autocomplete.PrefixIndex.from_items(reversed(items))
+        self.assertEqual(bulk._keys, incremental._keys)
+        for prefix in ('user', 'user3', 'name1', 'x'):
+            self.assertEqual(bulk.search(prefix, 10), incremental.search(prefix, 10))
+
+    def test_stale_index_rebuilds_in_background(self):
+        old = autocomplete.get_index('user')
+        with mock.patch.object(autocomplete, 'AUTOCOMPLETE_REFRESH_SECONDS', 0), \
+                mock.patch.object(autocomplete.threading, 'Thread') as thread:
+            self.assertIs(autocomplete.get_index('user'), old)
+            self.assertIs(autocomplete.get_index('user'), old)
+        thread.assert_called_once()
+        thread.return_value.start.assert_called_once()
+
+        # تحديث يصل أثناء البناء يُطبق على القديم ويُعاد على الجديد
+        with self.captureOnCommitCallbacks(execute=True):
+            CustomUser.objects.create_user('sami_new', password='pass12345')
+        self.assertIn('sami_new', self.usernames('sami'))
+        autocomplete.build('user')
+        new = autocomplete.get_index('user')
+        self.assertIsNot(new, old)
+        self.assertIn('sami_new', self.usernames('sami'))
+        self.assertEqual(autocomplete._pending, {})
+
+
+class SearchKeyTests(TestCase):
+    def test_arabic_forms_and_diacritics_fold(self):
+        self.assertEqual(normalize.search_key('أحمد'), normalize.search_key('احمد'))
+        self.assertEqual(normalize.search_key('مُحَمَّد'), 'محمد')
+        self.assertEqual(normalize.search_key('مكتبة إسلامية'), 'مكتبه اسلاميه')
+        self.assertEqual(normalize.search_key('مصطفى ١٢ Café'), 'مصطفي 12 cafe')
+
+    def test_search_matches_folded_forms_and_highlights_original(self):
+        user = CustomUser.objects.create_user('writer', password='pass12345', first_name='أحمد')
+        post = Post.objects.create(user=user, content='زرتُ المكتبةَ <الكبيرة> اليوم')
+        self.assertEqual(post.content_key, 'زرت المكتبه <الكبيره> اليوم')
+
+        hit, = fulltext.search('post', 'مكتبه', 10, snippets=True)
+        self.assertEqual(hit.id, post.pk)
+        self.assertIn('<mark>المكتبةَ</mark>', hit.snippet)
+        hit, = fulltext.search('post', 'الكبي', 10, snippets=True)
+        self.assertIn('&lt;<mark>الكبي</mark>رة&gt;', hit.snippet)
+        self.assertEqual([h.id for h in fulltext.search('user', 'احمد', 10)], [user.pk])
+
+    def test_save_with_update_fields_refreshes_keys(self):
+        user = CustomUser.objects.create_user('renamed', password='pass12345')
+        user.first_name = 'إيمان'
+        user.save(update_fields=['first_name'])
+        user.refresh_from_db()
+        self.assertEqual(user.name_key, 'ايمان')
@@ -0,0 +1,88 @@
+"""
+حالة المشاهد (الإعجابات والمتابعات) لصفحة كاملة
+
+بدلاً من استعلام EXISTS لكل عنصر، تُحمّل معرّفات ما أعجب به المستخدم
+الحالي وعلاقات المتابعة لجميع عناصر الصفحة باستعلام واحد لكل علاقة،
+ثم يتم التحقق في الذاكرة.
+"""
+from django.db.models import Q
+
+from friends.models import Follow
+from posts.models import Like
+
+
+class ViewerState:
+    """حالة المستخدم الحالي تجاه المنشورات والتعليقات والمستخدمين"""
+
+    def __init__(self, user):
+        self.user = user
+        self.liked_post_ids = set()
+        self.liked_comment_ids = set()
+        self.following_ids = set()
+        self.follower_ids = set()
+        # المعرّفات التي تم تحميلها بالفعل (سواء أعجب بها أم لا)
+        self._loaded_posts = set()
+        self._loaded_comments = set()
+        self._loaded_users = set()
+
+    def prime(self, posts=(), comments=(), users=()):
+        """تحميل الحالة لمجموعة عناصر دفعة واحدة"""
+        post_ids = {post.pk for post in posts} - self._loaded_posts
+        if post_ids:
+            self.liked_post_ids.update(Like.objects.filter(
+                user=self.user, post_id__in=post_ids
+            ).values_list('post_id', flat=True))
+            self._loaded_posts |= post_ids
+
+        comment_ids = {comment.pk for comment in comments} - self._loaded_comments
+        if comment_ids:
+            self.liked_comment_ids.update(Like.objects.filter(
+                user=self.user, comment_id__in=comment_ids
+            ).values_list('comment_id', flat=True))
+            self._loaded_comments |= comment_ids
+
+        user_ids = {user.pk for user in users} - self._loaded_users
+        if user_ids:
+            # الاتجاهان (يتابِع / يتابَع) في استعلام واحد
+            edges = Follow.objects.filter(
+                Q(follower=self.user, following_id__in=user_ids) |
+                Q(following=self.user, follower_id__in=user_ids)
+            ).values_list('follower_id', 'following_id')
+            for follower_id, following_id in edges:
+                if follower_id == self.user.pk:
+                    self.following_ids.add(following_id)
+                if following_id == self.user.pk:
+                    self.follower_ids.add(follower_id)
+            self._loaded_users |= user_ids
+
+    def has_liked_post(self, post):
+        if post.pk not in self._loaded_posts:
+            self.prime(posts=[post])
+        return post.pk in self.liked_post_ids
+
+    def has_liked_comment(self, comment):
+        if comment.pk not in self._loaded_comments:
+            self.prime(comments=[comment])
+        return comment.pk in self.liked_comment_ids
+
+    def is_following(self, user):
+        if user.pk not in self._loaded_users:
+            self.prime(users=[user])
+        return user.pk in self.following_ids
+
+    def is_followed_by(self, user):
+        if user.pk not in self._loaded_users:
+            self.prime(users=[user])
+        return user.pk in self.follower_ids
+
+
+def get_viewer_state(context):
+    """حالة المشاهد المشتركة بين كل serializers الطلب (أو None للزائر)"""
+    request = context.get('request')
+    if not request or not request.user.is_authenticated:
+        return None
+
+    state = context.get('viewer_state')
+    if state is None:
+        state = context['viewer_state'] = ViewerState(request.user)
+    return state
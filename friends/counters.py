@@ -0,0 +1,14 @@
+from django.db.models import F
+
+from accounts.models import CustomUser
+
+
+def update_follow_counts(follower, following, delta):
+    """
+    تعديل عدّادي المتابعة ذرياً في قاعدة البيانات (F) بدلاً من الزيادة
+    في الذاكرة ثم save() التي تضيع التحديثات المتزامنة.
+    """
+    CustomUser.objects.filter(pk=follower.pk).update(following_count=F('following_count') + delta)
+    CustomUser.objects.filter(pk=following.pk).update(followers_count=F('followers_count') + delta)
+    follower.refresh_from_db(fields=['following_count'])
+    following.refresh_from_db(fields=['followers_count'])
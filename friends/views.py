@@ -4,6 +4,7 @@ from django.contrib import messages
 from django.db.models import Q
 from accounts.models import CustomUser
 from .models import Friendship, Follow
+from .counters import update_follow_counts
 from django.db.models import Count
 
 
@@ -25,16 +26,11 @@ def toggle_follow(request, username):
     
     if not created:
         follow.delete()
-        request.user.following_count -= 1
-        user_to_follow.followers_count -= 1
         action = 'إلغاء المتابعة'
     else:
-        request.user.following_count += 1
-        user_to_follow.followers_count += 1
         action = 'المتابعة'
     
-    request.user.save()
-    user_to_follow.save()
+    update_follow_counts(request.user, user_to_follow, 1 if created else -1)
     
     messages.success(request, f'تم {action} @{username}')
     return redirect('profile_with_username', username=username)
@@ -0,0 +1,6 @@
+from .trending import trending
+
+
+def trends(request):
+    """الاتجاهات لكل القوالب؛ تُحسب فقط إذا استخدمها القالب"""
+    return {'trends': lambda: trending(limit=5)}
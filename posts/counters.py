@@ -0,0 +1,147 @@
+"""
+العدّادات المؤجلة (write-behind)
+
+بدلاً من قراءة الصف وتعديله ثم post.save() عند كل إعجاب (مما يعيد كتابة
+كل الأعمدة ويضيع التحديثات المتزامنة)، يُسجَّل كل تغيير كصف مستقل في
+CounterDelta، ثم تُدمج التغييرات في الجداول الأصلية على دفعات بـ
+UPDATE ... SET field = field + n عبر flush_counters.
+
+القراءة تضيف التغييرات المعلّقة إلى القيم المخزنة (merge_pending) حتى
+تبقى الأعداد صحيحة قبل الدمج.
+"""
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q
+
+from . import timeline
+from .models import Comment, CounterDelta, Post
+
+COUNTER_FIELDS = {
+    'post': ('likes_count', 'comments_count', 'shares_count'),
+    'comment': ('likes_count',),
+}
+COUNTER_MODELS = {'post': Post, 'comment': Comment}
+COUNTER_FLUSH_BATCH = getattr(settings, 'COUNTER_FLUSH_BATCH', 5000)
+
+
+def _target(obj):
+    for target, model in COUNTER_MODELS.items():
+        if isinstance(obj, model):
+            return target
+    raise TypeError(f'لا توجد عدّادات للنوع {type(obj).__name__}')
+
+
+def record(obj, field, delta):
+    """تسجيل تغيير على عدّاد دون لمس صف الكائن"""
+    target = _target(obj)
+    if field not in COUNTER_FIELDS[target]:
+        raise ValueError(f'{field} ليس عدّاداً في {target}')
+
+    CounterDelta.objects.create(target=target, object_id=obj.pk, field=field, delta=delta)
+    if target == 'post':
+        timeline.bump_versions(author_ids=[obj.user_id])
+    # الكائن المدموج مسبقاً يبقى متسقاً مع ما سيراه القارئ التالي
+    if getattr(obj, '_counters_merged', False):
+        setattr(obj, field, getattr(obj, field) + delta)
+
+
+def pending(target, ids):
+    """التغييرات المعلّقة لمجموعة كائنات: {id: {field: delta}}"""
+    return _pending(Q(target=target, object_id__in=ids)).get(target, {})
+
+
+def _pending(q):
+    rows = CounterDelta.objects.filter(q).values_list('target', 'object_id', 'field', 'delta')
+    totals = defaultdict(lambda: defaultdict(lambda: defaultdict(int)))
+    for target, object_id, field, delta in rows:
+        totals[target][object_id][field] += delta
+    return totals
+
+
+def merge_pending(objects):
+    """
+    إضافة التغييرات المعلّقة إلى عدّادات كائنات (منشورات وتعليقات)
+    باستعلام واحد. الكائنات المدموجة مسبقاً تُتجاهل.
+    """
+    by_target = defaultdict(dict)
+    for obj in objects:
+        if not getattr(obj, '_counters_merged', False):
+            by_target[_target(obj)].setdefault(obj.pk, []).append(obj)
+    if not by_target:
+        return
+
+    q = Q()
+    for target, objs in by_target.items():
+        q |= Q(target=target, object_id__in=list(objs))
+    totals = _pending(q)
+
+    for target, objs in by_target.items():
+        for object_id, same in objs.items():
+            deltas = totals[target].get(object_id, {})
+            for obj in same:
+                for field, delta in deltas.items():
+                    setattr(obj, field, getattr(obj, field) + delta)
+                obj._counters_merged = True
+
+
+def current(obj, field):
+    """القيمة الحالية للعدّاد بعد إضافة المعلّق"""
+    merge_pending([obj])
+    return getattr(obj, field)
+
+
+def apply_deltas(target, totals):
+    """
+    تطبيق تغييرات {id: {field: delta}} مباشرة على الجدول.
+    الكائنات التي لها نفس مجموع التغييرات تُحدَّث بـ UPDATE واحد.
+    """
+    groups = defaultdict(list)
+    for object_id, deltas in totals.items():
+        changes = tuple(sorted((f, d) for f, d in deltas.items() if d))
+        if changes:
+            groups[changes].append(object_id)
+
+    # update() لا يغيّر updated_at ولا يستدعي save()
+    for changes, object_ids in groups.items():
+        COUNTER_MODELS[target].objects.filter(pk__in=object_ids).update(
+            **{field: F(field) + delta for field, delta in changes}
+        )
+
+
+def flush_counters(batch_size=COUNTER_FLUSH_BATCH):
+    """
+    دمج دفعة من التغييرات المعلّقة في الجداول الأصلية.
+    يُرجع عدد التغييرات المدموجة.
+    """
+    with transaction.atomic():
+        rows = list(CounterDelta.objects.order_by('id').values_list(
+            'id', 'target', 'object_id', 'field', 'delta'
+        )[:batch_size])
+        if not rows:
+            return 0
+
+        totals = defaultdict(lambda: defaultdict(lambda: defaultdict(int)))
+        for _, target, object_id, field, delta in rows:
+            totals[target][object_id][field] += delta
+
+        for target, deltas in totals.items():
+            apply_deltas(target, deltas)
+        if totals['post']:
+            timeline.bump_versions(author_ids=Post.objects.filter(
+                pk__in=list(totals['post'])
+            ).values_list('user_id', flat=True).distinct())
+
+        # الحذف بالمعرّفات المقروءة نفسها حتى لا يضيع تغيير أُدرج أثناء الدمج
+        CounterDelta.objects.filter(id__in=[row[0] for row in rows]).delete()
+    return len(rows)
+
+
+def flush_all(batch_size=COUNTER_FLUSH_BATCH):
+    total = 0
+    while True:
+        flushed = flush_counters(batch_size)
+        total += flushed
+        if flushed < batch_size:
+            return total
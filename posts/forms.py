@@ -1,7 +1,21 @@
 from django import forms
+from django.core.files.uploadedfile import UploadedFile
+from . import uploads
 from .models import Post, Comment
 
-class PostForm(forms.ModelForm):
+class VideoUploadMixin:
+    """الفيديو المرفوع يُفحص كما في الرفع على أجزاء (posts.uploads)"""
+    
+    def clean_video(self):
+        video = self.cleaned_data.get('video')
+        if isinstance(video, UploadedFile):
+            try:
+                uploads.check_video_file(video)
+            except uploads.UploadError as e:
+                raise forms.ValidationError(str(e))
+        return video
+
+class PostForm(VideoUploadMixin, forms.ModelForm):
     content = forms.CharField(
         widget=forms.Textarea(attrs={
             'rows': 3,
@@ -26,7 +40,7 @@ class PostForm(forms.ModelForm):
             }),
         }
 
-class EditPostForm(forms.ModelForm):
+class EditPostForm(VideoUploadMixin, forms.ModelForm):
     content = forms.CharField(
         widget=forms.Textarea(attrs={
             'rows': 4,
@@ -71,17 +85,16 @@ class EditPostForm(forms.ModelForm):
         post = super().save(commit=False)
         
         # إزالة الصورة إذا طلب المستخدم
+        # (الملف يُحذف عند الحفظ إن لم يشر إليه غيره، انظر core.blobs)
         if self.cleaned_data.get('remove_image'):
-            post.image.delete(save=False)
             post.image = None
         
         # إزالة الفيديو إذا طلب المستخدم
         if self.cleaned_data.get('remove_video'):
-            post.video.delete(save=False)
             post.video = None
         
         if commit:
-            post.save()
+            post.save(update_fields=['content', 'image', 'video', 'updated_at'])
         
         return post
 
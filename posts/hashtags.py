@@ -0,0 +1,111 @@
+"""
+فهرسة الهاشتاجات
+
+عند حفظ منشور تغيّر محتواه تُقارن مجموعة الهاشتاجات الجديدة بالمرتبطة
+به حالياً، ثم تُضاف الفروقات وتُحذف دفعة واحدة (bulk) مع تعديل
+usage_count ذرياً، بدلاً من get_or_create وتحميل كل منشورات الهاشتاج
+لكل وسم على حدة. التغييرات نفسها تُسجَّل في عدّادات الاتجاهات وتُبلَّغ
+لفهرس الاقتراح بعد تأكيد المعاملة.
+"""
+import re
+from collections import Counter, defaultdict
+
+from django.db import transaction
+from django.db.models import F
+
+from core import autocomplete
+
+from . import trending
+from .models import Hashtag
+
+HASHTAG_RE = re.compile(r'#(\w+)')
+HASHTAG_MAX_LENGTH = Hashtag._meta.get_field('name').max_length
+PostHashtag = Hashtag.posts.through
+
+
+def extract_tags(content):
+    """أسماء الهاشتاجات الفريدة في النص (بحروف صغيرة)"""
+    return {
+        name.lower() for name in HASHTAG_RE.findall(content or '')
+        if len(name) <= HASHTAG_MAX_LENGTH
+    }
+
+
+def _ensure_hashtags(names):
+    """معرّفات الهاشتاجات بالأسماء، مع إنشاء الناقص منها دفعة واحدة (بترتيب ثابت)"""
+    Hashtag.objects.bulk_create([Hashtag(name=name) for name in sorted(names)], ignore_conflicts=True)
+    return dict(Hashtag.objects.filter(name__in=names).values_list('name', 'id'))
+
+
+def index_post(post):
+    """
+    مزامنة هاشتاجات المنشور مع محتواه.
+    يُرجع (الأسماء المضافة، الأسماء المحذوفة).
+    """
+    current = dict(
+        PostHashtag.objects.filter(post_id=post.pk).values_list('hashtag__name', 'hashtag_id')
+    )
+    tags = extract_tags(post.content)
+    added = tags - current.keys()
+    removed = current.keys() - tags
+    if not added and not removed:
+        return set(), set()
+
+    usage = {}
+    with transaction.atomic():
+        if added:
+            ids = _ensure_hashtags(added)
+            usage.update({(ids[name], name): 1 for name in added})
+            PostHashtag.objects.bulk_create(
+                [PostHashtag(post_id=post.pk, hashtag_id=ids[name]) for name in added],
+                ignore_conflicts=True,
+            )
+            Hashtag.objects.filter(id__in=ids.values()).update(usage_count=F('usage_count') + 1)
+            if not post.is_deleted:
+                trending.record(ids.values(), 1, post.created_at)
+
+        if removed:
+            removed_ids = [current[name] for name in removed]
+            usage.update({(current[name], name): -1 for name in removed})
+            PostHashtag.objects.filter(post_id=post.pk, hashtag_id__in=removed_ids).delete()
+            Hashtag.objects.filter(id__in=removed_ids).update(usage_count=F('usage_count') - 1)
+            if not post.is_deleted:
+                trending.record(removed_ids, -1, post.created_at)
+        transaction.on_commit(lambda: autocomplete.hashtags_used(usage))
+
+    return added, removed
+
+
+def set_post_visible(post, visible):
+    """إضافة هاشتاجات المنشور إلى الاتجاهات أو إزالتها عند الحذف والاستعادة"""
+    hashtag_ids = PostHashtag.objects.filter(post_id=post.pk).values_list('hashtag_id', flat=True)
+    trending.record(hashtag_ids, 1 if visible else -1, post.created_at)
+
+
+def index_new_posts(posts):
+    """فهرسة منشورات جديدة (بلا هاشتاجات سابقة) دفعة واحدة، مثل الإدخال المجمّع"""
+    tags = {post.pk: extract_tags(post.content) for post in posts}
+    names = set().union(*tags.values())
+    if not names:
+        return
+
+    ids = _ensure_hashtags(names)
+    usage = Counter()
+    events = Counter()
+    links = []
+    for post in posts:
+        for name in tags[post.pk]:
+            links.append(PostHashtag(post_id=post.pk, hashtag_id=ids[name]))
+            usage[(ids[name], name)] += 1
+            if not post.is_deleted:
+                events[(ids[name], post.created_at)] += 1
+
+    with transaction.atomic():
+        PostHashtag.objects.bulk_create(links, ignore_conflicts=True, batch_size=1000)
+        by_count = defaultdict(list)
+        for (hashtag_id, _), count in usage.items():
+            by_count[count].append(hashtag_id)
+        for count, hashtag_ids in by_count.items():
+            Hashtag.objects.filter(id__in=hashtag_ids).update(usage_count=F('usage_count') + count)
+        trending.record_many(events)
+        transaction.on_commit(lambda: autocomplete.hashtags_used(usage))
@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from posts.uploads import UPLOAD_SESSION_TTL, expire_sessions
+
+
+class Command(BaseCommand):
+    help = 'حذف جلسات رفع الفيديو غير المكتملة المتروكة وملفاتها الجزئية'
+
+    def handle(self, *args, **options):
+        deleted = expire_sessions()
+        self.stdout.write(self.style.SUCCESS(f'تم حذف {deleted} جلسة لم تتقدم منذ {UPLOAD_SESSION_TTL}'))
@@ -0,0 +1,27 @@
+import time
+
+from django.core.management.base import BaseCommand
+from posts.counters import COUNTER_FLUSH_BATCH, flush_all
+
+
+class Command(BaseCommand):
+    help = 'دمج التغييرات المعلّقة على عدّادات المنشورات والتعليقات في جداولها'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=COUNTER_FLUSH_BATCH)
+        parser.add_argument(
+            '--interval', type=float, default=0,
+            help='التكرار كل عدد من الثواني بدلاً من التشغيل مرة واحدة'
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            started = time.monotonic()
+            total = flush_all(options['batch_size'])
+            if total or not options['interval']:
+                elapsed = time.monotonic() - started
+                self.stdout.write(self.style.SUCCESS(f'تم دمج {total} تغيير في {elapsed:.2f} ث'))
+
+            if not options['interval']:
+                return
+            time.sleep(options['interval'])
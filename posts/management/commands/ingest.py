@@ -0,0 +1,272 @@
+import json
+import sys
+import time
+from collections import Counter, defaultdict
+
+from django.contrib.auth.hashers import identify_hasher, make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from accounts.models import CustomUser, UserSettings
+from core import searchcache
+from core.normalize import fill_search_keys
+from friends.models import Follow
+from posts import counters, hashtags, timeline
+from posts.models import Like, Post
+
+# ترتيب الإدخال داخل كل دفعة حتى تسبق الصفوف ما يعتمد عليها
+ROW_TYPES = ('user', 'post', 'follow', 'like')
+
+
+class Command(BaseCommand):
+    help = (
+        'إدخال مجمّع من ملفات JSONL (سطر لكل صف) بـ bulk_create، مع تحديث '
+        'الهاشتاجات والعدّادات والخطوط الزمنية دفعة واحدة. أشكال الصفوف:\n'
+        '{"type": "user", "username": ..., "email": ..., "password": ...}\n'
+        '{"type": "post", "id": اختياري, "user": اسم المستخدم, "content": ..., "created_at": اختياري}\n'
+        '{"type": "follow", "follower": ..., "following": ...}\n'
+        '{"type": "like", "user": ..., "post": معرّف المنشور}'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('files', nargs='+', help='ملفات JSONL، أو - للقراءة من الإدخال القياسي')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        self.batch_size = options['batch_size']
+        if self.batch_size < 1:
+            raise CommandError('--batch-size يجب أن يكون موجباً')
+
+        self.buffers = {row_type: [] for row_type in ROW_TYPES}
+        self.created = Counter()
+        self.skipped = Counter()
+        self.lines = 0
+        self.explicit_post_ids = False
+        self.started = time.monotonic()
+
+        for path in options['files']:
+            if path == '-':
+                self.read(sys.stdin, '<stdin>')
+            else:
+                try:
+                    with open(path, encoding='utf-8') as stream:
+                        self.read(stream, path)
+                except OSError as e:
+                    raise CommandError(f'تعذر فتح {path}: {e}')
+        self.flush()
+
+        if self.explicit_post_ids:
+            # المعرّفات الصريحة لا تحرّك التسلسل في PostgreSQL وما شابهها
+            with connection.cursor() as cursor:
+                for sql in connection.ops.sequence_reset_sql(no_style(), [Post]):
+                    cursor.execute(sql)
+
+        elapsed = time.monotonic() - self.started
+        for row_type in ROW_TYPES:
+            self.stdout.write(f'{row_type}: {self.created[row_type]} أُدخل، {self.skipped[row_type]} تُجوهل')
+        self.stdout.write(self.style.SUCCESS(
+            f'{self.lines} سطر في {elapsed:.2f} ث ({self.lines / elapsed if elapsed else 0:.0f} سطر/ث)'
+        ))
+
+    def read(self, stream, name):
+        for line_no, line in enumerate(stream, 1):
+            line = line.strip()
+            if not line:
+                continue
+            self.lines += 1
+
+            try:
+                row = json.loads(line)
+                row_type = row['type']
+            except (ValueError, KeyError, TypeError):
+                self.skip('invalid', f'{name}:{line_no}: سطر غير صالح')
+                continue
+            if row_type not in self.buffers:
+                self.skip('invalid', f'{name}:{line_no}: نوع غير معروف {row_type!r}')
+                continue
+
+            buffer = self.buffers[row_type]
+            buffer.append(row)
+            if len(buffer) >= self.batch_size:
+                self.flush()
+
+    def skip(self, row_type, message=None, count=1):
+        self.skipped[row_type] += count
+        # عرض أول الأخطاء فقط حتى لا يغرق الإخراج
+        if message and sum(self.skipped.values()) <= 20:
+            self.stderr.write(message)
+
+    def flush(self):
+        if not any(self.buffers.values()):
+            return
+
+        with transaction.atomic():
+            for row_type in ROW_TYPES:
+                rows = self.buffers[row_type]
+                if rows:
+                    getattr(self, f'ingest_{row_type}s')(rows)
+                self.buffers[row_type] = []
+
+        elapsed = time.monotonic() - self.started
+        self.stdout.write(f'  {self.lines} سطر ({self.lines / elapsed if elapsed else 0:.0f} سطر/ث)')
+
+    def user_ids(self, usernames):
+        return dict(CustomUser.objects.filter(username__in=set(usernames)).values_list('username', 'id'))
+
+    def parse_created_at(self, row):
+        value = row.get('created_at')
+        created_at = parse_datetime(value) if isinstance(value, str) else None
+        if created_at is not None and timezone.is_naive(created_at):
+            created_at = timezone.make_aware(created_at)
+        return created_at
+
+    def ingest_users(self, rows):
+        existing = self.user_ids(row.get('username') for row in rows)
+        users, seen = [], set()
+        for row in rows:
+            username = row.get('username')
+            if not username or username in existing or username in seen:
+                self.skip('user')
+                continue
+            seen.add(username)
+
+            password = row.get('password')
+            try:
+                # كلمة مرور مشفّرة مسبقاً تُنسخ كما هي؛ النص الصريح يُشفّر (أبطأ)
+                identify_hasher(password)
+            except (ValueError, TypeError):
+                password = make_password(password or None)
+
+            users.append(CustomUser(
+                username=username,
+                email=row.get('email', ''),
+                password=password,
+                first_name=row.get('first_name', ''),
+                last_name=row.get('last_name', ''),
+                bio=row.get('bio', ''),
+                created_at=self.parse_created_at(row) or timezone.now(),
+            ))
+
+        # bulk_create لا يستدعي save() الذي يملأ مفاتيح البحث
+        for user in users:
+            fill_search_keys(user)
+        CustomUser.objects.bulk_create(users, batch_size=self.batch_size)
+        # bulk_create لا يرسل إشارات الحفظ التي تغيّر إصدار نتائج البحث
+        transaction.on_commit(lambda: searchcache.bump('user'))
+        # bulk_create لا يستدعي save() ولا إشارة إنشاء الإعدادات
+        new_ids = self.user_ids(seen).values()
+        UserSettings.objects.bulk_create(
+            [UserSettings(user_id=user_id) for user_id in new_ids],
+            ignore_conflicts=True,
+        )
+        self.created['user'] += len(users)
+
+    def ingest_posts(self, rows):
+        user_ids = self.user_ids(row.get('user') for row in rows)
+        requested_ids = [row['id'] for row in rows if isinstance(row.get('id'), int)]
+        taken = set(Post.objects.filter(id__in=requested_ids).values_list('id', flat=True))
+
+        posts, created_at = [], {}
+        for row in rows:
+            user_id = user_ids.get(row.get('user'))
+            post_id = row.get('id') if isinstance(row.get('id'), int) else None
+            if user_id is None or not row.get('content') or post_id in taken:
+                self.skip('post')
+                continue
+            if post_id is not None:
+                taken.add(post_id)
+                self.explicit_post_ids = True
+
+            post = Post(
+                id=post_id,
+                user_id=user_id,
+                content=row['content'],
+                post_type=row.get('post_type', 'text'),
+                is_deleted=bool(row.get('is_deleted', False)),
+            )
+            fill_search_keys(post)
+            posts.append(post)
+            created_at[id(post)] = self.parse_created_at(row)
+
+        Post.objects.bulk_create(posts, batch_size=self.batch_size)
+        transaction.on_commit(lambda: searchcache.bump('post'))
+
+        # auto_now_add يتجاهل التاريخ الممرر فيُعاد ضبطه بعد الإدخال
+        dated = []
+        for post in posts:
+            if created_at[id(post)] is not None:
+                post.created_at = post.updated_at = created_at[id(post)]
+                dated.append(post)
+        Post.objects.bulk_update(dated, ['created_at', 'updated_at'], batch_size=self.batch_size)
+
+        hashtags.index_new_posts(posts)
+        timeline.fan_out_posts(posts)
+        self.created['post'] += len(posts)
+
+    def ingest_follows(self, rows):
+        user_ids = self.user_ids(
+            [row.get('follower') for row in rows] + [row.get('following') for row in rows]
+        )
+        pairs = set()
+        for row in rows:
+            pair = (user_ids.get(row.get('follower')), user_ids.get(row.get('following')))
+            if None in pair or pair[0] == pair[1] or pair in pairs:
+                self.skip('follow')
+                continue
+            pairs.add(pair)
+
+        existing = set(Follow.objects.filter(
+            follower_id__in={follower for follower, _ in pairs},
+            following_id__in={following for _, following in pairs},
+        ).values_list('follower_id', 'following_id'))
+        new = pairs - existing
+        self.skipped['follow'] += len(pairs & existing)
+
+        Follow.objects.bulk_create(
+            [Follow(follower_id=follower, following_id=following) for follower, following in new],
+            batch_size=self.batch_size,
+        )
+        self.increment('following_count', Counter(follower for follower, _ in new))
+        self.increment('followers_count', Counter(following for _, following in new))
+        timeline.follows_added(new)
+        self.created['follow'] += len(new)
+
+    def increment(self, field, counts):
+        by_count = defaultdict(list)
+        for user_id, count in counts.items():
+            by_count[count].append(user_id)
+        for count, user_ids in by_count.items():
+            CustomUser.objects.filter(id__in=user_ids).update(**{field: F(field) + count})
+
+    def ingest_likes(self, rows):
+        user_ids = self.user_ids(row.get('user') for row in rows)
+        post_ids = set(Post.objects.filter(
+            id__in=[row.get('post') for row in rows if isinstance(row.get('post'), int)]
+        ).values_list('id', flat=True))
+
+        pairs = set()
+        for row in rows:
+            pair = (user_ids.get(row.get('user')), row.get('post'))
+            if pair[0] is None or pair[1] not in post_ids or pair in pairs:
+                self.skip('like')
+                continue
+            pairs.add(pair)
+
+        existing = set(Like.objects.filter(
+            user_id__in={user_id for user_id, _ in pairs},
+            post_id__in={post_id for _, post_id in pairs},
+        ).values_list('user_id', 'post_id'))
+        new = pairs - existing
+        self.skipped['like'] += len(pairs & existing)
+
+        Like.objects.bulk_create(
+            [Like(user_id=user_id, post_id=post_id) for user_id, post_id in new],
+            batch_size=self.batch_size,
+        )
+        likes = Counter(post_id for _, post_id in new)
+        counters.apply_deltas('post', {post_id: {'likes_count': n} for post_id, n in likes.items()})
+        self.created['like'] += len(new)
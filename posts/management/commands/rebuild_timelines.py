@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand, CommandError
+from accounts.models import CustomUser
+from posts.timeline import rebuild_timeline
+
+
+class Command(BaseCommand):
+    help = 'إعادة بناء الخطوط الزمنية المُجهّزة مسبقاً من جداول المتابعة والمنشورات'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', dest='username', help='إعادة بناء خط مستخدم واحد فقط')
+
+    def handle(self, *args, **options):
+        users = CustomUser.objects.all().order_by('id')
+        if options['username']:
+            users = users.filter(username=options['username'])
+            if not users.exists():
+                raise CommandError(f"المستخدم {options['username']} غير موجود")
+
+        total = 0
+        for user in users.iterator():
+            rebuild_timeline(user)
+            total += 1
+
+        self.stdout.write(self.style.SUCCESS(f'تمت إعادة بناء {total} خط زمني'))
@@ -0,0 +1,152 @@
+import json
+import os
+import time
+from collections import defaultdict
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Count, F
+
+from accounts.models import CustomUser
+from friends.models import Follow
+from posts import counters
+from posts.models import Comment, Hashtag, Like, Post
+
+# لكل جدول: الحقل المخزن ← (الجدول الذي يُعد منه، عمود الربط)
+COUNTERS = {
+    'posts': (Post, 'post', {
+        'likes_count': (Like, 'post_id'),
+        'comments_count': (Comment, 'post_id'),
+    }),
+    'comments': (Comment, 'comment', {
+        'likes_count': (Like, 'comment_id'),
+    }),
+    'users': (CustomUser, None, {
+        'followers_count': (Follow, 'following_id'),
+        'following_count': (Follow, 'follower_id'),
+    }),
+    'hashtags': (Hashtag, None, {
+        'usage_count': (Hashtag.posts.through, 'hashtag_id'),
+    }),
+}
+
+
+class Command(BaseCommand):
+    help = (
+        'إصلاح العدّادات المخزنة (الإعجابات والتعليقات والمتابعة والهاشتاجات) '
+        'بمقارنتها بالأعداد الفعلية على دفعات مرتبة حسب المعرّف'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--only', choices=list(COUNTERS), action='append', help='جدول محدد (يمكن تكراره)')
+        parser.add_argument('--chunk-size', type=int, default=2000)
+        parser.add_argument('--dry-run', action='store_true', help='عرض الفروق دون كتابة')
+        parser.add_argument(
+            '--checkpoint',
+            help='ملف JSON لحفظ آخر معرّف تمت معالجته، والاستئناف منه عند إعادة التشغيل'
+        )
+
+    def handle(self, *args, **options):
+        if options['chunk_size'] < 1:
+            raise CommandError('--chunk-size يجب أن يكون موجباً')
+
+        self.dry_run = options['dry_run']
+        self.checkpoint_path = options['checkpoint']
+        self.checkpoint = self.load_checkpoint()
+
+        for name in options['only'] or COUNTERS:
+            self.reconcile(name, options['chunk_size'])
+
+        if self.checkpoint_path and not self.dry_run and os.path.exists(self.checkpoint_path):
+            os.remove(self.checkpoint_path)
+
+    def load_checkpoint(self):
+        if not self.checkpoint_path or not os.path.exists(self.checkpoint_path):
+            return {}
+        with open(self.checkpoint_path) as f:
+            return json.load(f)
+
+    def save_checkpoint(self, name, last_id):
+        if not self.checkpoint_path or self.dry_run:
+            return
+        self.checkpoint[name] = last_id
+        with open(self.checkpoint_path, 'w') as f:
+            json.dump(self.checkpoint, f)
+
+    def reconcile(self, name, chunk_size):
+        model, target, fields = COUNTERS[name]
+        last_id = self.checkpoint.get(name, 0)
+        if last_id is None:
+            self.stdout.write(f'{name}: تمت معالجته في تشغيل سابق')
+            return
+        if last_id:
+            self.stdout.write(f'{name}: استئناف بعد المعرّف {last_id}')
+
+        scanned = fixed = 0
+        started = time.monotonic()
+        while True:
+            ids = list(
+                model.objects.filter(pk__gt=last_id).order_by('pk')
+                .values_list('pk', flat=True)[:chunk_size]
+            )
+            if not ids:
+                break
+
+            changed = self.reconcile_chunk(model, target, fields, ids)
+            scanned += len(ids)
+            fixed += len(changed)
+            last_id = ids[-1]
+            self.save_checkpoint(name, last_id)
+
+            for pk, values in changed[:20] if self.dry_run else ():
+                self.stdout.write(f'  {name} #{pk}: {values}')
+
+        self.save_checkpoint(name, None)
+        elapsed = time.monotonic() - started
+        rate = scanned / elapsed if elapsed else scanned
+        verb = 'يحتاج إصلاحاً' if self.dry_run else 'تم إصلاحه'
+        self.stdout.write(self.style.SUCCESS(
+            f'{name}: {scanned} صف، {fixed} {verb}، {elapsed:.2f} ث ({rate:.0f} صف/ث)'
+        ))
+
+    def reconcile_chunk(self, model, target, fields, ids):
+        """
+        القراءة والتصحيح في معاملة واحدة مع قفل صفوف الدفعة، والتصحيح فرق
+        يُضاف بـ F() لا قيمة مطلقة: إعجاب أو دمج بين القراءة والكتابة يغيّر
+        القيمة المخزنة والمعلّق معاً فلا يغيّر الفرق ولا يضيع.
+        """
+        with transaction.atomic():
+            rows = list(
+                model.objects.select_for_update().filter(pk__in=ids).order_by('pk')
+                .values_list('pk', *fields)
+            )
+
+            actual = {}
+            for field, (source, column) in fields.items():
+                actual[field] = dict(
+                    source.objects.filter(**{f'{column}__in': ids})
+                    .values(column).annotate(n=Count('pk')).values_list(column, 'n')
+                )
+
+            # التغييرات المعلّقة ستُضاف لاحقاً عند الدمج، فتُطرح من القيمة المخزنة
+            pending = counters.pending(target, ids) if target else {}
+
+            changed = []
+            groups = defaultdict(list)
+            for pk, *stored in rows:
+                deltas, values = {}, {}
+                for field, current in zip(fields, stored):
+                    expected = actual[field].get(pk, 0) - pending.get(pk, {}).get(field, 0)
+                    if expected != current:
+                        deltas[field], values[field] = expected - current, expected
+                if values:
+                    changed.append((pk, values))
+                    groups[tuple(sorted(deltas.items()))].append(pk)
+
+            if not self.dry_run:
+                # update() لا يستدعي save() ولا يغيّر updated_at
+                for deltas, pks in groups.items():
+                    model.objects.filter(pk__in=pks).update(
+                        **{field: F(field) + delta for field, delta in deltas}
+                    )
+        return changed
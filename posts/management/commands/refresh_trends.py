@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from posts.trending import WINDOWS, prune, refresh
+
+
+class Command(BaseCommand):
+    help = 'تحديث قوائم الاتجاهات المخزنة وحذف فترات العدّ القديمة'
+
+    def handle(self, *args, **options):
+        deleted = prune()
+        for window in WINDOWS:
+            trends = refresh(window)
+            self.stdout.write(f'{window}: {len(trends)} هاشتاج')
+        self.stdout.write(self.style.SUCCESS(f'تم حذف {deleted} فترة قديمة'))
@@ -0,0 +1,54 @@
+# Generated by Django 6.0 on 2026-10-18 11:11
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_timelines(apps, schema_editor):
+    Post = apps.get_model('posts', 'Post')
+    Follow = apps.get_model('friends', 'Follow')
+    TimelineEntry = apps.get_model('posts', 'TimelineEntry')
+
+    followers = {}
+    for follower_id, following_id in Follow.objects.values_list('follower_id', 'following_id'):
+        followers.setdefault(following_id, []).append(follower_id)
+
+    batch = []
+    for post in Post.objects.filter(is_deleted=False).only('id', 'user_id', 'created_at').iterator():
+        for owner_id in [post.user_id] + followers.get(post.user_id, []):
+            batch.append(TimelineEntry(
+                owner_id=owner_id, post_id=post.id,
+                author_id=post.user_id, created_at=post.created_at,
+            ))
+        if len(batch) >= 1000:
+            TimelineEntry.objects.bulk_create(batch, ignore_conflicts=True)
+            batch = []
+    TimelineEntry.objects.bulk_create(batch, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0004_post_is_deleted'),
+        ('friends', '0002_alter_follow_options_alter_friendship_options_and_more'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TimelineEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField()),
+                ('author', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('owner', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='timeline_entries', to=settings.AUTH_USER_MODEL)),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='timeline_entries', to='posts.post')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['owner', '-created_at', '-post'], name='timeline_owner_position'), models.Index(fields=['owner', 'author'], name='timeline_owner_author')],
+                'unique_together': {('owner', 'post')},
+            },
+        ),
+        migrations.RunPython(backfill_timelines, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,68 @@
+# Generated by Django 6.0 on 2026-10-18 11:16
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+PATH_ALPHABET = '0123456789abcdefghijklmnopqrstuvwxyz'
+PATH_STEP = 8
+
+
+def encode_segment(pk):
+    digits = ''
+    while pk:
+        pk, remainder = divmod(pk, len(PATH_ALPHABET))
+        digits = PATH_ALPHABET[remainder] + digits
+    return digits.rjust(PATH_STEP, '0')
+
+
+def backfill_paths(apps, schema_editor):
+    Comment = apps.get_model('posts', 'Comment')
+    # الحد نفسه في posts.threads.comment_path
+    max_depth = Comment._meta.get_field('path').max_length // PATH_STEP - 1
+
+    # الأب دائماً أقدم من الرد فالترتيب حسب المعرّف يضمن وجود مسار الأب
+    paths = {}
+    batch = []
+    for comment in Comment.objects.order_by('id').only('id', 'parent_id').iterator():
+        parent = paths.get(comment.parent_id)
+        if parent is None:
+            comment.path, comment.depth = encode_segment(comment.id), 0
+        else:
+            prefix, depth = parent[0], parent[1] + 1
+            if depth > max_depth:
+                # الردود الأعمق من الحد تُعلّق كإخوة لأبيها
+                prefix, depth = prefix[:-PATH_STEP], parent[1]
+            comment.path, comment.depth = prefix + encode_segment(comment.id), depth
+        paths[comment.id] = (comment.path, comment.depth)
+        batch.append(comment)
+        if len(batch) >= 1000:
+            Comment.objects.bulk_update(batch, ['path', 'depth'])
+            batch = []
+    Comment.objects.bulk_update(batch, ['path', 'depth'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0005_timelineentry'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='comment',
+            name='depth',
+            field=models.PositiveSmallIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='comment',
+            name='path',
+            field=models.CharField(blank=True, default='', editable=False, max_length=255),
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['post', 'path'], name='comment_post_path'),
+        ),
+        migrations.RunPython(backfill_paths, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,58 @@
+# Generated by Django 6.0 on 2026-10-18 11:26
+
+from collections import Counter
+from datetime import timedelta
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def backfill_buckets(apps, schema_editor):
+    Hashtag = apps.get_model('posts', 'Hashtag')
+    HashtagBucket = apps.get_model('posts', 'HashtagBucket')
+    PostHashtag = Hashtag.posts.through
+
+    # منشورات آخر 7 أيام فقط (أطول نافذة للاتجاهات)
+    now = timezone.now()
+    rows = PostHashtag.objects.filter(
+        post__created_at__gte=now - timedelta(days=7),
+        post__is_deleted=False,
+    ).values_list('hashtag_id', 'post__created_at')
+
+    counts = Counter()
+    for hashtag_id, created_at in rows.iterator():
+        minute = created_at.replace(second=0, microsecond=0)
+        counts[(hashtag_id, 'hour', minute.replace(minute=0))] += 1
+        if created_at >= now - timedelta(hours=1):
+            counts[(hashtag_id, 'minute', minute)] += 1
+
+    HashtagBucket.objects.bulk_create([
+        HashtagBucket(hashtag_id=hashtag_id, resolution=resolution, start=start, count=count)
+        for (hashtag_id, resolution, start), count in counts.items()
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0007_counterdelta'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='HashtagBucket',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('resolution', models.CharField(choices=[('minute', 'Minute'), ('hour', 'Hour')], max_length=10)),
+                ('start', models.DateTimeField()),
+                ('count', models.IntegerField(default=0)),
+                ('hashtag', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='buckets', to='posts.hashtag')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['resolution', 'start'], name='hashtag_bucket_window')],
+                'unique_together': {('hashtag', 'resolution', 'start')},
+            },
+        ),
+        migrations.RunPython(backfill_buckets, migrations.RunPython.noop),
+    ]
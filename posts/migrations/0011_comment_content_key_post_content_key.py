@@ -0,0 +1,31 @@
+# Generated by Django 6.0 on 2026-10-18 11:59
+
+from django.db import migrations, models
+
+from core.normalize import refill_search_keys
+
+
+def backfill_keys(apps, schema_editor):
+    for name in ('Post', 'Comment'):
+        refill_search_keys(apps.get_model('posts', name), {'content_key': ('content',)})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0010_uploadsession'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='comment',
+            name='content_key',
+            field=models.TextField(blank=True, default='', editable=False),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='content_key',
+            field=models.TextField(blank=True, default='', editable=False),
+        ),
+        migrations.RunPython(backfill_keys, migrations.RunPython.noop),
+    ]
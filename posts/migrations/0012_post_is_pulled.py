@@ -0,0 +1,43 @@
+# Generated by Django 6.0 on 2026-10-18 12:15
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Exists, OuterRef, Q
+
+
+def mark_pulled(apps, schema_editor):
+    """
+    المنشورات التي لكاتبها متابعون ولم تُدفع إلى خط أي منهم نُشرت في وضع
+    السحب؛ تعليمها يعيدها إلى خطوط المتابعين ولو نزل كاتبها تحت الحد.
+    """
+    Post = apps.get_model('posts', 'Post')
+    Follow = apps.get_model('friends', 'Follow')
+    TimelineEntry = apps.get_model('posts', 'TimelineEntry')
+    Post.objects.filter(
+        Exists(Follow.objects.filter(following_id=OuterRef('user_id'))),
+        is_deleted=False,
+    ).exclude(
+        Exists(TimelineEntry.objects.filter(~Q(owner_id=OuterRef('user_id')), post_id=OuterRef('pk'))),
+    ).update(is_pulled=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0011_comment_content_key_post_content_key'),
+        ('friends', '0002_alter_follow_options_alter_friendship_options_and_more'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='is_pulled',
+            field=models.BooleanField(default=False, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(condition=models.Q(('is_pulled', True)), fields=['user', '-created_at'], name='post_pulled_by_user'),
+        ),
+        migrations.RunPython(mark_pulled, migrations.RunPython.noop),
+    ]
@@ -1,7 +1,24 @@
-from django.db import models
+import uuid
+
+from django.db import models, transaction
 from accounts.models import CustomUser
+from core.normalize import fill_search_keys
+
 
-import re 
+def without_counters(instance, update_fields=None):
+    """
+    حقول حفظ صف موجود دون أعمدة العدّادات: القيم في الذاكرة قد تسبق دمج
+    flush_counters، فلا تُكتب إلا بـ F() في counters.apply_deltas.
+    """
+    if instance._state.adding:
+        return update_fields
+    if update_fields is None:
+        deferred = instance.get_deferred_fields()
+        update_fields = [
+            field.name for field in instance._meta.concrete_fields
+            if not field.primary_key and field.attname not in deferred
+        ]
+    return [name for name in update_fields if name not in instance.COUNTER_FIELDS]
 
 class Post(models.Model):
     POST_TYPES = [
@@ -15,6 +32,8 @@ class Post(models.Model):
     post_type = models.CharField(max_length=10, choices=POST_TYPES, default='text')
     image = models.ImageField(upload_to='post_images/', null=True, blank=True)
     video = models.FileField(upload_to='post_videos/', null=True, blank=True)
+    # النسخ المصغرة المولّدة من image (انظر core.images)
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)
     likes_count = models.IntegerField(default=0)
     comments_count = models.IntegerField(default=0)
     shares_count = models.IntegerField(default=0)
@@ -22,30 +41,55 @@ class Post(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
     is_edited = models.BooleanField(default=False)
     is_deleted = models.BooleanField(default=False) 
+    # المحتوى موحّداً للبحث (انظر core.normalize)
+    content_key = models.TextField(blank=True, default='', editable=False)
+    # نُشر وكاتبه فوق حد fan-out فلم يُدفع إلى المتابعين: يُسحب عند القراءة
+    # دائماً ولو نزل الكاتب تحت الحد لاحقاً (انظر posts.timeline)
+    is_pulled = models.BooleanField(default=False, editable=False)
     
+    SEARCH_KEYS = {'content_key': ('content',)}
+    COUNTER_FIELDS = ('likes_count', 'comments_count', 'shares_count')
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(
+                fields=['user', '-created_at'], condition=models.Q(is_pulled=True), name='post_pulled_by_user',
+            ),
+        ]
     
     def __str__(self):
         return f"{self.user.username}: {self.content[:50]}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # المحتوى كما قُرئ، لإعادة فهرسة الهاشتاجات فقط عند تغيّره
+        instance._loaded_content = instance.__dict__.get('content')
+        return instance
+
     def save(self, *args, **kwargs):
-        # حفظ المنشور أولاً
-        super().save(*args, **kwargs)
-        
-        # استخراج الهاشتاجات من المحتوى
-        hashtags = re.findall(r'#(\w+)', self.content)
+        adding = self._state.adding
+        kwargs['update_fields'] = fill_search_keys(self, without_counters(self, kwargs.get('update_fields')))
+        update_fields = kwargs.get('update_fields')
+        content_changed = (
+            adding or self.content != getattr(self, '_loaded_content', None)
+        ) and (update_fields is None or 'content' in update_fields)
+        # حفظ المنشور أولاً (في معاملة: قفل ملفات الوسائط يبقى حتى زيادة عدّاداتها، انظر core.storage)
+        with transaction.atomic(savepoint=False):
+            super().save(*args, **kwargs)
         
-        for tag_name in hashtags:
-            hashtag, created = Hashtag.objects.get_or_create(
-                name=tag_name.lower()
-            )
-            
-            if self not in hashtag.posts.all():
-                hashtag.posts.add(self)
-                hashtag.usage_count += 1
-                hashtag.save()
+        # مزامنة الهاشتاجات مع المحتوى
+        if content_changed:
+            from .hashtags import index_post
+            index_post(self)
+            self._loaded_content = self.content
+
+        # دفع المنشور الجديد إلى الخطوط الزمنية للمتابعين
+        if adding:
+            from .timeline import fan_out_post
+            fan_out_post(self)
+
     def can_edit(self, user):
         """التحقق من إمكانية تعديل التغريدة"""
         return user == self.user
@@ -56,13 +100,21 @@ class Post(models.Model):
     
     def soft_delete(self):
         """حذف ناعم"""
+        from .hashtags import set_post_visible
+        from .timeline import remove_post
         self.is_deleted = True
-        self.save()
+        self.save(update_fields=['is_deleted', 'updated_at'])
+        remove_post(self)
+        set_post_visible(self, False)
     
     def restore(self):
         """استعادة التغريدة"""
+        from .hashtags import set_post_visible
+        from .timeline import fan_out_post
         self.is_deleted = False
-        self.save()
+        self.save(update_fields=['is_deleted', 'updated_at'])
+        fan_out_post(self)
+        set_post_visible(self, True)
 
 class Comment(models.Model):
     post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='post_comments')
@@ -73,13 +125,34 @@ class Comment(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     is_edited = models.BooleanField(default=False)
+    # المسار المادي في شجرة الردود: مسار الأب + معرّف التعليق بعرض ثابت
+    path = models.CharField(max_length=255, blank=True, default='', editable=False)
+    depth = models.PositiveSmallIntegerField(default=0, editable=False)
+    content_key = models.TextField(blank=True, default='', editable=False)
+    
+    SEARCH_KEYS = {'content_key': ('content',)}
+    COUNTER_FIELDS = ('likes_count',)
     
     class Meta:
         ordering = ['created_at']
+        indexes = [
+            models.Index(fields=['post', 'path'], name='comment_post_path'),
+        ]
     
     def __str__(self):
         return f"Comment by {self.user.username} on post #{self.post.id}"
     
+    def save(self, *args, **kwargs):
+        adding = self._state.adding
+        kwargs['update_fields'] = fill_search_keys(self, without_counters(self, kwargs.get('update_fields')))
+        super().save(*args, **kwargs)
+        
+        # المسار يعتمد على المعرّف فيُحسب بعد الإدراج
+        if adding and not self.path:
+            from .threads import comment_path
+            self.path, self.depth = comment_path(self.pk, self.parent)
+            Comment.objects.filter(pk=self.pk).update(path=self.path, depth=self.depth)
+    
     @property
     def is_reply(self):
         return self.parent is not None
@@ -112,3 +185,93 @@ class Hashtag(models.Model):
     
     class Meta:
         ordering = ['-usage_count']
+
+
+class TimelineEntry(models.Model):
+    """عنصر في الخط الزمني المُجهّز مسبقاً لمستخدم"""
+    owner = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='timeline_entries')
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='timeline_entries')
+    author = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='+')
+    # نسخة من تاريخ المنشور حتى يتم الترتيب من الفهرس دون الرجوع إلى جدول المنشورات
+    created_at = models.DateTimeField()
+
+    class Meta:
+        unique_together = ['owner', 'post']
+        indexes = [
+            models.Index(fields=['owner', '-created_at', '-post'], name='timeline_owner_position'),
+            models.Index(fields=['owner', 'author'], name='timeline_owner_author'),
+        ]
+
+    def __str__(self):
+        return f"{self.owner.username} <- post #{self.post_id}"
+
+
+class CounterDelta(models.Model):
+    """تغيير معلّق على عدّاد منشور أو تعليق، يُدمج في الجدول الأصلي على دفعات"""
+    TARGETS = [
+        ('post', 'Post'),
+        ('comment', 'Comment'),
+    ]
+
+    target = models.CharField(max_length=10, choices=TARGETS)
+    object_id = models.PositiveIntegerField()
+    field = models.CharField(max_length=30)
+    delta = models.IntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['target', 'object_id'], name='counter_delta_target'),
+        ]
+
+    def __str__(self):
+        return f"{self.target} #{self.object_id} {self.field} {self.delta:+d}"
+
+
+class HashtagBucket(models.Model):
+    """عدد منشورات الهاشتاج في فترة زمنية (دقيقة أو ساعة) لحساب الاتجاهات"""
+    RESOLUTIONS = [
+        ('minute', 'Minute'),
+        ('hour', 'Hour'),
+    ]
+
+    hashtag = models.ForeignKey(Hashtag, on_delete=models.CASCADE, related_name='buckets')
+    resolution = models.CharField(max_length=10, choices=RESOLUTIONS)
+    start = models.DateTimeField()
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = ['hashtag', 'resolution', 'start']
+        indexes = [
+            models.Index(fields=['resolution', 'start'], name='hashtag_bucket_window'),
+        ]
+
+    def __str__(self):
+        return f"#{self.hashtag_id} {self.resolution} {self.start:%Y-%m-%d %H:%M}: {self.count}"
+
+
+class UploadSession(models.Model):
+    """رفع فيديو على أجزاء قابل للاستئناف: البايتات تُكتب إلى ملف مؤقت حتى اكتماله"""
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='upload_sessions')
+    # منشور موجود يُرفق به الفيديو، أو يُنشأ منشور جديد عند الإكمال
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, null=True, blank=True, related_name='upload_sessions')
+    filename = models.CharField(max_length=255)
+    content_type = models.CharField(max_length=100)
+    size = models.BigIntegerField()
+    received = models.BigIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    completed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['completed_at', 'updated_at'], name='upload_session_expiry'),
+        ]
+
+    def __str__(self):
+        return f"{self.user.username}: {self.filename} ({self.received}/{self.size})"
+
+    @property
+    def is_complete(self):
+        return self.completed_at is not None
@@ -0,0 +1,41 @@
+from django.db.models.signals import post_save, post_delete, pre_delete
+from django.dispatch import receiver
+from accounts.models import CustomUser
+from friends.models import Follow
+from . import timeline
+from .hashtags import set_post_visible
+from .models import Like, Post
+
+@receiver(post_save, sender=Follow)
+def follow_created(sender, instance, created, **kwargs):
+    """إضافة منشورات الحساب المتابَع إلى الخط الزمني"""
+    if created:
+        timeline.follow_added(instance.follower_id, instance.following_id)
+
+@receiver(post_delete, sender=Follow)
+def follow_deleted(sender, instance, **kwargs):
+    """إزالة منشورات الحساب من الخط الزمني عند إلغاء المتابعة"""
+    timeline.follow_removed(instance.follower_id, instance.following_id)
+
+@receiver(pre_delete, sender=Post)
+def post_deleting(sender, instance, **kwargs):
+    """إزالة هاشتاجات المنشور من الاتجاهات قبل حذفه نهائياً"""
+    if not instance.is_deleted:
+        set_post_visible(instance, False)
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+def post_changed(sender, instance, **kwargs):
+    """منشور جديد أو معدّل أو محذوف: إصدار جديد لخطوط متابعي كاتبه"""
+    timeline.bump_versions(author_ids=[instance.user_id])
+
+@receiver(post_save, sender=Like)
+@receiver(post_delete, sender=Like)
+def like_changed(sender, instance, **kwargs):
+    """حالة إعجاب المشاهد في خطه (العدّاد يغيّر إصدار الكاتب عند تسجيله)"""
+    timeline.bump_versions([instance.user_id])
+
+@receiver(post_save, sender=CustomUser)
+def author_changed(sender, instance, **kwargs):
+    """اسم الكاتب وصورته تظهر مع منشوراته"""
+    timeline.bump_versions(author_ids=[instance.pk])
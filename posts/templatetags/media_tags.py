@@ -0,0 +1,18 @@
+from django import template
+from django.utils.html import format_html
+
+from core import images
+
+register = template.Library()
+
+
+@register.simple_tag
+def srcset_attrs(obj, field, sizes):
+    """
+    خاصيتا srcset و sizes من النسخ المصغرة للصورة (إن وُلّدت)
+    الاستخدام: <img src="{{ post.image.url }}" {% srcset_attrs post 'image' '680px' %}>
+    """
+    value = images.srcset(obj, field, f'{field}_variants')
+    if not value:
+        return ''
+    return format_html('srcset="{}" sizes="{}"', value, sizes)
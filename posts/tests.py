@@ -1,3 +1,672 @@
-from django.test import TestCase
+import importlib
+import json
+import tempfile
+from datetime import datetime, timedelta, timezone as dt_timezone
+from io import StringIO
 
-# Create your tests here.
+from django.apps import apps
+from django.core.cache import cache
+from django.core.management import call_command
+from unittest import mock
+
+from django.test import RequestFactory, TestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from accounts.models import CustomUser
+from friends.models import Follow
+from . import counters, threads, timeline, trending, views
+from .counters import flush_all
+from .models import Post, Comment, Like, CounterDelta, Hashtag, TimelineEntry
+
+
+class HomeViewQueryCountTests(TestCase):
+    """الصفحة الرئيسية تُبنى بعدد ثابت من الاستعلامات"""
+
+    # الجلسة + المستخدم + المنشورات + التعليقات + العدّادات المعلّقة
+    # + إعجابات المنشورات + إعجابات التعليقات + الإحصائيات
+    HOME_QUERIES = 8
+
+    def setUp(self):
+        self.user = CustomUser.objects.create_user('viewer', password='pass12345')
+        self.author = CustomUser.objects.create_user('author', password='pass12345')
+        Follow.objects.create(follower=self.user, following=self.author)
+        self.client.force_login(self.user)
+        # الاتجاهات تُقرأ من الذاكرة المؤقتة في الحالة المعتادة
+        cache.clear()
+        trending.trending()
+
+    def create_posts(self, count):
+        for i in range(count):
+            post = Post.objects.create(user=self.author, content=f'post {i}')
+            Like.objects.create(user=self.user, post=post)
+            for j in range(7):
+                comment = Comment.objects.create(post=post, user=self.author, content=f'comment {j}')
+                Comment.objects.create(post=post, user=self.user, content='reply', parent=comment)
+                if j % 2:
+                    Like.objects.create(user=self.user, comment=comment)
+
+    def test_query_count_is_constant(self):
+        self.create_posts(1)
+        with self.assertNumQueries(self.HOME_QUERIES):
+            self.client.get(reverse('home'))
+
+        self.create_posts(10)
+        with self.assertNumQueries(self.HOME_QUERIES):
+            response = self.client.get(reverse('home'))
+
+        self.assertEqual(len(response.context['posts']), 11)
+
+    def test_context_matches_per_row_queries(self):
+        self.create_posts(2)
+        response = self.client.get(reverse('home'))
+
+        for post in response.context['posts']:
+            self.assertTrue(post.user_has_liked)
+            self.assertEqual(len(post.comments), 5)
+            for comment in post.comments:
+                self.assertIsNone(comment.parent_id)
+                self.assertEqual(comment.replies_count, 1)
+                self.assertEqual(
+                    comment.user_has_liked,
+                    Like.objects.filter(comment=comment, user=self.user).exists()
+                )
+
+        self.assertEqual(response.context['user_stats'], {
+            'posts_count': 0,
+            'following_count': 1,
+            'followers_count': 0,
+        })
+
+
+
+
+class FragmentCacheTests(TestCase):
+    """أجزاء بطاقة المنشور المخزنة تُرسم من جديد عند تغيّر ما تعرضه"""
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.user = CustomUser.objects.create_user('cached', password='pass12345')
+        self.post = Post.objects.create(user=self.user, content='first version')
+        self.client.force_login(self.user)
+
+    def render(self):
+        return self.client.get(reverse('home')).content.decode()
+
+    def search(self):
+        return self.client.get(reverse('search'), {'q': 'version', 'type': 'posts'}).content.decode()
+
+    def test_fragments_are_reused_until_key_changes(self):
+        self.assertIn('first version', self.render())
+        # update() لا يغيّر updated_at: الجزء المخزن يبقى كما هو
+        Post.objects.filter(pk=self.post.pk).update(content='silent change')
+        self.assertIn('first version', self.render())
+
+    def test_edit_invalidates_body(self):
+        self.render()
+        self.assertIn('first', self.search())
+        self.post.content = 'second version'
+        self.post.save()
+        html = self.render()
+        self.assertIn('second version', html)
+        self.assertNotIn('first version', html)
+        html = self.search()
+        self.assertIn('second', html)
+        self.assertNotIn('first', html)
+
+    def test_search_card_is_cached_whole(self):
+        self.assertIn('first <mark>', self.search())
+        Post.objects.filter(pk=self.post.pk).update(content='silent version')
+        self.assertIn('first <mark>', self.search())
+
+        # إعجاب أو تغيير اسم الكاتب يعيد رسم البطاقة كاملة
+        self.client.post(reverse('like_post', args=[self.post.id]), HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+        html = self.search()
+        self.assertIn('silent <mark>', html)
+        self.assertNotIn('first <mark>', html)
+
+        Post.objects.filter(pk=self.post.pk).update(content='renamed version')
+        self.user.username = 'renamed'
+        self.user.save()
+        html = self.search()
+        self.assertIn('@renamed', html)
+        self.assertIn('renamed <mark>', html)
+
+    def test_like_invalidates_body(self):
+        self.assertIn('0 إعجاب', self.render())
+        self.client.post(reverse('like_post', args=[self.post.id]), HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+        html = self.render()
+        self.assertIn('1 إعجاب', html)
+        self.assertNotIn('0 إعجاب', html)
+
+    def test_variant_change_invalidates_body_and_author(self):
+        Post.objects.filter(pk=self.post.pk).update(image='post_images/a.jpg')
+        CustomUser.objects.filter(pk=self.user.pk).update(profile_image='profile_images/me.jpg')
+        self.assertNotIn('srcset', self.render())
+
+        # توليد النسخ يستخدم update() فلا يتغير updated_at
+        Post.objects.filter(pk=self.post.pk).update(image_variants={
+            'source': 'post_images/a.jpg',
+            'variants': {'feed': {'name': 'post_images/variants/a.jpg/feed.webp', 'width': 680}},
+        })
+        CustomUser.objects.filter(pk=self.user.pk).update(profile_image_variants={
+            'source': 'profile_images/me.jpg',
+            'variants': {'thumb': {'name': 'profile_images/variants/me.jpg/thumb.webp', 'width': 80}},
+        })
+        html = self.render()
+        self.assertIn('post_images/variants/a.jpg/feed.webp 680w', html)
+        self.assertIn('profile_images/variants/me.jpg/thumb.webp 80w', html)
+
+    def test_username_change_invalidates_author(self):
+        self.render()
+        self.user.username = 'renamed'
+        self.user.save()
+        html = self.render()
+        self.assertIn('@renamed', html)
+        self.assertNotIn('@cached', html)
+
+
+class TimelineTests(TestCase):
+    """الخط الزمني المُجهّز: الدفع عند النشر والحذف والمتابعة"""
+
+    def setUp(self):
+        self.viewer = CustomUser.objects.create_user('viewer', password='pass12345')
+        self.author = CustomUser.objects.create_user('author', password='pass12345')
+        Follow.objects.create(follower=self.viewer, following=self.author)
+
+    def timeline_ids(self, user):
+        return list(timeline.home_timeline(user).values_list('id', flat=True))
+
+    def test_new_post_fans_out_to_author_and_followers(self):
+        post = Post.objects.create(user=self.author, content='hello')
+        self.assertEqual(
+            set(TimelineEntry.objects.filter(post=post).values_list('owner_id', flat=True)),
+            {self.author.pk, self.viewer.pk},
+        )
+        own = Post.objects.create(user=self.viewer, content='mine')
+        self.assertEqual(self.timeline_ids(self.viewer), [own.pk, post.pk])
+
+    def test_soft_delete_removes_and_restore_pushes_again(self):
+        post = Post.objects.create(user=self.author, content='hello')
+        post.soft_delete()
+        self.assertFalse(TimelineEntry.objects.filter(post=post).exists())
+        self.assertEqual(self.timeline_ids(self.viewer), [])
+        post.restore()
+        self.assertEqual(self.timeline_ids(self.viewer), [post.pk])
+
+    def test_follow_backfills_and_unfollow_removes(self):
+        other = CustomUser.objects.create_user('other', password='pass12345')
+        old = [Post.objects.create(user=other, content=str(i)).pk for i in range(3)]
+        Post.objects.filter(pk=old[0]).update(is_deleted=True)
+
+        with mock.patch.object(timeline, 'TIMELINE_BACKFILL', 1):
+            follow = Follow.objects.create(follower=self.viewer, following=other)
+        self.assertEqual(self.timeline_ids(self.viewer), [old[2]])
+
+        follow.delete()
+        self.assertEqual(self.timeline_ids(self.viewer), [])
+        self.assertFalse(TimelineEntry.objects.filter(owner=self.viewer, author=other).exists())
+
+    def test_rebuild_timeline_restores_entries(self):
+        post = Post.objects.create(user=self.author, content='hello')
+        own = Post.objects.create(user=self.viewer, content='mine')
+        stranger = CustomUser.objects.create_user('stranger', password='pass12345')
+        stale = Post.objects.create(user=stranger, content='not followed')
+        TimelineEntry.objects.filter(owner=self.viewer).delete()
+        TimelineEntry.objects.create(
+            owner=self.viewer, post=stale, author=stranger, created_at=stale.created_at,
+        )
+
+        call_command('rebuild_timelines', user='viewer', stdout=StringIO())
+        self.assertEqual(self.timeline_ids(self.viewer), [own.pk, post.pk])
+
+    def test_following_only_excludes_own_posts(self):
+        post = Post.objects.create(user=self.author, content='hello')
+        Post.objects.create(user=self.viewer, content='mine')
+        self.client.force_login(self.viewer)
+        response = self.client.get(reverse('post-list'), {'following_only': 1})
+        self.assertEqual([p['id'] for p in response.data['results']], [post.pk])
+
+
+class HybridTimelineTests(TestCase):
+    """دمج المنشورات المدفوعة مع المسحوبة من الحسابات فوق حد fan-out"""
+
+    def setUp(self):
+        patcher = mock.patch.object(timeline, 'TIMELINE_FANOUT_THRESHOLD', 3)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.viewer = CustomUser.objects.create_user('viewer', password='pass12345')
+        self.friend = CustomUser.objects.create_user('friend', password='pass12345')
+        self.celeb = CustomUser.objects.create_user('celeb', password='pass12345')
+        Follow.objects.create(follower=self.viewer, following=self.friend)
+        Follow.objects.create(follower=self.viewer, following=self.celeb)
+        CustomUser.objects.filter(pk=self.celeb.pk).update(followers_count=5)
+        self.celeb.refresh_from_db()
+        self.client.force_login(self.viewer)
+
+    def post(self, user, content='x'):
+        return Post.objects.create(user=user, content=content).pk
+
+    def feed_ids(self, url):
+        response = self.client.get(url)
+        return [post['id'] for post in response.data['results']], response.data
+
+    def test_pages_merge_pushed_and_pulled_posts(self):
+        ids = [self.post([self.friend, self.celeb][i % 2]) for i in range(7)]
+        self.assertFalse(TimelineEntry.objects.filter(owner=self.viewer, author=self.celeb).exists())
+        self.assertEqual(Post.objects.filter(is_pulled=True).count(), 3)
+
+        seen, data = self.feed_ids(reverse('api_feed') + '?page_size=3')
+        while data['next']:
+            page, data = self.feed_ids(data['next'])
+            seen += page
+        self.assertEqual(seen, ids[::-1])
+
+    def test_since_cursor_returns_newer_posts_oldest_first(self):
+        self.post(self.friend)
+        _, data = self.feed_ids(reverse('api_feed') + '?page_size=3')
+        newer = [self.post(self.celeb), self.post(self.friend), self.post(self.celeb)]
+
+        page, data = self.feed_ids(data['previous'].replace('page_size=3', 'page_size=2'))
+        self.assertEqual(page, newer[1::-1])
+        page, data = self.feed_ids(data['previous'])
+        self.assertEqual(page, newer[2:])
+
+    def test_keyset_page_before_and_after(self):
+        ids = [self.post([self.friend, self.celeb][i % 2]) for i in range(6)]
+        home = timeline.HomeTimeline(self.viewer)
+        middle = Post.objects.get(pk=ids[3])
+        key = (middle.created_at, middle.pk)
+        self.assertEqual([p.pk for p in home.keyset_page(10, before=key)], ids[2::-1])
+        self.assertEqual([p.pk for p in home.keyset_page(10, after=key)], ids[:3:-1])
+        self.assertEqual([p.pk for p in home.keyset_page(1, after=key)], [ids[4]])
+
+    def test_duplicates_across_sources_are_merged(self):
+        pulled = Post.objects.get(pk=self.post(self.celeb))
+        TimelineEntry.objects.create(
+            owner=self.viewer, post=pulled, author=self.celeb, created_at=pulled.created_at,
+        )
+        self.assertEqual(self.feed_ids(reverse('api_feed'))[0], [pulled.pk])
+
+    def test_pulled_posts_survive_dropping_below_threshold(self):
+        pulled = self.post(self.celeb)
+        CustomUser.objects.filter(pk=self.celeb.pk).update(followers_count=1)
+        self.celeb.refresh_from_db()
+        pushed = self.post(self.celeb)
+
+        self.assertTrue(TimelineEntry.objects.filter(owner=self.viewer, post_id=pushed).exists())
+        self.assertEqual(self.feed_ids(reverse('api_feed'))[0], [pushed, pulled])
+
+    def test_new_follower_gets_posts_from_before_crossing(self):
+        CustomUser.objects.filter(pk=self.celeb.pk).update(followers_count=0)
+        self.celeb.refresh_from_db()
+        pushed = self.post(self.celeb)
+        CustomUser.objects.filter(pk=self.celeb.pk).update(followers_count=5)
+        self.celeb.refresh_from_db()
+        pulled = self.post(self.celeb)
+
+        fan = CustomUser.objects.create_user('fan', password='pass12345')
+        Follow.objects.create(follower=fan, following=self.celeb)
+        self.client.force_login(fan)
+        self.assertEqual(self.feed_ids(reverse('api_feed'))[0], [pulled, pushed])
+
+
+class ThreadTests(TestCase):
+    """شجرة التعليقات بالمسار المادي"""
+
+    def setUp(self):
+        self.user = CustomUser.objects.create_user('threader', password='pass12345')
+        self.post = Post.objects.create(user=self.user, content='post')
+
+    def comment(self, parent=None):
+        return Comment.objects.create(post=self.post, user=self.user, content='c', parent=parent)
+
+    def flatten(self, roots):
+        return [comment.pk for comment in threads.iter_thread(roots)]
+
+    def test_fetch_thread_builds_tree_in_depth_first_order(self):
+        first = self.comment()
+        second = self.comment()
+        reply = self.comment(first)
+        nested = self.comment(reply)
+        late = self.comment(first)
+
+        with self.assertNumQueries(1):
+            roots, cursor = threads.fetch_thread(self.post)
+        self.assertIsNone(cursor)
+        self.assertEqual([root.pk for root in roots], [first.pk, second.pk])
+        self.assertEqual([c.pk for c in roots[0].thread_children], [reply.pk, late.pk])
+        self.assertEqual(self.flatten(roots), [first.pk, reply.pk, nested.pk, late.pk, second.pk])
+
+        roots, _ = threads.fetch_thread(self.post, root=first, max_depth=1)
+        self.assertEqual(self.flatten(roots), [first.pk, reply.pk, late.pk])
+
+    def test_cursor_pages_cover_thread_once(self):
+        root = self.comment()
+        for _ in range(3):
+            self.comment(self.comment(root))
+        expected = self.flatten(threads.fetch_thread(self.post)[0])
+
+        seen, cursor = [], None
+        while True:
+            roots, cursor = threads.fetch_thread(self.post, after=cursor, limit=3)
+            seen += self.flatten(roots)
+            if cursor is None:
+                break
+        self.assertEqual(seen, expected)
+
+        def ids(items):
+            for item in items:
+                yield item['id']
+                yield from ids(item['replies'])
+
+        self.client.force_login(self.user)
+        url = f'/api/comments/{root.pk}/thread/?limit=4'
+        seen = []
+        while url:
+            body = self.client.get(url).json()
+            seen += ids(body['results'])
+            url = body['next']
+        self.assertEqual(seen, expected)
+
+    def test_depth_is_capped(self):
+        chain = [self.comment()]
+        for _ in range(threads.PATH_MAX_DEPTH + 2):
+            chain.append(self.comment(chain[-1]))
+        deepest, capped = chain[-2], chain[-1]
+        self.assertEqual(deepest.depth, threads.PATH_MAX_DEPTH)
+        self.assertEqual(capped.depth, threads.PATH_MAX_DEPTH)
+        self.assertEqual(capped.path[:-threads.PATH_STEP], deepest.path[:-threads.PATH_STEP])
+        self.assertLessEqual(len(capped.path), Comment._meta.get_field('path').max_length)
+
+        # الترحيل يعطي المسارات نفسها
+        expected = dict(Comment.objects.values_list('pk', 'path'))
+        Comment.objects.update(path='', depth=0)
+        migration = importlib.import_module('posts.migrations.0006_comment_path')
+        migration.backfill_paths(apps, None)
+        self.assertEqual(dict(Comment.objects.values_list('pk', 'path')), expected)
+
+
+class CounterTests(TestCase):
+    """العدّادات تُسجَّل كتغييرات معلّقة ثم تُدمج على دفعات"""
+
+    def setUp(self):
+        self.user = CustomUser.objects.create_user('liker', password='pass12345')
+        self.post = Post.objects.create(user=self.user, content='post')
+        self.client.force_login(self.user)
+
+    def like(self):
+        return self.client.post(
+            reverse('like_post', args=[self.post.id]),
+            HTTP_X_REQUESTED_WITH='XMLHttpRequest'
+        ).json()
+
+    def test_like_toggle_records_pending_delta(self):
+        updated_at = Post.objects.get(pk=self.post.pk).updated_at
+
+        self.assertEqual(self.like()['likes_count'], 1)
+        self.assertEqual(self.like()['likes_count'], 0)
+        self.assertEqual(self.like()['likes_count'], 1)
+
+        # الصف نفسه لم يُكتب بعد
+        post = Post.objects.get(pk=self.post.pk)
+        self.assertEqual(post.likes_count, 0)
+        self.assertEqual(post.updated_at, updated_at)
+        self.assertEqual(CounterDelta.objects.count(), 3)
+
+        self.assertEqual(flush_all(), 3)
+        post.refresh_from_db()
+        self.assertEqual(post.likes_count, 1)
+        self.assertEqual(post.updated_at, updated_at)
+        self.assertFalse(CounterDelta.objects.exists())
+
+    def test_readers_merge_pending_deltas(self):
+        self.like()
+        comment = Comment.objects.create(post=self.post, user=self.user, content='c')
+        self.client.post(reverse('like_comment', args=[comment.id]))
+
+        response = self.client.get(reverse('home'))
+        post = response.context['posts'][0]
+        self.assertEqual(post.likes_count, 1)
+        self.assertEqual(post.comments[0].likes_count, 1)
+
+        response = self.client.get(f'/api/posts/{self.post.id}/')
+        self.assertEqual(response.json()['likes_count'], 1)
+
+        response = self.client.get(reverse('profile_with_username', args=[self.user.username]))
+        self.assertEqual(response.context['posts'][0].likes_count, 1)
+        self.assertEqual(response.context['liked_posts'][0].likes_count, 1)
+
+        response = self.client.get(reverse('delete_post', args=[self.post.id]))
+        self.assertEqual(response.context['post'].likes_count, 1)
+
+
+    def test_saves_do_not_overwrite_flushed_counters(self):
+        stale = Post.objects.get(pk=self.post.pk)
+        comment = Comment.objects.create(post=self.post, user=self.user, content='c')
+        stale_comment = Comment.objects.get(pk=comment.pk)
+        self.like()
+        self.client.post(reverse('like_comment', args=[comment.id]))
+        flush_all()
+
+        stale.content = 'edited'
+        stale.save()
+        stale.soft_delete()
+        stale.restore()
+        stale_comment.content = 'edited'
+        stale_comment.save()
+        self.client.post(reverse('edit_post', args=[self.post.id]), {'content': 'edited again'})
+        # edit_comment غير موصول بمسار
+        request = RequestFactory().post('/', {'content': 'edited again'}, HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+        request.user = self.user
+        views.edit_comment(request, comment.id)
+
+        post = Post.objects.get(pk=self.post.pk)
+        comment.refresh_from_db()
+        self.assertEqual((post.content, post.likes_count), ('edited again', 1))
+        self.assertEqual((comment.content, comment.likes_count), ('edited again', 1))
+
+
+class ReconcileCountersTests(TestCase):
+    def test_repairs_drifted_counters(self):
+        author = CustomUser.objects.create_user('author', password='pass12345')
+        fan = CustomUser.objects.create_user('fan', password='pass12345')
+        post = Post.objects.create(user=author, content='post')
+        Like.objects.create(user=fan, post=post)
+        comment = Comment.objects.create(post=post, user=fan, content='c')
+        Comment.objects.create(post=post, user=author, content='r', parent=comment)
+        Follow.objects.create(follower=fan, following=author)
+        Post.objects.filter(pk=post.pk).update(likes_count=7)
+
+        # حذف التعليق يحذف ردّه أيضاً
+        self.client.force_login(fan)
+        self.client.post(reverse('delete_comment', args=[comment.id]))
+
+        call_command('reconcile_counters', '--dry-run', stdout=StringIO())
+        post.refresh_from_db()
+        self.assertEqual(post.likes_count, 7)
+
+        call_command('reconcile_counters', chunk_size=1, stdout=StringIO())
+        flush_all()
+        post.refresh_from_db()
+        author.refresh_from_db()
+        self.assertEqual((post.likes_count, post.comments_count), (1, 0))
+        self.assertEqual(author.followers_count, 1)
+
+
+    def test_flush_during_reconcile_is_not_lost(self):
+        author = CustomUser.objects.create_user('author', password='pass12345')
+        post = Post.objects.create(user=author, content='post')
+        Like.objects.create(user=author, post=post)
+        counters.record(post, 'likes_count', 1)
+        Post.objects.filter(pk=post.pk).update(likes_count=5)
+
+        pending = counters.pending
+
+        def pending_then_flush(*args):
+            # دمج يصل بين قراءة الدفعة وكتابة تصحيحها
+            result = pending(*args)
+            flush_all()
+            return result
+
+        with mock.patch.object(counters, 'pending', side_effect=pending_then_flush):
+            call_command('reconcile_counters', only=['posts'], stdout=StringIO())
+        post.refresh_from_db()
+        self.assertEqual(post.likes_count, 1)
+        self.assertFalse(CounterDelta.objects.exists())
+
+
+class HashtagIndexTests(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user('tagger', password='pass12345')
+
+    def usage(self):
+        return dict(Hashtag.objects.values_list('name', 'usage_count'))
+
+    def test_edit_diffs_tag_sets(self):
+        post = Post.objects.create(user=self.user, content='#Django #python #django')
+        Post.objects.create(user=self.user, content='#python')
+        self.assertEqual(self.usage(), {'django': 1, 'python': 2})
+
+        post = Post.objects.get(pk=post.pk)
+        post.content = '#python #sqlite'
+        post.save()
+        self.assertEqual(self.usage(), {'django': 0, 'python': 2, 'sqlite': 1})
+        self.assertEqual(set(post.hashtags.values_list('name', flat=True)), {'python', 'sqlite'})
+
+    def test_unchanged_content_is_not_reindexed(self):
+        post = Post.objects.create(user=self.user, content='#a #b')
+        post = Post.objects.get(pk=post.pk)
+        post.is_edited = True
+        with self.assertNumQueries(1):
+            post.save()
+
+
+class TrendingTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = CustomUser.objects.create_user('trender', password='pass12345')
+
+    def test_window_counts_follow_tagging(self):
+        Post.objects.create(user=self.user, content='#a #b')
+        post = Post.objects.create(user=self.user, content='#a')
+        self.assertEqual(trending.trending('1h'), [{'name': 'a', 'count': 2}, {'name': 'b', 'count': 1}])
+
+        post.soft_delete()
+        cache.clear()
+        response = self.client.get(reverse('api_trends'), {'window': '24h'})
+        self.assertEqual(response.json()['results'], [{'name': 'a', 'count': 1}, {'name': 'b', 'count': 1}])
+
+    def test_window_slides_incrementally(self):
+        now = timezone.now()
+        old = Hashtag.objects.create(name='old')
+        new = Hashtag.objects.create(name='new')
+        trending.record([old.id], 3, now - timedelta(hours=22))
+        trending.record([new.id], 1, now)
+
+        self.assertEqual(trending.refresh('24h', now), [{'name': 'old', 'count': 3}, {'name': 'new', 'count': 1}])
+        # بعد ساعتين تخرج فترة old من النافذة دون إعادة حساب كامل
+        later = now + timedelta(hours=3)
+        self.assertEqual(trending.refresh('24h', later), [{'name': 'new', 'count': 1}])
+        self.assertEqual(trending.refresh('7d', later)[0], {'name': 'old', 'count': 3})
+
+
+class IngestCommandTests(TestCase):
+    def test_ingest_jsonl(self):
+        rows = [
+            {'type': 'user', 'username': 'reader'},
+            {'type': 'user', 'username': 'writer'},
+            {'type': 'post', 'id': 900, 'user': 'writer', 'content': 'hi #bulk', 'created_at': '2026-01-02T03:04:05Z'},
+            {'type': 'follow', 'follower': 'reader', 'following': 'writer'},
+            {'type': 'like', 'user': 'reader', 'post': 900},
+            {'type': 'like', 'user': 'missing', 'post': 900},
+        ]
+        with tempfile.NamedTemporaryFile('w', suffix='.jsonl') as f:
+            f.write('\n'.join(json.dumps(row) for row in rows))
+            f.flush()
+            call_command('ingest', f.name, batch_size=2, stdout=StringIO(), stderr=StringIO())
+
+        reader = CustomUser.objects.get(username='reader')
+        post = Post.objects.get(pk=900)
+        self.assertTrue(hasattr(reader, 'user_settings'))
+        self.assertEqual((reader.following_count, post.user.followers_count), (1, 1))
+        self.assertEqual(post.likes_count, 1)
+        self.assertEqual(post.created_at, datetime(2026, 1, 2, 3, 4, 5, tzinfo=dt_timezone.utc))
+        self.assertEqual(Hashtag.objects.get(name='bulk').usage_count, 1)
+        self.assertTrue(TimelineEntry.objects.filter(owner=reader, post=post).exists())
+
+
+class SearchViewTests(TestCase):
+    """صفحة البحث تجلب صفحتها فقط وتدمج المنشورات ثم المستخدمين"""
+
+    def setUp(self):
+        self.user = CustomUser.objects.create_user('viewer', password='pass12345')
+        self.client.force_login(self.user)
+        self.posts = [Post.objects.create(user=self.user, content=f'kettle {i}') for i in range(3)]
+        self.kettle_fan = CustomUser.objects.create_user('kettle_fan', password='pass12345')
+        Follow.objects.create(follower=self.user, following=self.kettle_fan)
+        Like.objects.create(user=self.user, post=self.posts[0])
+
+    def search(self, page):
+        with mock.patch.object(views, 'SEARCH_PAGE_SIZE', 2):
+            return self.client.get(reverse('search'), {'q': 'kettle', 'page': page}).context['page_obj']
+
+    def test_pages_span_sections_without_count(self):
+        first = self.search(1)
+        self.assertEqual([r.result_type for r in first], ['post', 'post'])
+        self.assertTrue(first.has_next())
+
+        second = self.search(2)
+        self.assertEqual([r.result_type for r in second], ['post', 'user'])
+        self.assertFalse(second.has_next())
+        self.assertTrue(list(second)[1].is_following)
+
+        # صفحة تبدأ بعد نهاية المنشورات
+        with mock.patch.object(views, 'SEARCH_PAGE_SIZE', 3):
+            page = self.client.get(reverse('search'), {'q': 'kettle', 'page': 2}).context['page_obj']
+        self.assertEqual([r.username for r in page], ['kettle_fan'])
+
+    def test_only_page_rows_are_enriched(self):
+        results = list(self.search(1)) + list(self.search(2))
+        liked = {post.pk for post in results if post.result_type == 'post' and post.user_has_liked}
+        self.assertEqual(liked, {self.posts[0].pk})
+
+
+class SearchAppTests(TestCase):
+    """صفحة البحث الموسّعة تُثرى دفعة واحدة لكل صفحة"""
+
+    def setUp(self):
+        self.user = CustomUser.objects.create_user('viewer', password='pass12345')
+        self.client.force_login(self.user)
+
+    def test_users_page_queries_do_not_grow(self):
+        def create(n):
+            for i in range(n):
+                author = CustomUser.objects.create(username=f'teapot{CustomUser.objects.count()}')
+                Post.objects.create(user=author, content='tea')
+                Follow.objects.create(follower=self.user, following=author)
+
+        create(1)
+        with self.assertNumQueries(6) as first:
+            self.client.get(reverse('search:results'), {'q': 'teapot', 'type': 'users'})
+        create(4)
+        with self.assertNumQueries(len(first)):
+            response = self.client.get(reverse('search:results'), {'q': 'teapot', 'type': 'users'})
+        users = list(response.context['users'])
+        self.assertEqual(len(users), 5)
+        self.assertTrue(all(user.is_following and user.posts_count == 1 for user in users))
+
+    def test_hashtags_with_recent_posts_and_pages(self):
+        for i in range(4):
+            Post.objects.create(user=self.user, content=f'#brew{i % 2} number {i}')
+        with mock.patch('search.views.SEARCH_PAGE_SIZE', 1):
+            response = self.client.get(reverse('search:results'), {'q': '#bre', 'type': 'hashtags'})
+        hashtag, = response.context['hashtags']
+        self.assertTrue(response.context['has_next_page'])
+        self.assertEqual([post.content for post in hashtag.recent_posts], ['#brew0 number 2', '#brew0 number 0'])
+
+    def test_autocomplete_links_to_results(self):
+        Post.objects.create(user=self.user, content='#brewing')
+        response = self.client.get(reverse('search:autocomplete'), {'q': 'brew'})
+        self.assertEqual(response.json()['results'][0]['url'], reverse('search:results') + '?q=%23brewing&type=hashtags')
@@ -0,0 +1,125 @@
+"""
+شجرة التعليقات بالمسار المادي (materialized path)
+
+كل تعليق يخزن مسار أبيه متبوعاً بمعرّفه بعرض ثابت (base36)، فالترتيب
+حسب path يعطي الشجرة كاملة بترتيب العمق أولاً، وتُجلب سلسلة كاملة أو
+صفحة منها باستعلام واحد ثم تُبنى الشجرة في الذاكرة.
+"""
+from django.conf import settings
+from django.db.models import Q
+
+from .models import Comment
+
+PATH_ALPHABET = '0123456789abcdefghijklmnopqrstuvwxyz'
+PATH_STEP = 8
+# أقصى عمق يتسع له حقل path
+PATH_MAX_DEPTH = Comment._meta.get_field('path').max_length // PATH_STEP - 1
+# حرف أكبر من كل حروف المسار لتحديد نهاية نطاق الفرع
+PATH_END = '~'
+
+# عمق الردود الذي يُعرض تحت كل تعليق في الواجهة البرمجية
+COMMENT_REPLY_DEPTH = getattr(settings, 'COMMENT_REPLY_DEPTH', 3)
+
+
+def encode_segment(pk):
+    digits = ''
+    while pk:
+        pk, remainder = divmod(pk, len(PATH_ALPHABET))
+        digits = PATH_ALPHABET[remainder] + digits
+    return digits.rjust(PATH_STEP, '0')
+
+
+def comment_path(pk, parent):
+    """مسار التعليق وعمقه بناءً على أبيه"""
+    if parent is None:
+        return encode_segment(pk), 0
+
+    prefix, depth = parent.path, parent.depth + 1
+    if depth > PATH_MAX_DEPTH:
+        # الردود الأعمق من الحد تُعلّق كإخوة لأبيها
+        prefix, depth = parent.path[:-PATH_STEP], parent.depth
+    return prefix + encode_segment(pk), depth
+
+
+def subtree_q(comment, max_depth=None, include_self=False):
+    """شرط فرع التعليق كنطاق على الفهرس (post, path)"""
+    q = Q(post_id=comment.post_id, path__lt=comment.path + PATH_END)
+    q &= Q(path__gte=comment.path) if include_self else Q(path__gt=comment.path)
+    if max_depth is not None:
+        q &= Q(depth__lte=comment.depth + max_depth)
+    return q
+
+
+def thread_queryset(post, root=None, max_depth=None, after=None):
+    """تعليقات المنشور (أو فرع منه) مرتبة حسب الشجرة"""
+    if root is not None:
+        queryset = Comment.objects.filter(subtree_q(root, max_depth, include_self=True))
+    else:
+        queryset = Comment.objects.filter(post=post)
+        if max_depth is not None:
+            queryset = queryset.filter(depth__lte=max_depth)
+
+    if after:
+        queryset = queryset.filter(path__gt=after)
+
+    return queryset.select_related('user__user_settings').order_by('path')
+
+
+def build_tree(comments):
+    """
+    بناء الشجرة من تعليقات مرتبة حسب path.
+    التعليق الذي لا يوجد أبوه في القائمة يصبح جذراً.
+    """
+    nodes, roots = {}, []
+    for comment in comments:
+        comment.thread_children = []
+        nodes[comment.pk] = comment
+        parent = nodes.get(comment.parent_id)
+        if parent is None:
+            roots.append(comment)
+        else:
+            parent.thread_children.append(comment)
+    return roots
+
+
+def iter_thread(comments):
+    """كل التعليقات مع أحفادها بترتيب الشجرة"""
+    for comment in comments:
+        yield comment
+        yield from iter_thread(getattr(comment, 'thread_children', ()))
+
+
+def fetch_thread(post, root=None, max_depth=None, after=None, limit=None):
+    """
+    جلب سلسلة كاملة أو صفحة منها باستعلام واحد.
+    يُرجع (الجذور، مؤشر الصفحة التالية أو None).
+    """
+    queryset = thread_queryset(post, root, max_depth, after)
+    if limit is None:
+        return build_tree(queryset), None
+
+    comments = list(queryset[:limit + 1])
+    cursor = comments[limit - 1].path if len(comments) > limit else None
+    return build_tree(comments[:limit]), cursor
+
+
+def attach_threads(comments, max_depth=COMMENT_REPLY_DEPTH):
+    """تحميل ردود مجموعة تعليقات (حتى عمق محدد) باستعلام واحد"""
+    missing = [comment for comment in comments if not hasattr(comment, 'thread_children')]
+    if not missing:
+        return
+
+    q = Q()
+    nodes = {}
+    for comment in missing:
+        comment.thread_children = []
+        nodes[comment.pk] = comment
+        q |= subtree_q(comment, max_depth)
+
+    descendants = Comment.objects.filter(q).select_related('user__user_settings').order_by('path')
+    for comment in descendants:
+        comment.thread_children = []
+        parent = nodes.get(comment.parent_id)
+        nodes.setdefault(comment.pk, comment)
+        if parent is not None:
+            parent.thread_children.append(comment)
@@ -0,0 +1,293 @@
+"""
+الخط الزمني المُجهّز مسبقاً (fan-out on write)
+
+كل منشور جديد يُدفع إلى جدول TimelineEntry لكاتبه ولكل متابعيه،
+فتصبح قراءة الصفحة الرئيسية بحثاً بالمفتاح (owner, created_at)
+بدلاً من IN على قائمة المتابَعين ثم ترتيب جدول المنشورات كاملاً.
+
+الحسابات التي يتجاوز عدد متابعيها TIMELINE_FANOUT_THRESHOLD لا تُدفع
+منشوراتها (fan-out هجين)، بل تُسحب عند القراءة وتُدمج مع الخط المُجهّز.
+ما لم يُدفع يُعلَّم is_pulled ويبقى مسحوباً مهما تغيّر عدد متابعي كاتبه
+بعد ذلك، فعبور الحد في أي اتجاه لا يُسقط منشورات من الخطوط الزمنية.
+
+إصدار الخط الزمني (للـ ETag) من رموز في الذاكرة المؤقتة: رمز لكل مالك
+يتغير مع عضوية خطه ومتابعاته وإعجاباته، ورمز لكل كاتب يتغير مع منشوراته
+وتعديلها وحذفها وعدّاداتها. إصدار المستخدم يجمع رمزه ورموز من يتابعهم
+دون أي استعلام على جدول المنشورات. الرموز تتغير بعد تأكيد المعاملة.
+"""
+import hashlib
+import heapq
+import uuid
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Exists, F, OuterRef, Q, Window
+from django.db.models.functions import RowNumber
+
+from accounts.models import CustomUser
+from core.pagination import keyset_q
+from friends.models import Follow
+from .models import Post, TimelineEntry
+
+# عدد المنشورات التي تُنسخ إلى الخط الزمني عند متابعة حساب جديد
+TIMELINE_BACKFILL = getattr(settings, 'TIMELINE_BACKFILL', 200)
+TIMELINE_BATCH_SIZE = 1000
+# الحسابات التي يتجاوز عدد متابعيها هذا الحد تُسحب منشوراتها عند القراءة
+TIMELINE_FANOUT_THRESHOLD = getattr(settings, 'TIMELINE_FANOUT_THRESHOLD', 10000)
+
+
+def is_pull_author(user):
+    """هل تُسحب منشورات هذا الحساب عند القراءة بدلاً من دفعها"""
+    return user.followers_count >= TIMELINE_FANOUT_THRESHOLD
+
+
+def _version_key(owner_id):
+    return f'timeline:v:{owner_id}'
+
+
+def _author_version_key(author_id):
+    return f'timeline:author:{author_id}'
+
+
+def bump_versions(owner_ids=(), author_ids=()):
+    """تغيير إصدار الخطوط الزمنية المتأثرة بعملية كتابة بعد تأكيدها"""
+    keys = [_version_key(owner_id) for owner_id in set(owner_ids)]
+    keys += [_author_version_key(author_id) for author_id in set(author_ids)]
+    if keys:
+        transaction.on_commit(lambda: cache.set_many(dict.fromkeys(keys, uuid.uuid4().hex[:12]), timeout=None))
+
+
+def timeline_version(user):
+    """إصدار الخط الزمني للمستخدم من الذاكرة المؤقتة وقائمة متابَعيه فقط"""
+    author_ids = set(Follow.objects.filter(follower=user).values_list('following_id', flat=True))
+    keys = [_version_key(user.id)] + [_author_version_key(a) for a in sorted(author_ids | {user.id})]
+    versions = cache.get_many(keys)
+
+    missing = [key for key in keys if key not in versions]
+    if missing:
+        token = uuid.uuid4().hex[:12]
+        for key in missing:
+            cache.add(key, token, timeout=None)
+        versions.update(cache.get_many(missing))
+
+    raw = '|'.join(f'{key}={versions.get(key)}' for key in keys)
+    return hashlib.md5(raw.encode()).hexdigest()[:16]
+
+
+def _entry(owner_id, post):
+    return TimelineEntry(
+        owner_id=owner_id,
+        post_id=post.id,
+        author_id=post.user_id,
+        created_at=post.created_at,
+    )
+
+
+def _set_pulled(post, pulled):
+    if post.is_pulled != pulled:
+        post.is_pulled = pulled
+        Post.objects.filter(pk=post.pk).update(is_pulled=pulled)
+
+
+def fan_out_post(post):
+    """دفع المنشور إلى الخط الزمني لكاتبه ولجميع متابعيه"""
+    if post.is_deleted:
+        return
+
+    # حسابات المتابعين الكثيرين: يكفي خط الكاتب نفسه، والباقي يُسحب عند القراءة
+    if is_pull_author(post.user):
+        _set_pulled(post, True)
+        TimelineEntry.objects.bulk_create([_entry(post.user_id, post)], ignore_conflicts=True)
+        return
+    # منشور مسحوب استُعيد بعد نزول كاتبه تحت الحد: يُدفع الآن
+    _set_pulled(post, False)
+
+    follower_ids = Follow.objects.filter(
+        following_id=post.user_id
+    ).values_list('follower_id', flat=True)
+
+    batch = [_entry(post.user_id, post)]
+    for follower_id in follower_ids.iterator(chunk_size=TIMELINE_BATCH_SIZE):
+        batch.append(_entry(follower_id, post))
+        if len(batch) >= TIMELINE_BATCH_SIZE:
+            TimelineEntry.objects.bulk_create(batch, ignore_conflicts=True)
+            batch = []
+
+    if batch:
+        TimelineEntry.objects.bulk_create(batch, ignore_conflicts=True)
+
+
+def fan_out_posts(posts):
+    """دفع مجموعة منشورات جديدة دفعة واحدة (للإدخال المجمّع)"""
+    posts = [post for post in posts if not post.is_deleted]
+    author_ids = {post.user_id for post in posts}
+    pull_ids = set(CustomUser.objects.filter(
+        id__in=author_ids,
+        followers_count__gte=TIMELINE_FANOUT_THRESHOLD
+    ).values_list('id', flat=True))
+
+    pulled = [post.id for post in posts if post.user_id in pull_ids]
+    if pulled:
+        Post.objects.filter(id__in=pulled).update(is_pulled=True)
+
+    followers = defaultdict(list)
+    edges = Follow.objects.filter(following_id__in=author_ids - pull_ids).values_list('following_id', 'follower_id')
+    for following_id, follower_id in edges.iterator(chunk_size=TIMELINE_BATCH_SIZE):
+        followers[following_id].append(follower_id)
+
+    batch = []
+    for post in posts:
+        for owner_id in [post.user_id] + followers.get(post.user_id, []):
+            batch.append(_entry(owner_id, post))
+        if len(batch) >= TIMELINE_BATCH_SIZE:
+            TimelineEntry.objects.bulk_create(batch, ignore_conflicts=True)
+            batch = []
+    TimelineEntry.objects.bulk_create(batch, ignore_conflicts=True)
+    # الإدخال المجمّع لا يمر بإشارات الحفظ
+    bump_versions(author_ids=author_ids)
+
+
+def remove_post(post):
+    """إزالة المنشور من جميع الخطوط الزمنية (حذف ناعم)"""
+    TimelineEntry.objects.filter(post_id=post.id).delete()
+    bump_versions(author_ids=[post.user_id])
+
+
+def follow_added(follower_id, following_id):
+    """نسخ آخر منشورات الحساب المتابَع إلى الخط الزمني للمتابع"""
+    posts = Post.objects.filter(user_id=following_id, is_deleted=False)
+    # المنشورات المسحوبة تُقرأ من المصدر مباشرة فلا داعي لنسخها (عدا خط كاتبها)
+    if follower_id != following_id:
+        posts = posts.filter(is_pulled=False)
+    posts = posts.order_by('-created_at').only('id', 'user_id', 'created_at')[:TIMELINE_BACKFILL]
+
+    TimelineEntry.objects.bulk_create(
+        [_entry(follower_id, post) for post in posts],
+        ignore_conflicts=True,
+    )
+    # is_following و is_followed_by في خط الطرفين
+    bump_versions([follower_id, following_id])
+
+
+def follows_added(pairs):
+    """نسخ آخر منشورات الحسابات المتابَعة لمجموعة متابعات دفعة واحدة"""
+    pairs = list(pairs)
+    author_ids = {following_id for _, following_id in pairs}
+
+    # آخر TIMELINE_BACKFILL منشوراً مدفوعاً لكل كاتب باستعلام واحد
+    recent = Post.objects.filter(user_id__in=author_ids, is_deleted=False, is_pulled=False).annotate(
+        rank=Window(RowNumber(), partition_by=F('user_id'), order_by=F('created_at').desc())
+    ).filter(rank__lte=TIMELINE_BACKFILL).only('id', 'user_id', 'created_at')
+
+    posts = defaultdict(list)
+    for post in recent:
+        posts[post.user_id].append(post)
+
+    TimelineEntry.objects.bulk_create(
+        [_entry(follower_id, post) for follower_id, following_id in pairs for post in posts.get(following_id, ())],
+        ignore_conflicts=True,
+        batch_size=TIMELINE_BATCH_SIZE,
+    )
+    bump_versions({follower_id for follower_id, _ in pairs} | author_ids)
+
+
+def follow_removed(follower_id, following_id):
+    """إزالة منشورات الحساب من الخط الزمني بعد إلغاء المتابعة"""
+    TimelineEntry.objects.filter(owner_id=follower_id, author_id=following_id).delete()
+    bump_versions([follower_id, following_id])
+
+
+def rebuild_timeline(user):
+    """إعادة بناء الخط الزمني لمستخدم من الصفر"""
+    TimelineEntry.objects.filter(owner=user).delete()
+    bump_versions([user.id])
+
+    author_ids = list(
+        Follow.objects.filter(follower=user).values_list('following_id', flat=True)
+    ) + [user.id]
+
+    for author_id in author_ids:
+        follow_added(user.id, author_id)
+
+
+def home_timeline(user, include_own=True, queryset=None, before=None, after=None):
+    """منشورات الخط الزمني للمستخدم مرتبة من الأحدث"""
+    if queryset is None:
+        queryset = Post.objects.all()
+
+    # شرط المالك وشرط المؤشر في filter واحد حتى يُستخدم الفهرس (owner, created_at)
+    queryset = queryset.filter(
+        Q(timeline_entries__owner=user) &
+        keyset_q(before, after, created_field='timeline_entries__created_at'),
+        is_deleted=False
+    )
+    if not include_own:
+        queryset = queryset.exclude(user=user)
+
+    return queryset.order_by('-timeline_entries__created_at', '-id')
+
+
+class HomeTimeline:
+    """
+    الخط الزمني الهجين: المنشورات المدفوعة من TimelineEntry مدموجة
+    (k-way merge حسب التاريخ) مع المنشورات المسحوبة (is_pulled) للمتابَعين.
+
+    يُصفَّح بالمؤشر (created_at, id) عبر keyset_page فيبقى الدمج صحيحاً
+    بين الصفحات: كل مصدر يبدأ من المؤشر نفسه.
+    """
+
+    def __init__(self, user, include_own=True, queryset=None):
+        self.user = user
+        self.include_own = include_own
+        self.queryset = Post.objects.all() if queryset is None else queryset
+        self._pull_author_ids = None
+
+    @property
+    def pull_author_ids(self):
+        """المتابَعون الذين لهم منشورات مسحوبة، أياً كان عدد متابعيهم الآن"""
+        if self._pull_author_ids is None:
+            self._pull_author_ids = list(Follow.objects.filter(
+                Exists(Post.objects.filter(user_id=OuterRef('following_id'), is_pulled=True)),
+                follower=self.user,
+            ).values_list('following_id', flat=True))
+        return self._pull_author_ids
+
+    def sources(self, before=None, after=None):
+        """المصادر المرتبة تنازلياً التي يُدمج منها الخط الزمني"""
+        sources = [home_timeline(self.user, self.include_own, self.queryset, before, after)]
+        if self.pull_author_ids:
+            sources.append(self.queryset.filter(
+                keyset_q(before, after),
+                user_id__in=self.pull_author_ids,
+                is_pulled=True,
+                is_deleted=False
+            ).order_by('-created_at', '-id'))
+        return sources
+
+    def keyset_page(self, limit, before=None, after=None):
+        """أحدث limit منشوراً قبل before، أو أقدمها بعد after"""
+        ascending = after is not None and before is None
+        sources = self.sources(before, after)
+        if ascending:
+            sources = [source.reverse() for source in sources]
+
+        posts = merge_sources([source[:limit] for source in sources], limit, reverse=not ascending)
+        return posts[::-1] if ascending else posts
+
+
+def merge_sources(sources, limit=None, reverse=True):
+    """دمج مصادر مرتبة حسب (created_at, id) مع حذف المكرر"""
+    merged = heapq.merge(*sources, key=lambda post: (post.created_at, post.id), reverse=reverse)
+
+    posts, seen = [], set()
+    for post in merged:
+        # المصدران قد يتداخلان (منشور نُسخ إلى الخط ثم عُلّم مسحوباً)
+        if post.id in seen:
+            continue
+        seen.add(post.id)
+        posts.append(post)
+        if limit is not None and len(posts) >= limit:
+            break
+    return posts
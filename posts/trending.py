@@ -0,0 +1,158 @@
+"""
+الاتجاهات في نافذة زمنية منزلقة
+
+كل وسم/إلغاء وسم يُضاف إلى عدّاد دقيقة وعدّاد ساعة (HashtagBucket) حسب
+تاريخ المنشور. لكل نافذة (1h بالدقائق، 24h و 7d بالساعات) تُحفظ في
+الذاكرة المؤقتة مجاميع الفترات المغلقة، وعند التحديث تُضاف الفترات التي
+دخلت النافذة وتُطرح التي خرجت منها فقط، ثم تُضاف الفترة المفتوحة
+ويُختار أعلى k.
+"""
+import heapq
+from collections import Counter, defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F, Sum
+from django.utils import timezone
+
+from .models import Hashtag, HashtagBucket
+
+RESOLUTIONS = {
+    'minute': timedelta(minutes=1),
+    'hour': timedelta(hours=1),
+}
+# النافذة ← (طولها، دقة الفترات المستخدمة)
+WINDOWS = {
+    '1h': (timedelta(hours=1), 'minute'),
+    '24h': (timedelta(hours=24), 'hour'),
+    '7d': (timedelta(days=7), 'hour'),
+}
+DEFAULT_WINDOW = '24h'
+TRENDING_TOP_K = getattr(settings, 'TRENDING_TOP_K', 50)
+# مدة صلاحية قائمة الاتجاهات المحسوبة بالثواني
+TRENDING_REFRESH = getattr(settings, 'TRENDING_REFRESH', 30)
+
+
+def bucket_start(at, resolution):
+    at = at.replace(second=0, microsecond=0)
+    return at.replace(minute=0) if resolution == 'hour' else at
+
+
+def _state_key(window):
+    return f'trending:state:{window}'
+
+
+def _top_key(window):
+    return f'trending:top:{window}'
+
+
+def record(hashtag_ids, delta, at):
+    """إضافة delta لعدّادات الهاشتاجات في فترتي الدقيقة والساعة الخاصة بـ at"""
+    record_many({(hashtag_id, at): delta for hashtag_id in hashtag_ids})
+
+
+def record_many(events):
+    """إضافة تغييرات {(hashtag_id, at): delta} دفعة واحدة"""
+    now = timezone.now()
+    stale = set()
+    with transaction.atomic():
+        for resolution in RESOLUTIONS:
+            deltas = Counter()
+            for (hashtag_id, at), delta in events.items():
+                deltas[(hashtag_id, bucket_start(at, resolution))] += delta
+
+            # فترة واحدة وتغيير واحد لكل UPDATE
+            groups = defaultdict(list)
+            for (hashtag_id, start), delta in deltas.items():
+                if delta:
+                    groups[(start, delta)].append(hashtag_id)
+            if not groups:
+                continue
+
+            HashtagBucket.objects.bulk_create([
+                HashtagBucket(hashtag_id=hashtag_id, resolution=resolution, start=start)
+                for (start, _), hashtag_ids in groups.items() for hashtag_id in hashtag_ids
+            ], ignore_conflicts=True, batch_size=1000)
+            for (start, delta), hashtag_ids in groups.items():
+                HashtagBucket.objects.filter(
+                    hashtag_id__in=hashtag_ids, resolution=resolution, start=start
+                ).update(count=F('count') + delta)
+
+            # تغيّر فترة مغلقة: المجاميع المحفوظة لم تعد صحيحة
+            if min(start for start, _ in groups) < bucket_start(now, resolution):
+                stale.update(window for window, (_, res) in WINDOWS.items() if res == resolution)
+
+    if stale:
+        cache.delete_many([_state_key(window) for window in stale] + [_top_key(window) for window in stale])
+
+
+def _sum_buckets(resolution, since, until):
+    rows = HashtagBucket.objects.filter(
+        resolution=resolution, start__gte=since, start__lt=until
+    ).values('hashtag_id').annotate(total=Sum('count')).values_list('hashtag_id', 'total')
+    return Counter(dict(rows))
+
+
+def _closed_counts(window, now):
+    """مجاميع الفترات المغلقة في النافذة، محدّثة تزايدياً"""
+    length, resolution = WINDOWS[window]
+    current = bucket_start(now, resolution)
+    lo = current - length + RESOLUTIONS[resolution]
+
+    state = cache.get(_state_key(window))
+    if state is None or state['hi'] <= lo or state['hi'] > current:
+        counts = _sum_buckets(resolution, lo, current)
+    else:
+        counts = state['counts']
+        if state['hi'] < current:
+            counts.update(_sum_buckets(resolution, state['hi'], current))
+        if state['lo'] < lo:
+            counts.subtract(_sum_buckets(resolution, state['lo'], lo))
+        counts = +counts
+
+    cache.set(_state_key(window), {'lo': lo, 'hi': current, 'counts': counts}, timeout=None)
+    return counts, current
+
+
+def refresh(window, now=None):
+    """إعادة حساب أعلى TRENDING_TOP_K هاشتاج في النافذة وتخزينها"""
+    now = now or timezone.now()
+    resolution = WINDOWS[window][1]
+    counts, current = _closed_counts(window, now)
+
+    # الفترة المفتوحة تتغير باستمرار فتُقرأ في كل تحديث
+    counts = counts + _sum_buckets(resolution, current, current + RESOLUTIONS[resolution])
+    # عند التساوي يتقدم الهاشتاج الأقدم
+    top = heapq.nlargest(TRENDING_TOP_K, counts.items(), key=lambda item: (item[1], -item[0]))
+
+    names = dict(Hashtag.objects.filter(id__in=[hashtag_id for hashtag_id, _ in top]).values_list('id', 'name'))
+    trends = [
+        {'name': names[hashtag_id], 'count': count}
+        for hashtag_id, count in top if hashtag_id in names
+    ]
+    cache.set(_top_key(window), trends, TRENDING_REFRESH)
+    return trends
+
+
+def trending(window=DEFAULT_WINDOW, limit=10):
+    """الاتجاهات من الذاكرة المؤقتة، مع تحديثها عند انتهاء صلاحيتها"""
+    if window not in WINDOWS:
+        raise ValueError(f'نافذة غير معروفة: {window}')
+
+    trends = cache.get(_top_key(window))
+    if trends is None:
+        trends = refresh(window)
+    return trends[:limit]
+
+
+def prune(now=None):
+    """حذف الفترات التي خرجت من أطول نافذة لكل دقة"""
+    now = now or timezone.now()
+    deleted = 0
+    for resolution, step in RESOLUTIONS.items():
+        longest = max(length for length, res in WINDOWS.values() if res == resolution)
+        oldest = bucket_start(now, resolution) - longest + step
+        deleted += HashtagBucket.objects.filter(resolution=resolution, start__lt=oldest).delete()[0]
+    return deleted
@@ -0,0 +1,217 @@
+"""
+رفع الفيديو على أجزاء قابل للاستئناف
+
+ينشئ العميل جلسة رفع بحجم الملف، ثم يرسل أجزاءه بطلبات PUT مع
+Content-Range. كل جزء يُقرأ من جسم الطلب على كتل ويُكتب مباشرة في ملف
+مؤقت عند موضعه دون تحميله في الذاكرة، ويُسجَّل ما وصل فعلاً، فإن انقطع
+الاتصال يستأنف العميل من آخر موضع (received). عند الإكمال يُنقل الملف
+إلى التخزين (إعادة تسمية على نظام الملفات نفسه) ويُرفق بالمنشور.
+
+يُقبل من الفيديو ما في VIDEO_TYPES فقط: الامتداد يجب أن يطابق نوع
+المحتوى المُعلن، وأول بايتات الملف المكتمل يجب أن تطابق صيغته قبل
+إرفاقه، فلا يُخزَّن HTML أو غيره باسم فيديو.
+"""
+import os
+import re
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Post, UploadSession
+
+UPLOAD_SESSION_DIR = getattr(settings, 'UPLOAD_SESSION_DIR', os.path.join(settings.BASE_DIR, 'upload_sessions'))
+VIDEO_UPLOAD_MAX_SIZE = getattr(settings, 'VIDEO_UPLOAD_MAX_SIZE', 512 * 1024 * 1024)
+UPLOAD_CHUNK_MAX_SIZE = getattr(settings, 'UPLOAD_CHUNK_MAX_SIZE', 16 * 1024 * 1024)
+# الجلسات غير المكتملة التي لم تتقدم خلال هذه المدة تُحذف (expire_uploads)
+UPLOAD_SESSION_TTL = getattr(settings, 'UPLOAD_SESSION_TTL', timedelta(hours=24))
+STREAM_BLOCK_SIZE = 64 * 1024
+
+CONTENT_RANGE_RE = re.compile(r'^bytes (\d+)-(\d+)/(\d+)$')
+
+# امتداد الفيديو -> أنواع المحتوى المقبولة له
+VIDEO_TYPES = {
+    '.mp4': {'video/mp4'},
+    '.m4v': {'video/mp4', 'video/x-m4v'},
+    '.mov': {'video/quicktime'},
+    '.webm': {'video/webm'},
+    '.ogv': {'video/ogg'},
+}
+# صناديق ISO BMFF التي قد يبدأ بها ملف mp4/mov (البايتات 4-8)
+ISO_MEDIA_BOXES = (b'ftyp', b'moov', b'mdat', b'wide', b'free', b'skip')
+
+
+class UploadError(Exception):
+    pass
+
+
+class OffsetMismatch(UploadError):
+    """الجزء لا يبدأ من آخر موضع مستلم؛ يُرجع للعميل الموضع الصحيح"""
+
+    def __init__(self, offset):
+        super().__init__(f'الجزء يجب أن يبدأ من {offset}')
+        self.offset = offset
+
+
+class _PartFile(File):
+    # FileSystemStorage ينقل الملفات التي لها مسار مؤقت بدلاً من نسخها
+    def temporary_file_path(self):
+        return self.name
+
+
+def video_extension(filename):
+    """امتداد الفيديو بأحرف صغيرة، أو UploadError إن لم يكن مقبولاً"""
+    extension = os.path.splitext(filename)[1].lower()
+    if extension not in VIDEO_TYPES:
+        raise UploadError(f"الامتدادات المقبولة: {', '.join(VIDEO_TYPES)}")
+    return extension
+
+
+def check_video_type(filename, content_type):
+    """الامتداد مقبول ويطابق نوع المحتوى المُعلن"""
+    if content_type not in VIDEO_TYPES[video_extension(filename)]:
+        raise UploadError(f'نوع المحتوى {content_type} لا يطابق امتداد الملف')
+
+
+def sniff_video(f, extension):
+    """هل تطابق أول بايتات الملف صيغة الامتداد"""
+    position = f.tell()
+    f.seek(0)
+    head = f.read(12)
+    f.seek(position)
+    if extension == '.webm':
+        return head.startswith(b'\x1a\x45\xdf\xa3')  # EBML
+    if extension == '.ogv':
+        return head.startswith(b'OggS')
+    return head[4:8] in ISO_MEDIA_BOXES
+
+
+def check_video_file(f):
+    """فحص فيديو مرفوع مباشرة (خارج جلسات الرفع): الامتداد والصيغة"""
+    if not sniff_video(f, video_extension(f.name)):
+        raise UploadError('محتوى الملف ليس فيديو بالصيغة المُعلنة')
+
+
+def part_path(session):
+    return os.path.join(UPLOAD_SESSION_DIR, f'{session.pk}.part')
+
+
+def parse_content_range(header, size):
+    """(البداية، الطول) من 'bytes start-end/total'"""
+    match = CONTENT_RANGE_RE.match(header or '')
+    if not match:
+        raise UploadError('Content-Range مطلوب بالصيغة bytes start-end/total')
+    start, end, total = map(int, match.groups())
+    if total != size or end < start or end >= size:
+        raise UploadError('Content-Range لا يطابق حجم الملف')
+    return start, end - start + 1
+
+
+def write_chunk(session, stream, start, length):
+    """
+    كتابة جزء من stream عند start دون تحميله في الذاكرة.
+    يُسجَّل ما وصل فعلاً حتى لو انقطع الاتصال، ويُرجع الموضع الجديد.
+    """
+    if session.is_complete:
+        raise UploadError('الرفع مكتمل')
+    if start != session.received:
+        raise OffsetMismatch(session.received)
+    if length > UPLOAD_CHUNK_MAX_SIZE:
+        raise UploadError(f'الجزء أكبر من {UPLOAD_CHUNK_MAX_SIZE} بايت')
+
+    os.makedirs(UPLOAD_SESSION_DIR, exist_ok=True)
+    # O_CREAT دون O_TRUNC: الملف الموجود لا يُفرّغ
+    fd = os.open(part_path(session), os.O_WRONLY | os.O_CREAT, 0o600)
+    written = 0
+    with os.fdopen(fd, 'wb') as f:
+        f.seek(start)
+        while written < length:
+            block = stream.read(min(STREAM_BLOCK_SIZE, length - written))
+            if not block:
+                break
+            f.write(block)
+            written += len(block)
+
+    if written:
+        # تقدّم مشروط بالموضع: طلبان متزامنان لنفس الموضع لا يتقدمان معاً
+        advanced = UploadSession.objects.filter(
+            pk=session.pk, received=start, completed_at__isnull=True
+        ).update(received=start + written, updated_at=timezone.now())
+        if not advanced:
+            session.refresh_from_db(fields=['received'])
+            raise OffsetMismatch(session.received)
+        session.received = start + written
+
+    if written < length:
+        raise UploadError('انقطع الجزء قبل اكتماله')
+    return session.received
+
+
+def finalize(session, content=''):
+    """نقل الملف المكتمل إلى التخزين وإرفاقه بالمنشور (أو إنشاء منشور جديد)"""
+    if session.received != session.size:
+        raise UploadError(f'لم يكتمل الرفع ({session.received}/{session.size})')
+    if session.is_complete:
+        raise UploadError('الرفع مكتمل')
+    try:
+        with open(part_path(session), 'rb') as f:
+            is_video = sniff_video(f, video_extension(session.filename))
+    except FileNotFoundError:
+        # أكمله طلب متزامن ونقل الملف
+        raise UploadError('الرفع مكتمل')
+    if not is_video:
+        # لا يمكن تصحيح الجلسة بعد اكتمالها فتُحذف
+        discard(session)
+        raise UploadError('محتوى الملف ليس فيديو بالصيغة المُعلنة')
+
+    with transaction.atomic():
+        # إكمال مشروط: طلبا إكمال متزامنان لا يُرفقان الملف مرتين
+        claimed = UploadSession.objects.filter(pk=session.pk, completed_at__isnull=True).update(
+            completed_at=timezone.now()
+        )
+        if not claimed:
+            raise UploadError('الرفع مكتمل')
+
+        post = session.post
+        name = Post._meta.get_field('video').generate_filename(post, session.filename)
+        with open(part_path(session), 'rb') as f:
+            name = default_storage.save(name, _PartFile(f, name=part_path(session)))
+
+        if post is None:
+            post = Post.objects.create(user=session.user, content=content, post_type='video', video=name)
+        else:
+            # الفيديو السابق يُحذف عند الحفظ إن لم يشر إليه غيره (core.blobs)
+            post.video = name
+            post.post_type = 'video'
+            post.save(update_fields=['video', 'post_type', 'updated_at'])
+
+    session.refresh_from_db()
+    _remove_part(session)
+    return post
+
+
+def _remove_part(session):
+    try:
+        os.remove(part_path(session))
+    except FileNotFoundError:
+        pass
+
+
+def discard(session):
+    """حذف جلسة وملفها المؤقت"""
+    _remove_part(session)
+    session.delete()
+
+
+def expire_sessions(now=None):
+    """حذف الجلسات غير المكتملة المتروكة، ويُرجع عددها"""
+    cutoff = (now or timezone.now()) - UPLOAD_SESSION_TTL
+    expired = UploadSession.objects.filter(completed_at__isnull=True, updated_at__lt=cutoff)
+    count = 0
+    for session in expired.iterator():
+        discard(session)
+        count += 1
+    return count
@@ -7,62 +7,50 @@ from .models import Post, Comment, Like
 from .forms import PostForm, CommentForm
 from accounts.models import CustomUser
 from friends.models import Follow
+from core import autocomplete, fulltext
+from core.querybudget import query_budget
+from core.replica import use_replica
  
 
  
 
 #########""""
-from django.db.models import Q
  
-from django.core.paginator import Paginator
 
+SEARCH_PAGE_SIZE = 20
+
+@use_replica
 @login_required
 def search_view(request):
-    """صفحة البحث"""
+    """صفحة البحث: المنشورات ثم المستخدمون بترتيب الصلة، تُجلب صفحة واحدة فقط"""
     query = request.GET.get('q', '').strip()
-    results = []
     search_type = request.GET.get('type', 'all')
+    try:
+        page_number = max(int(request.GET.get('page', 1)), 1)
+    except ValueError:
+        page_number = 1
+    
+    sections = []
+    if search_type in ['all', 'posts']:
+        sections.append(fulltext.SearchSection('post', Post.objects.select_related('user'), True))
+    if search_type in ['all', 'users']:
+        sections.append(fulltext.SearchSection('user', CustomUser.objects.all(), False))
     
     if query:
-        if search_type in ['all', 'posts']:
-            # البحث في المنشورات
-            posts_results = Post.objects.filter(
-                Q(content__icontains=query) | 
-                Q(user__username__icontains=query)
-            ).filter(is_deleted=False).order_by('-created_at')
-        else:
-            posts_results = Post.objects.none()
-        
-        if search_type in ['all', 'users']:
-            # البحث في المستخدمين
-            users_results = CustomUser.objects.filter(
-                Q(username__icontains=query) |
-                Q(first_name__icontains=query) |
-                Q(last_name__icontains=query) |
-                Q(bio__icontains=query)
-            )
-        else:
-            users_results = CustomUser.objects.none()
-        
-        # إضافة معلومات إضافية للنتائج
-        for post in posts_results:
-            post.result_type = 'post'
-            post.user_has_liked = Like.objects.filter(post=post, user=request.user).exists()
-            results.append(post)
-        
-        for user in users_results:
-            user.result_type = 'user'
-            # التحقق إذا كان المستخدم يتابع هذا المستخدم
-            user.is_following = Follow.objects.filter(
-                follower=request.user, 
-                following=user
-            ).exists()
-            results.append(user)
-    
-    # التصفيح
-    paginator = Paginator(results, 20)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+        page_obj = fulltext.merged_page(query, sections, page_number, SEARCH_PAGE_SIZE)
+    else:
+        page_obj = fulltext.SearchPage([], 1, False)
+    
+    # حالة المشاهد وعدّادات الصفحة فقط، باستعلام واحد لكل علاقة
+    posts = [result for result in page_obj if result.result_type == 'post']
+    users = [result for result in page_obj if result.result_type == 'user']
+    counters.merge_pending(posts)
+    viewer = ViewerState(request.user)
+    viewer.prime(posts=posts, users=users)
+    for post in posts:
+        post.user_has_liked = viewer.has_liked_post(post)
+    for user in users:
+        user.is_following = viewer.is_following(user)
     
     return render(request, 'posts/search.html', {
         'query': query,
@@ -83,25 +71,18 @@ def search_ajax(request):
     }
     
     if query and len(query) >= 2:
-        # البحث في المستخدمين
-        users = CustomUser.objects.filter(
-            Q(username__icontains=query) |
-            Q(first_name__icontains=query) |
-            Q(last_name__icontains=query)
-        )[:5]
-        
-        for user in users:
+        # المستخدمون من فهرس الاقتراح في الذاكرة
+        for suggestion in autocomplete.suggest_users(query, 5):
+            user = suggestion.payload
             results['users'].append({
-                'id': user.id,
-                'username': user.username,
-                'profile_image': user.profile_image.url if user.profile_image else '',
-                'bio': user.bio[:50] if user.bio else ''
+                'id': user['id'],
+                'username': user['username'],
+                'profile_image': user['profile_image'],
+                'bio': user['bio']
             })
         
         # البحث في المنشورات
-        posts = Post.objects.filter(
-            Q(content__icontains=query)
-        ).filter(is_deleted=False).order_by('-created_at')[:5]
+        posts = fulltext.search_objects('post', query, Post.objects.select_related('user'), 5)
         
         for post in posts:
             results['posts'].append({
@@ -125,40 +106,64 @@ from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.http import JsonResponse, HttpResponseForbidden
-from django.db.models import Count, Q
+from django.db.models import Count, Q, OuterRef, Prefetch, Subquery
+from django.db.models.functions import Coalesce
 from .models import Post, Comment, Like
 from .forms import PostForm, CommentForm, EditPostForm
 from accounts.models import CustomUser
 from friends.models import Follow
+from core.viewer import ViewerState
+from .threads import fetch_thread, iter_thread
+from . import counters
+
+def _count_subquery(queryset, field):
+    """عدد صفوف queryset لكل مستخدم كاستعلام فرعي"""
+    return Coalesce(Subquery(
+        queryset.filter(**{field: OuterRef('pk')})
+        .order_by().values(field)
+        .annotate(total=Count('pk')).values('total')
+    ), 0)
 
+# +3 عند انتهاء صلاحية الاتجاهات المخزنة (تُعاد حسابها مرة كل TRENDING_REFRESH)
+@query_budget(11)
 @login_required
 def home_view(request): 
-    try:
-        posts = Post.objects.filter(is_deleted=False).order_by('-created_at')[:20]
-    except:
-        posts = Post.objects.all().order_by('-created_at')[:20]
+    # عدد ثابت من الاستعلامات مهما كان عدد المنشورات والتعليقات:
+    # المنشورات + أول 5 تعليقات لكل منشور (نافذة) + العدّادات المعلّقة
+    # + الإعجابات + الإحصائيات
+    top_comments = Comment.objects.filter(parent=None).select_related('user').annotate(
+        replies_count=Count('replies')
+    ).order_by('created_at', 'id')[:5]
+    
+    posts = list(
+        Post.objects.filter(is_deleted=False)
+        .select_related('user')
+        .prefetch_related(Prefetch('post_comments', queryset=top_comments, to_attr='comments'))
+        .order_by('-created_at')[:20]
+    )
+    
+    all_comments = [c for post in posts for c in post.comments]
+    counters.merge_pending(posts + all_comments)
+    viewer = ViewerState(request.user)
+    viewer.prime(posts=posts, comments=all_comments)
     
     for post in posts:
-        try:
-            post.user_has_liked = Like.objects.filter(post=post, user=request.user).exists()
-        except:
-            post.user_has_liked = False
-            
-        post.comments = Comment.objects.filter(post=post, parent=None)[:5]
+        post.user_has_liked = viewer.has_liked_post(post)
         for comment in post.comments:
-            try:
-                comment.user_has_liked = Like.objects.filter(comment=comment, user=request.user).exists()
-            except:
-                comment.user_has_liked = False
-            comment.replies_count = Comment.objects.filter(parent=comment).count()
+            comment.user_has_liked = viewer.has_liked_comment(comment)
         
         post.can_edit = post.user == request.user
         post.can_delete = post.user == request.user or request.user.is_staff
     
+    posts_count, following_count, followers_count = CustomUser.objects.filter(pk=request.user.pk).values_list(
+        _count_subquery(Post.objects.all(), 'user'),
+        _count_subquery(Follow.objects.all(), 'follower'),
+        _count_subquery(Follow.objects.all(), 'following'),
+    ).get()
     user_stats = {
-        'posts_count': Post.objects.filter(user=request.user).count(),
-        'following_count': Follow.objects.filter(follower=request.user).count(),
-        'followers_count': Follow.objects.filter(following=request.user).count(),
+        'posts_count': posts_count,
+        'following_count': following_count,
+        'followers_count': followers_count,
     }
     
     # تأكد من أنك لا تمرر 'query' في context
@@ -185,7 +190,7 @@ def edit_post(request, post_id):
         if form.is_valid():
             edited_post = form.save(commit=False)
             edited_post.is_edited = True
-            edited_post.save()
+            edited_post.save(update_fields=['content', 'image', 'video', 'is_edited', 'updated_at'])
             
             messages.success(request, 'تم تعديل التغريدة بنجاح')
             return redirect('home')
@@ -211,6 +216,7 @@ def delete_post(request, post_id):
         messages.success(request, 'تم حذف التغريدة بنجاح')
         return redirect('home')
     
+    counters.merge_pending([post])
     return render(request, 'posts/delete_confirm.html', {
         'post': post,
     })
@@ -269,19 +275,17 @@ def like_post(request, post_id):
     
     if not created:
         like.delete()
-        post.likes_count -= 1
         action = 'unliked'
     else:
-        post.likes_count += 1
         action = 'liked'
     
-    post.save()
+    counters.record(post, 'likes_count', 1 if created else -1)
     
     if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
         return JsonResponse({
             'success': True,
             'action': action,
-            'likes_count': post.likes_count,
+            'likes_count': counters.current(post, 'likes_count'),
         })
     
     messages.info(request, f'تم {action} المنشور')
@@ -291,16 +295,23 @@ def like_post(request, post_id):
 def post_detail(request, post_id):
     """تفاصيل المنشور مع التعليقات"""
     post = get_object_or_404(Post, id=post_id)
-    comments = Comment.objects.filter(post=post, parent=None).order_by('-created_at')
     
-    # إضافة بيانات لكل تعليق
+    # السلسلة كاملة باستعلام واحد، ثم الإعجابات دفعة واحدة
+    roots, _ = fetch_thread(post)
+    comments = roots[::-1]
+    thread = list(iter_thread(comments))
+    counters.merge_pending([post] + thread)
+    viewer = ViewerState(request.user)
+    viewer.prime(posts=[post], comments=thread)
+    
+    # إضافة بيانات لكل تعليق: الردود بكل مستوياتها بترتيبها الزمني داخل الشجرة
     for comment in comments:
-        comment.user_has_liked = Like.objects.filter(comment=comment, user=request.user).exists()
-        comment.replies_list = Comment.objects.filter(parent=comment).order_by('created_at')
+        comment.user_has_liked = viewer.has_liked_comment(comment)
+        comment.replies_list = list(iter_thread(comment.thread_children))
         for reply in comment.replies_list:
-            reply.user_has_liked = Like.objects.filter(comment=reply, user=request.user).exists()
+            reply.user_has_liked = viewer.has_liked_comment(reply)
     
-    post.user_has_liked = Like.objects.filter(post=post, user=request.user).exists()
+    post.user_has_liked = viewer.has_liked_post(post)
     
     if request.method == 'POST':
         form = CommentForm(request.POST)
@@ -310,8 +321,7 @@ def post_detail(request, post_id):
             comment.user = request.user
             comment.save()
             
-            post.comments_count += 1
-            post.save()
+            counters.record(post, 'comments_count', 1)
             
             messages.success(request, 'تم إضافة التعليق بنجاح')
             return redirect('post_detail', post_id=post_id)
@@ -335,8 +345,7 @@ def add_comment(request, post_id):
             comment.user = request.user
             comment.save()
             
-            post.comments_count += 1
-            post.save()
+            counters.record(post, 'comments_count', 1)
             
             if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
                 return JsonResponse({
@@ -371,8 +380,7 @@ def reply_comment(request, comment_id):
             comment.parent = parent_comment  # هذا هو التعديل الصحيح
             comment.save()
             
-            parent_comment.post.comments_count += 1
-            parent_comment.post.save()
+            counters.record(parent_comment.post, 'comments_count', 1)
             
             if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
                 return JsonResponse({
@@ -402,19 +410,17 @@ def like_comment(request, comment_id):
     
     if not created:
         like.delete()
-        comment.likes_count -= 1
         action = 'unliked'
     else:
-        comment.likes_count += 1
         action = 'liked'
     
-    comment.save()
+    counters.record(comment, 'likes_count', 1 if created else -1)
     
     if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
         return JsonResponse({
             'success': True,
             'action': action,
-            'likes_count': comment.likes_count,
+            'likes_count': counters.current(comment, 'likes_count'),
         })
     
     messages.info(request, f'تم {action} التعليق')
@@ -453,11 +459,12 @@ def delete_comment(request, comment_id):
         return redirect('post_detail', post_id=comment.post.id)
     
     post = comment.post
+    comments = Comment.objects.filter(post=post)
+    before = comments.count()
     comment.delete()
     
-    # تحديث عدد التعليقات
-    post.comments_count = Comment.objects.filter(post=post).count()
-    post.save()
+    # الحذف يشمل الردود المتتالية، فيُسجَّل الفرق كاملاً كتغيير معلّق
+    counters.record(post, 'comments_count', comments.count() - before)
     
     messages.success(request, 'تم حذف التعليق بنجاح')
     return redirect('post_detail', post_id=post.id)
@@ -476,7 +483,7 @@ def edit_comment(request, comment_id):
         if content:
             comment.content = content
             comment.is_edited = True
-            comment.save()
+            comment.save(update_fields=['content', 'is_edited', 'updated_at'])
             
             if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
                 return JsonResponse({
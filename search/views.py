@@ -1,15 +1,35 @@
-from django.shortcuts import render
-from django.db.models import Q
 from django.contrib.auth.decorators import login_required
+from django.db.models import Count, F, Window
+from django.db.models.functions import RowNumber
+from django.http import JsonResponse
+from django.shortcuts import render
+from django.urls import reverse
 from accounts.models import CustomUser
+from posts import counters
+from posts.hashtags import PostHashtag
 from posts.models import Post, Hashtag
-from friends.models import Follow
+from core import fulltext
+from core.autocomplete import suggest_hashtags, suggest_users
+from core.replica import use_replica
+from core.viewer import ViewerState
 
+# حجم الصفحة عند عرض نوع واحد، وعدد نتائج كل نوع في عرض "الكل"
+SEARCH_PAGE_SIZE = 20
+SEARCH_PREVIEW_SIZE = 5
+# حد أقصى لعمق التصفيح (SEARCH_PAGE_SIZE × SEARCH_MAX_PAGES نتيجة لكل نوع)
+SEARCH_MAX_PAGES = 10
+HASHTAG_RECENT_POSTS = 3
+
+@use_replica
 @login_required
 def search_view(request):
     """صفحة البحث الرئيسية"""
     query = request.GET.get('q', '').strip()
     search_type = request.GET.get('type', 'all')  # all, users, posts, hashtags
+    try:
+        page = min(max(int(request.GET.get('page', 1)), 1), SEARCH_MAX_PAGES)
+    except ValueError:
+        page = 1
     
     context = {
         'query': query,
@@ -18,65 +38,93 @@ def search_view(request):
     }
     
     if query:
-        if search_type in ['all', 'users']:
-            context['users'] = search_users(query, request.user)
-            context['results_count'] += len(context.get('users', []))
+        # في عرض "الكل" معاينة من كل نوع دون تصفيح
+        if search_type == 'all':
+            page, per_page = 1, SEARCH_PREVIEW_SIZE
+        else:
+            per_page = SEARCH_PAGE_SIZE
         
-        if search_type in ['all', 'posts']:
-            context['posts'] = search_posts(query, request.user)
-            context['results_count'] += len(context.get('posts', []))
+        searches = {
+            'users': search_users,
+            'posts': search_posts,
+            'hashtags': search_hashtags,
+        }
+        for name, search in searches.items():
+            if search_type in ['all', name]:
+                results = search(query, request.user, page, per_page)
+                context[name] = results
+                context['results_count'] += len(results)
+                if search_type == name:
+                    context['page_obj'] = results
         
-        if search_type in ['all', 'hashtags']:
-            context['hashtags'] = search_hashtags(query)
-            context['results_count'] += len(context.get('hashtags', []))
+        page_obj = context.get('page_obj')
+        context['has_next_page'] = bool(page_obj) and page_obj.has_next() and page_obj.number < SEARCH_MAX_PAGES
     
     return render(request, 'search/results.html', context)
 
-def search_users(query, current_user):
-    """بحث عن المستخدمين"""
-    users = CustomUser.objects.filter(
-        Q(username__icontains=query) |
-        Q(first_name__icontains=query) |
-        Q(last_name__icontains=query) |
-        Q(bio__icontains=query)
-    ).exclude(id=current_user.id)
+def search_users(query, current_user, page=1, per_page=SEARCH_PAGE_SIZE):
+    """بحث عن المستخدمين: صفحة واحدة وحالة المتابعة والعدّادات لها دفعة واحدة"""
+    section = fulltext.SearchSection('user', CustomUser.objects.exclude(id=current_user.id), False)
+    users = fulltext.merged_page(query, [section], page, per_page)
     
-    # إضافة معلومات إضافية لكل مستخدم
+    # followers_count مخزّن في المستخدم؛ المنشورات باستعلام مجمّع واحد
+    posts_counts = dict(
+        Post.objects.filter(user_id__in=[user.pk for user in users], is_deleted=False)
+        .values_list('user_id').annotate(n=Count('id')).order_by()
+    ) if users else {}
+    viewer = ViewerState(current_user)
+    viewer.prime(users=users)
     for user in users:
-        user.is_following = Follow.objects.filter(
-            follower=current_user,
-            following=user
-        ).exists()
-        
-        user.posts_count = Post.objects.filter(user=user).count()
-        user.followers_count = Follow.objects.filter(following=user).count()
-        user.following_count = Follow.objects.filter(follower=user).count()
+        user.is_following = viewer.is_following(user)
+        user.posts_count = posts_counts.get(user.pk, 0)
     
     return users
 
-def search_posts(query, current_user):
-    """بحث عن المنشورات"""
-    posts = Post.objects.filter(
-        Q(content__icontains=query) |
-        Q(user__username__icontains=query)
-    ).select_related('user').order_by('-created_at')
+def search_posts(query, current_user, page=1, per_page=SEARCH_PAGE_SIZE):
+    """بحث عن المنشورات: صفحة واحدة مع إعجابات المشاهد والعدّادات المعلّقة"""
+    section = fulltext.SearchSection('post', Post.objects.select_related('user'), True)
+    posts = fulltext.merged_page(query, [section], page, per_page)
     
-    # إضافة معلومات إضافية لكل منشور
+    counters.merge_pending(posts)
+    viewer = ViewerState(current_user)
+    viewer.prime(posts=posts)
     for post in posts:
-        post.user_has_liked = post.post_likes.filter(user=current_user).exists()
-        post.comments_count = post.post_comments.count()
+        post.user_has_liked = viewer.has_liked_post(post)
     
     return posts
 
-def search_hashtags(query):
-    """بحث عن الهاشتاجات"""
-    # إذا بدأ البحث بـ #، ابحث عن الهاشتاجات فقط
-    if query.startswith('#'):
-        hashtag_name = query[1:]  # إزالة #
-        return Hashtag.objects.filter(name__icontains=hashtag_name)
+def search_hashtags(query, current_user=None, page=1, per_page=SEARCH_PAGE_SIZE):
+    """بحث عن الهاشتاجات بالبادئة (الأسماء مخزنة بحروف صغيرة) مرتبة بالاستخدام"""
+    prefix = query.lstrip('#').strip().lower()
+    if not prefix:
+        return fulltext.SearchPage([], page, False)
     
-    # وإلا ابحث في كل مكان
-    return Hashtag.objects.filter(name__icontains=query)
+    # نطاق على فهرس الاسم الفريد بدلاً من LIKE
+    offset = (page - 1) * per_page
+    hashtags = list(
+        Hashtag.objects.filter(name__gte=prefix, name__lt=prefix + '\U0010ffff')
+        .order_by('-usage_count', 'name')[offset:offset + per_page + 1]
+    )
+    page_obj = fulltext.SearchPage(hashtags[:per_page], page, len(hashtags) > per_page)
+    
+    # أحدث منشورات كل هاشتاج في استعلام واحد (ترقيم داخل كل هاشتاج)
+    for hashtag in page_obj:
+        hashtag.recent_posts = []
+    by_id = {hashtag.pk: hashtag for hashtag in page_obj}
+    if by_id:
+        links = (
+            PostHashtag.objects.filter(hashtag_id__in=by_id, post__is_deleted=False)
+            .annotate(rank=Window(
+                RowNumber(), partition_by=F('hashtag_id'), order_by=F('post__created_at').desc(),
+            ))
+            .filter(rank__lte=HASHTAG_RECENT_POSTS)
+            .select_related('post')
+            .order_by('hashtag_id', 'rank')
+        )
+        for link in links:
+            by_id[link.hashtag_id].recent_posts.append(link.post)
+    
+    return page_obj
 
 @login_required
 def autocomplete(request):
@@ -85,31 +133,24 @@ def autocomplete(request):
     results = []
     
     if len(query) >= 2:  # ابدأ الاقتراح بعد حرفين
-        # البحث عن المستخدمين
-        users = CustomUser.objects.filter(
-            Q(username__icontains=query) |
-            Q(first_name__icontains=query) |
-            Q(last_name__icontains=query)
-        )[:5]
-        
-        for user in users:
+        # من فهرس الاقتراح في الذاكرة دون استعلامات
+        for suggestion in suggest_users(query, 5):
+            user = suggestion.payload
             results.append({
                 'type': 'user',
-                'username': user.username,
-                'name': f"{user.first_name} {user.last_name}".strip() or user.username,
-                'profile_image': user.profile_image.url if user.profile_image else '',
-                'url': f"/profile/{user.username}/"
+                'username': user['username'],
+                'name': user['name'],
+                'profile_image': user['profile_image'],
+                'url': f"/profile/{user['username']}/"
             })
         
-        # البحث عن الهاشتاجات
-        hashtags = Hashtag.objects.filter(name__icontains=query)[:5]
-        
-        for hashtag in hashtags:
+        for suggestion in suggest_hashtags(query, 5):
+            name = suggestion.payload['name']
             results.append({
                 'type': 'hashtag',
-                'name': f"#{hashtag.name}",
-                'count': hashtag.usage_count,
-                'url': f"/search/?q=%23{hashtag.name}&type=hashtags"
+                'name': f"#{name}",
+                'count': suggestion.weight,
+                'url': f"{reverse('search:results')}?q=%23{name}&type=hashtags"
             })
     
     return JsonResponse({'results': results})
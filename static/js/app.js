@@ -32,6 +32,10 @@ new Vue({
         currentUser: null,
         profileUser: null,
         posts: [],
+        // ETag لكل شكل طلب (since_id وحجم الصفحة): الصفحات المختلفة لا تتطابق
+        feedEtags: {},
+        feedPageSize: 20,
+        feedRefreshTimer: null,
         userPosts: [],
         suggestedUsers: [],
         trends: [],
@@ -79,6 +83,7 @@ new Vue({
                 await this.fetchCurrentUser();
                 await this.fetchPosts();
                 await this.fetchSuggestedUsers();
+                this.feedRefreshTimer = setInterval(() => this.refreshFeed(), 30000);
                 this.isLoading = false;
                 document.querySelector('#app').classList.add('ready');
                 document.querySelector('#loading').style.display = 'none';
@@ -108,7 +113,7 @@ new Vue({
         
         async fetchPosts() {
             try {
-                const response = await axios.get('/api/posts/');
+                const response = await axios.get('/api/feed/');
                 this.posts = response.data.results || response.data;
                 this.posts.forEach(post => {
                     post.showComments = false;
@@ -119,6 +124,50 @@ new Vue({
             }
         },
         
+        // تحديث تزايدي: جلب المنشورات الأحدث فقط، و 304 إذا لم يتغير شيء
+        async refreshFeed() {
+            if (!this.posts.length) {
+                return this.fetchPosts();
+            }
+            
+            try {
+                let sinceId = this.posts[0].id;
+                let newPosts = [];
+                
+                // الصفحات الأحدث تأتي بالترتيب من الأقدم إلى الأحدث حتى لا تبقى فجوات
+                while (true) {
+                    const key = `${sinceId}:${this.feedPageSize}`;
+                    const etag = this.feedEtags[key];
+                    const response = await axios.get('/api/feed/', {
+                        params: { since_id: sinceId, page_size: this.feedPageSize },
+                        headers: etag ? { 'If-None-Match': etag } : {},
+                        validateStatus: status => status === 200 || status === 304
+                    });
+                    
+                    if (response.status === 304) break;
+                    if (response.headers.etag) {
+                        // المحفوظ لشكل الطلب الأخير فقط: since_id القديم لن يُطلب ثانية
+                        this.feedEtags = { [key]: response.headers.etag };
+                    }
+                    
+                    const results = response.data.results || [];
+                    newPosts = results.concat(newPosts);
+                    if (results.length < this.feedPageSize) break;
+                    sinceId = results[0].id;
+                }
+                
+                const knownIds = new Set(this.posts.map(post => post.id));
+                newPosts = newPosts.filter(post => !knownIds.has(post.id));
+                newPosts.forEach(post => {
+                    post.showComments = false;
+                    Vue.set(this.newCommentContent, post.id, '');
+                });
+                this.posts = newPosts.concat(this.posts);
+            } catch (error) {
+                console.error('Error refreshing feed:', error);
+            }
+        },
+        
         async fetchSuggestedUsers() {
             try {
                 const response = await axios.get('/api/users/?limit=5');
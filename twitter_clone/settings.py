@@ -32,6 +32,7 @@ INSTALLED_APPS = [
     'posts',
     'friends',
     'notifications',
+    'search',
 ]
 
 MIDDLEWARE = [
@@ -43,6 +44,8 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'core.querybudget.QueryBudgetMiddleware',
+    'core.replica.ReplicaPinMiddleware',
 ]
 
 ROOT_URLCONF = 'twitter_clone.urls'
@@ -60,6 +63,7 @@ TEMPLATES = [
                 'django.contrib.messages.context_processors.messages',
                  'django.template.context_processors.media',   
                 'django.template.context_processors.static', 
+                'posts.context_processors.trends',
             ],
              'builtins': [
                 'django.templatetags.static',  # هذا يسمح باستخدام {% static %} بدون load
@@ -74,8 +78,20 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
-    }
+        'OPTIONS': {
+            # أخذ قفل الكتابة عند بدء المعاملة بدلاً من ترقيته وسطها (يتجنب SQLITE_BUSY الفوري)
+            'transaction_mode': 'IMMEDIATE',
+        },
+    },
+    # نسخة قراءة تحدّثها sqlite_maintenance --sync-replica (انظر core.sqlite و core.replica)
+    'replica': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.path.join(BASE_DIR, 'db.replica.sqlite3'),
+        'TEST': {'MIRROR': 'default'},
+    },
 }
+DATABASE_ROUTERS = ['core.replica.ReplicaRouter']
+REPLICA_PIN_SECONDS = 120
 
 AUTH_USER_MODEL = 'accounts.CustomUser'
 
@@ -98,6 +114,12 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+
+# الملفات المرفوعة تُخزن مرة واحدة باسم بصمة محتواها (انظر core.storage)
+STORAGES = {
+    'default': {'BACKEND': 'core.storage.ContentAddressedStorage'},
+    'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+}
  
 
 
@@ -122,6 +144,29 @@ REST_FRAMEWORK = {
     'PAGE_SIZE': 20
 }
 
+# الخط الزمني: الحسابات التي يتجاوز عدد متابعيها هذا الحد تُسحب منشوراتها عند القراءة
+TIMELINE_FANOUT_THRESHOLD = 10000
+TIMELINE_BACKFILL = 200
+
+# رفع الفيديو على أجزاء (انظر posts.uploads): الملفات الجزئية خارج MEDIA_ROOT حتى لا تُخدم
+UPLOAD_SESSION_DIR = os.path.join(BASE_DIR, 'upload_sessions')
+VIDEO_UPLOAD_MAX_SIZE = 512 * 1024 * 1024
+
+# العدّادات المؤجلة (انظر posts.counters): تُدمج في الجداول بعملية دائمة بجانب الخادم
+#   python manage.py flush_counters --interval 5
+# دون هذه العملية يتراكم جدول CounterDelta وتبطؤ قراءة العدّادات
+COUNTER_FLUSH_BATCH = 5000
+
+# خدمة الوسائط (انظر core.media): None، أو 'x-sendfile'، أو 'x-accel-redirect' خلف nginx
+MEDIA_SENDFILE = None
+MEDIA_ACCEL_PREFIX = '/protected-media/'
+
+# فهرس الاقتراح التلقائي في ذاكرة كل عملية (انظر core.autocomplete): إعادة بناء دورية في الخلفية
+AUTOCOMPLETE_REFRESH_SECONDS = 300
+
+# ميزانية الاستعلامات لكل view: warn (تسجيل تحذير) أو raise أو off
+QUERY_BUDGET_MODE = 'raise' if DEBUG else 'warn'
+
 LOGIN_URL = '/login/'
 LOGIN_REDIRECT_URL = '/'
 LOGOUT_REDIRECT_URL = '/login/'
@@ -1,10 +1,13 @@
+import re
+
 from django.contrib import admin
-from django.urls import path, include
+from django.urls import path, include, re_path
 from django.conf import settings
 from django.conf.urls.static import static
 from rest_framework.routers import DefaultRouter
 from rest_framework.authtoken.views import obtain_auth_token
 from posts.views import search_ajax
+from core.media import serve_media
 
 
 
@@ -49,7 +52,8 @@ from friends.views import toggle_follow
 from core.api_views import (
     register_api, login_api, logout_api, current_user_api,
     UserViewSet, PostViewSet, CommentViewSet,
-    FriendshipViewSet, FollowViewSet, FeedView, SearchView
+    FriendshipViewSet, FollowViewSet, FeedView, SearchView, TrendsView,
+    UploadSessionViewSet
 )
 
 # إنشاء Router للـ API
@@ -59,6 +63,7 @@ router.register(r'posts', PostViewSet, basename='post')
 router.register(r'comments', CommentViewSet, basename='comment')
 router.register(r'friendships', FriendshipViewSet, basename='friendship')
 router.register(r'follows', FollowViewSet, basename='follow')
+router.register(r'uploads', UploadSessionViewSet, basename='upload')
 
 urlpatterns = [
     path('admin/', admin.site.urls),
@@ -76,6 +81,7 @@ urlpatterns = [
     # Special API Endpoints
     path('api/feed/', FeedView.as_view(), name='api_feed'),
     path('api/search/', SearchView.as_view(), name='api_search'),
+    path('api/trends/', TrendsView.as_view(), name='api_trends'),
     
     # DRF Authentication (لـ browsable API)
     path('api-auth/', include('rest_framework.urls')),
@@ -83,6 +89,8 @@ urlpatterns = [
     # Frontend Views (الواجهة الحالية)
     path('', include('posts.urls')),
     path('accounts/', include('accounts.urls')),
+    # صفحة البحث الموسّعة (مستخدمون، منشورات، هاشتاجات) والاقتراح التلقائي
+    path('explore/', include('search.urls')),
     
     path('', home_view, name='home'),
     path('create-post/', create_post, name='create_post'),
@@ -137,6 +145,10 @@ urlpatterns = [
     path('register/', register_view, name='register'),
 ]
 
+# الوسائط تُخدم دائماً عبر core.media (Range و ETag والتخزين المؤقت)
+urlpatterns += [
+    re_path(r'^%s(?P<path>.+)$' % re.escape(settings.MEDIA_URL.lstrip('/')), serve_media, name='media'),
+]
+
 if settings.DEBUG:
-    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
     urlpatterns += static(settings.STATIC_URL, document_root=settings.STATIC_ROOT)